@@ -0,0 +1,211 @@
+# admission.py - Control de admisión para los endpoints caros (captura + Vertex AI)
+#
+# /api/test-alert no pasa por el cooldown y /analyze no tenía límite: unos
+# cuantos clics o un cliente con errores podían lanzar cualquier cantidad de
+# pipelines de captura + inferencia en paralelo, agotar los hilos del servidor
+# y sumar costo de Vertex AI. AdmissionController limita:
+#   - los pipelines en curso en toda la instancia (max_active)
+#   - los pipelines en curso o en espera de un mismo cliente (max_per_client)
+#   - la cola de espera (max_queue, con un tiempo máximo de espera)
+# Lo que no entra se rechaza al instante con Rejected (-> 429 + Retry-After).
+# El mismo controlador sirve para hilos (Flask) y para asyncio (asgi.py): los
+# turnos se entregan en orden de llegada a quien esté primero en la cola.
+# El controlador vive en la memoria del proceso: con gunicorn cada worker tiene
+# el suyo y se queda con una parte de los límites de la instancia (process_share).
+import asyncio
+import math
+import threading
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager, contextmanager
+
+
+def process_share(limit, processes):
+    """Parte de un límite de la instancia para uno de `processes` procesos (al menos 1)"""
+    return max(1, limit // max(1, processes))
+
+
+class Rejected(Exception):
+    """Pipeline no admitido: responder 429 con Retry-After"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """Turno en la cola; `grant()` se llama con el lock del controlador tomado"""
+
+    __slots__ = ('client', 'queued_at', 'event', 'future', 'loop')
+
+    def __init__(self, client, loop=None):
+        self.client = client
+        self.queued_at = time.perf_counter()
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def grant(self):
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._resolve)
+        else:
+            self.event.set()
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class AdmissionController:
+
+    def __init__(self, max_active=8, max_per_client=2, max_queue=16, queue_timeout=30, retry_after=10):
+        self.max_active = max_active
+        self.max_per_client = max_per_client
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after  # Retry-After mientras no hay tiempos medidos
+        self.active = 0
+        self.admitted = 0
+        self.completed = 0
+        self.rejected = Counter()
+        self.peak_queue = 0
+        self.waited = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.service_s_total = 0.0
+        self._clients = Counter()  # cliente -> pipelines en curso o en cola
+        self._queue = deque()
+        self._lock = threading.Lock()
+
+    # ---- estado interno ----
+
+    def _estimate_retry_after(self):
+        """Segundos hasta que probablemente haya lugar, según la duración media de los pipelines"""
+        if not self.completed:
+            return self.retry_after
+        average = self.service_s_total / self.completed
+        return max(1, math.ceil(average * (len(self._queue) + 1) / self.max_active))
+
+    def _reject(self, reason):
+        self.rejected[reason] += 1
+        return Rejected(reason, self._estimate_retry_after())
+
+    def _try_admit(self, client, loop=None):
+        """None si entra directo, un _Waiter si queda en cola; lanza Rejected si no hay lugar"""
+        with self._lock:
+            if self._clients[client] >= self.max_per_client:
+                raise self._reject("client_limit")
+            if self.active < self.max_active and not self._queue:
+                self.active += 1
+                self._clients[client] += 1
+                self.admitted += 1
+                return None
+            if len(self._queue) >= self.max_queue:
+                raise self._reject("queue_full")
+            waiter = _Waiter(client, loop)
+            self._queue.append(waiter)
+            self._clients[client] += 1
+            self.peak_queue = max(self.peak_queue, len(self._queue))
+            return waiter
+
+    def _granted(self, waiter):
+        """Registrar la espera de un turno entregado"""
+        wait_ms = (time.perf_counter() - waiter.queued_at) * 1000
+        with self._lock:
+            self.waited += 1
+            self.wait_ms_total += wait_ms
+            self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+
+    def _abandon(self, waiter, reason="queue_timeout"):
+        """
+        Sacar de la cola a quien dejó de esperar. Retorna False si el turno ya se
+        le había entregado (entonces tiene un lugar y debe usarlo o liberarlo).
+        """
+        with self._lock:
+            try:
+                self._queue.remove(waiter)
+            except ValueError:
+                return False
+            self._clients[waiter.client] -= 1
+            if not self._clients[waiter.client]:
+                del self._clients[waiter.client]
+            if reason:
+                self.rejected[reason] += 1
+            return True
+
+    def _release(self, client, started=None):
+        with self._lock:
+            if started is not None:
+                self.completed += 1
+                self.service_s_total += time.perf_counter() - started
+            self._clients[client] -= 1
+            if not self._clients[client]:
+                del self._clients[client]
+            if self._queue:
+                # El lugar pasa directo al primero de la cola (active no cambia)
+                waiter = self._queue.popleft()
+                self.admitted += 1
+                waiter.grant()
+            else:
+                self.active -= 1
+
+    # ---- API ----
+
+    @contextmanager
+    def enter(self, client):
+        """Ocupar un lugar (bloqueando el hilo en la cola si hace falta)"""
+        waiter = self._try_admit(client)
+        if waiter:
+            if not waiter.event.wait(self.queue_timeout) and self._abandon(waiter):
+                raise Rejected("queue_timeout", self._estimate_retry_after())
+            self._granted(waiter)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(client, started)
+
+    @asynccontextmanager
+    async def enter_async(self, client):
+        """Igual que enter() pero esperando en el event loop"""
+        waiter = self._try_admit(client, asyncio.get_running_loop())
+        if waiter:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if self._abandon(waiter):
+                    raise Rejected("queue_timeout", self._estimate_retry_after())
+            except asyncio.CancelledError:
+                # Cliente desconectado: si el turno ya era suyo, se libera
+                if not self._abandon(waiter, reason=None):
+                    self._release(client)
+                raise
+            self._granted(waiter)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(client, started)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self.active,
+                "queued": len(self._queue),
+                "peak_queue": self.peak_queue,
+                "limits": {
+                    "max_active": self.max_active,
+                    "max_per_client": self.max_per_client,
+                    "max_queue": self.max_queue,
+                    "queue_timeout_s": self.queue_timeout,
+                },
+                "admitted": self.admitted,
+                "completed": self.completed,
+                "rejected": dict(self.rejected),
+                "rejected_total": sum(self.rejected.values()),
+                "waited": self.waited,
+                "avg_wait_ms": round(self.wait_ms_total / self.waited, 1) if self.waited else None,
+                "max_wait_ms": round(self.wait_ms_max, 1),
+                "avg_service_ms": round(self.service_s_total / self.completed * 1000, 1) if self.completed else None,
+            }
@@ -0,0 +1,236 @@
+# analysis_records.py - Registros compactos de análisis y respuestas crudas fuera del heap
+#
+# analysis_history guardaba cada análisis como dicts anidados con la respuesta
+# completa de Vertex AI (detecciones por frame, top-k de audio, ...), y se
+# volvían a serializar en cada poll de /api/dashboard-data. Ahora cada análisis
+# es un AnalysisRecord (dataclass con __slots__) con campos fijos y un máximo de
+# MAX_DETECTIONS detecciones como tuplas; la respuesta cruda se guarda
+# comprimida en Cloud Storage o en disco y se lee solo desde /api/analysis/<id>/raw.
+import gzip
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+
+MAX_DETECTIONS = 10
+
+
+def summarize_progressive(progressive):
+    if not progressive:
+        return None
+    return {k: v for k, v in progressive.items() if k != 'timeline'}
+
+
+@dataclass(slots=True)
+class FileAnalysis:
+    """Resultado de Vertex AI para un archivo (foto o video)"""
+    fire_detected: bool = False
+    confidence: float = 0.0
+    detections_count: int = 0
+    detections: tuple = ()  # ((clase, confianza), ...)
+    error: str = None
+    progressive: dict = None  # Resumen del análisis progresivo de video (sin el timeline)
+
+    @classmethod
+    def from_result(cls, analysis):
+        """A partir del dict de process_vertex_response (sin raw_response)"""
+        if not analysis:
+            return None
+        detections = tuple(
+            # Las clases se repiten en todos los registros: una sola copia del string
+            (sys.intern(d.get('class', '')), float(d.get('confidence', 0)))
+            for d in (analysis.get('detections') or [])[:MAX_DETECTIONS]
+        )
+        return cls(
+            fire_detected=bool(analysis.get('fire_detected')),
+            confidence=float(analysis.get('confidence', 0)),
+            detections_count=int(analysis.get('detections_count', 0)),
+            detections=detections,
+            error=analysis.get('error'),
+            progressive=summarize_progressive(analysis.get('progressive')),
+        )
+
+    def to_dict(self):
+        data = {
+            "fire_detected": self.fire_detected,
+            "confidence": self.confidence,
+            "detections_count": self.detections_count,
+            "detections": [{"class": c, "confidence": conf} for c, conf in self.detections],
+        }
+        if self.error:
+            data["error"] = self.error
+        if self.progressive:
+            data["progressive"] = self.progressive
+        return data
+
+    @classmethod
+    def from_state(cls, data):
+        if not data:
+            return None
+        data = dict(data)
+        data["detections"] = tuple((sys.intern(c), conf) for c, conf in data.get("detections") or ())
+        return cls(**data)
+
+
+@dataclass(slots=True)
+class AnalysisRecord:
+    """Entrada de analysis_history"""
+    id: int
+    timestamp: str
+    files: dict
+    fire_detected: bool
+    confidence: float
+    photo: FileAnalysis = None
+    video: FileAnalysis = None
+    raw_key: str = None  # Clave en RawResponseStore (None si no hubo respuesta)
+    cameras: dict = None  # Veredicto por cámara (solo alertas con varias cámaras)
+    alert_id: int = None  # Alerta que disparó la captura (None para /analyze)
+    device: str = None    # Dispositivo Arduino de esa alerta
+
+    @classmethod
+    def from_results(cls, record_id, results, files_info, alert_id=None, device=None):
+        return cls(
+            id=record_id,
+            timestamp=results["timestamp"],
+            files=dict(files_info),
+            fire_detected=bool(results["fire_detected"]),
+            confidence=float(results["confidence"]),
+            photo=FileAnalysis.from_result(results.get("photo_analysis")),
+            video=FileAnalysis.from_result(results.get("video_analysis")),
+            cameras=results.get("cameras"),
+            alert_id=alert_id,
+            device=device,
+        )
+
+    def to_dict(self):
+        """Forma JSON de la API (la misma de antes, sin raw_response)"""
+        data = {
+            "id": self.id,
+            "timestamp": self.timestamp,
+            "files": self.files,
+            "fire_detected": self.fire_detected,
+            "confidence": self.confidence,
+            "photo_analysis": self.photo.to_dict() if self.photo else None,
+            "video_analysis": self.video.to_dict() if self.video else None,
+            "raw_url": f"/api/analysis/{self.id}/raw" if self.raw_key else None,
+            "alert_id": self.alert_id,
+            "device": self.device,
+        }
+        if self.cameras:
+            data["cameras"] = self.cameras
+        return data
+
+    # Forma completa (con raw_key) para los backends serializados de state_store.py
+
+    def to_state(self):
+        return asdict(self)
+
+    @classmethod
+    def from_state(cls, data):
+        data = dict(data)
+        data["photo"] = FileAnalysis.from_state(data.get("photo"))
+        data["video"] = FileAnalysis.from_state(data.get("video"))
+        return cls(**data)
+
+
+# ============================================
+# ALMACEN DE RESPUESTAS CRUDAS
+# ============================================
+
+class LocalBlobStore:
+    """Archivos en un directorio local (desarrollo; en App Engine /tmp ocupa RAM)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json.gz")
+
+    def write(self, key, data):
+        with open(self._path(key), 'wb') as f:
+            f.write(data)
+
+    def read(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+class GCSBlobStore:
+    """Objetos privados en Cloud Storage (no se les aplica GCS_PUBLISH_MODE)"""
+
+    def __init__(self, get_bucket, prefix='analysis/raw/'):
+        self.get_bucket = get_bucket
+        self.prefix = prefix
+
+    def write(self, key, data):
+        blob = self.get_bucket().blob(f"{self.prefix}{key}.json.gz")
+        blob.upload_from_string(data, content_type='application/gzip')
+
+    def read(self, key):
+        from google.api_core.exceptions import NotFound
+        try:
+            return self.get_bucket().blob(f"{self.prefix}{key}.json.gz").download_as_bytes()
+        except NotFound:
+            return None
+
+
+class RawResponseStore:
+    """
+    Guarda respuestas crudas comprimidas (gzip JSON) en un backend con
+    write(key, bytes) / read(key). La escritura es en segundo plano; hasta que
+    termina, la respuesta se sirve desde memoria.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.stored = 0
+        self.failed = 0
+        self.bytes_stored = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='raw-store')
+
+    def put(self, key, payload):
+        data = gzip.compress(json.dumps(payload, separators=(',', ':')).encode(), compresslevel=6)
+        with self._lock:
+            self._pending[key] = data
+        self._executor.submit(self._write, key, data)
+
+    def _write(self, key, data):
+        try:
+            self.backend.write(key, data)
+            with self._lock:
+                self.stored += 1
+                self.bytes_stored += len(data)
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            print(f"[RAW STORE ERROR] {key}: {e}")
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def get(self, key):
+        """Respuesta cruda (dict) o None si no existe"""
+        with self._lock:
+            data = self._pending.get(key)
+        if data is None:
+            data = self.backend.read(key)
+        if data is None:
+            return None
+        return json.loads(gzip.decompress(data))
+
+    def stats(self):
+        return {
+            "backend": type(self.backend).__name__,
+            "stored": self.stored,
+            "failed": self.failed,
+            "pending": len(self._pending),
+            "bytes_stored": self.bytes_stored,
+        }
@@ -0,0 +1,387 @@
+# asgi.py - Punto de entrada ASGI (modo asíncrono)
+#
+#   uvicorn asgi:application --host 0.0.0.0 --port 8080
+#
+# Las rutas que hacen I/O saliente (alertas, uploads y análisis) se atienden
+# con async_engine sobre un solo event loop. El resto (páginas, dashboard,
+# status, ...) se delega a la app Flask de server.py, que corre en un pool
+# de hilos propio (ver WSGIBridge). Con TRACE_RECORD_FILE las rutas async se
+# graban igual que en Flask (ver run_traced).
+import asyncio
+import contextvars
+import io
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.datastructures import Headers
+from werkzeug.wrappers import Request
+
+import async_engine
+import server
+from admission import Rejected
+from recorder import RECORDED_PATHS
+from server import app
+
+# Hilos para las rutas Flask: cada exportación en streaming ocupa uno mientras
+# el cliente descarga, así que no se usa el executor por defecto del loop (min(32, cpu + 4))
+WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', 32))
+
+UPLOAD_KINDS = {
+    # campo del formulario: (carpeta, extensión, content-type)
+    'photo': ('photos', 'jpg', 'image/jpeg'),
+    'video': ('videos', 'webm', 'video/webm'),
+    'audio': ('audio', 'webm', 'audio/webm'),
+}
+
+
+# ============================================
+# UTILIDADES ASGI
+# ============================================
+
+async def read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body.extend(message.get('body', b''))
+        if not message.get('more_body'):
+            return bytes(body)
+
+
+# Accept-Encoding del request en curso (lo fija application() para los handlers async)
+_accept_encoding = contextvars.ContextVar('accept_encoding', default=None)
+
+
+async def send_json(send, data, status=200, headers=()):
+    """JSON con el mismo encoder y compresión que las respuestas Flask (ver responses.py)"""
+    body, encoding = server.compressor.encode_body(server.app.json.encode(data), 'application/json',
+                                                   _accept_encoding.get())
+    headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+               (b'vary', b'Accept-Encoding'), *headers]
+    if encoding:
+        headers.append((b'content-encoding', encoding.encode()))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': headers,
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def decode_headers(scope):
+    return [(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope.get('headers', [])]
+
+
+def scope_client_id(scope):
+    """Identidad del cliente para el control de admisión (ver server.client_id)"""
+    headers = Headers(decode_headers(scope))
+    client = scope.get('client')
+    return server.client_id(headers, client[0] if client else None)
+
+
+async def send_rejected(send, rejection, **extra):
+    """429 con Retry-After para un pipeline no admitido"""
+    print(f"[ADMISSION] Rechazado ({rejection.reason}), reintentar en {rejection.retry_after}s")
+    await send_json(send, {
+        "error": "Too many requests",
+        "reason": rejection.reason,
+        "retry_after": rejection.retry_after,
+        **extra
+    }, 429, [(b'retry-after', str(rejection.retry_after).encode())])
+
+
+def parse_json(body):
+    try:
+        return json.loads(body) if body else {}
+    except ValueError:
+        return {}
+
+
+def parse_form(scope, body):
+    """Parsear multipart/form-data con werkzeug a partir del cuerpo ya leído"""
+    headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'CONTENT_TYPE': headers.get('content-type', ''),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    }
+    return Request(environ)
+
+
+def build_environ(scope, body):
+    """Environ WSGI a partir de un scope HTTP de ASGI"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'CONTENT_LENGTH': str(len(body)),
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        value = value.decode('latin1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class WSGIBridge:
+    """
+    Ejecuta la app WSGI en un hilo del executor del loop.
+    A diferencia de asgiref.WsgiToAsgi (que serializa todo en un único hilo),
+    permite peticiones Flask concurrentes y envía el cuerpo por partes a
+    medida que la app lo genera.
+    """
+
+    def __init__(self, wsgi_app, max_workers=32):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        body = await read_body(receive)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._run, scope, body, send, loop)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    def _run(self, scope, body, send, loop):
+        def emit(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response_start = {}
+
+        def start_response(status, headers, exc_info=None):
+            response_start.update({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers],
+            })
+            return lambda data: None
+
+        result = self.wsgi_app(build_environ(scope, body), start_response)
+        try:
+            started = False
+            for chunk in result:
+                if not started:
+                    emit(response_start)
+                    started = True
+                if chunk:
+                    emit({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not started:
+                emit(response_start)
+            emit({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+flask_asgi = WSGIBridge(app, WSGI_THREADS)
+
+
+# ============================================
+# HANDLERS ASINCRONOS
+# ============================================
+
+async def handle_alert(scope, body, send):
+    """Recibe alertas del Arduino"""
+    try:
+        # El estado puede ser SQLite/Redis: las llamadas bloqueantes van a un hilo
+        alerta = await asyncio.to_thread(server.register_alert, parse_json(body))
+
+        if alerta['estado'] == 'alert':
+            allowed, remaining_time = await asyncio.to_thread(server.claim_alert_slot)
+            if allowed:
+                print(f"[THROTTLE] Procesando alerta. Capturando evidencia...")
+                try:
+                    async with server.admission.enter_async(scope_client_id(scope)):
+                        await async_engine.process_alert_with_capture(alerta['id'], alerta['zona'], alerta['dispositivo'])
+                except Rejected as rejection:
+                    await asyncio.to_thread(server.release_alert_slot)
+                    return await send_rejected(send, rejection, alerta_id=alerta['id'])
+                print(f"[THROTTLE] Próxima captura permitida en {server.ALERT_COOLDOWN_SECONDS}s")
+            else:
+                print(f"[THROTTLE] Captura bloqueada. Espera {remaining_time}s más para evitar spam")
+
+        await send_json(send, {"status": "received", "alerta_id": alerta['id']})
+    except Exception as e:
+        print(f"[ERROR] {e}")
+        await send_json(send, {"error": str(e)}, 500)
+
+
+async def handle_test_alert(scope, body, send):
+    """Endpoint para probar alertas - Captura y analiza automáticamente"""
+    datos = parse_json(body)  # Opcional: {"zone": ...} o {"device": ...}
+    alerta = await asyncio.to_thread(server.register_alert, {"temp": 45.5, "light": 850, "status": "alert",
+                                                             "device": datos.get('device'), "zone": datos.get('zone')},
+                                     test=True)
+
+    print(f"[TEST ALERT] Procesando alerta de prueba...")
+    try:
+        async with server.admission.enter_async(scope_client_id(scope)):
+            results = await async_engine.process_alert_with_capture(alerta['id'], alerta['zona'], alerta['dispositivo'])
+    except Rejected as rejection:
+        return await send_rejected(send, rejection, alerta=alerta)
+
+    if results:
+        await send_json(send, {
+            "status": "success",
+            "alerta": alerta,
+            "analysis": results,
+            "message": "Alerta procesada. Multimedia capturado y analizado con IA."
+        })
+    else:
+        await send_json(send, {"status": "error", "alerta": alerta, "message": "Error al procesar alerta"}, 500)
+
+
+async def handle_analyze(scope, body, send):
+    """Analizar archivos con Vertex AI"""
+    try:
+        data = parse_json(body)
+        photo_gcs = data.get('photo_gcs_uri')
+        video_gcs = data.get('video_gcs_uri')
+
+        files_info = {}
+        if photo_gcs:
+            files_info["photo"] = data.get('photo_url', photo_gcs)
+        if video_gcs:
+            files_info["video"] = data.get('video_url', video_gcs)
+        if data.get('audio_url'):
+            files_info["audio"] = data['audio_url']
+
+        async with server.admission.enter_async(scope_client_id(scope)):
+            results = await async_engine.analyze_and_notify(photo_gcs, video_gcs, files_info, "[VERTEX AI RESULT]")
+        await send_json(send, {
+            "success": True,
+            "fire_detected": results["fire_detected"],
+            "confidence": results["confidence"],
+            "results": results
+        })
+    except Rejected as rejection:
+        await send_rejected(send, rejection, success=False)
+    except Exception as e:
+        print(f"[ANALYZE ERROR] {e}")
+        traceback.print_exc()
+        await send_json(send, {"error": str(e), "success": False}, 500)
+
+
+def make_upload_handler(kind):
+    folder, extension, content_type = UPLOAD_KINDS[kind]
+    tag = f"[UPLOAD {kind.upper()}]"
+
+    async def handle_upload(scope, body, send):
+        try:
+            files = parse_form(scope, body).files
+            if kind not in files:
+                return await send_json(send, {"error": f"No {kind} file", "success": False}, 400)
+            file = files[kind]
+            if file.filename == '':
+                return await send_json(send, {"error": "Empty filename", "success": False}, 400)
+
+            file_bytes = file.read()
+            print(f"{tag} Read {len(file_bytes)} bytes")
+            blob_name = server.content_blob_name(folder, file_bytes, extension)
+            public_url, gcs_uri = await async_engine.upload_bytes_to_cloud_storage(file_bytes, blob_name, content_type)
+            if not public_url:
+                return await send_json(send, {"error": "Upload failed", "success": False}, 500)
+
+            print(f"{tag} SUCCESS URL: {public_url}")
+            await send_json(send, {"success": True, "url": public_url, "gcs_uri": gcs_uri})
+        except Exception as e:
+            print(f"{tag} ERROR {e}")
+            traceback.print_exc()
+            await send_json(send, {"error": str(e), "success": False}, 500)
+
+    return handle_upload
+
+
+ASYNC_ROUTES = {
+    ('POST', '/alert'): handle_alert,
+    ('POST', '/api/test-alert'): handle_test_alert,
+    ('POST', '/analyze'): handle_analyze,
+    ('POST', '/upload/photo'): make_upload_handler('photo'),
+    ('POST', '/upload/video'): make_upload_handler('video'),
+    ('POST', '/upload/audio'): make_upload_handler('audio'),
+}
+
+
+# ============================================
+# GRABACION DE TRAFICO
+# ============================================
+
+async def run_traced(handler, scope, body, send):
+    """Ejecutar un handler async grabando el request en server.trace_recorder (ver recorder.py)"""
+    start = time.time()
+    status = {}
+
+    async def send_and_capture(message):
+        if message['type'] == 'http.response.start':
+            status['code'] = message['status']
+        await send(message)
+
+    try:
+        return await handler(scope, body, send_and_capture)
+    finally:
+        if scope['path'] in RECORDED_PATHS:
+            headers = Headers(decode_headers(scope))
+            content_type = headers.get('Content-Type', '')
+            client = scope.get('client')
+            server.trace_recorder.record(
+                scope['method'], scope['path'],
+                headers.get(server.trace_recorder.client_header, client[0] if client else None),
+                status.get('code', 500), start,
+                json_body=parse_json(body) if content_type.startswith('application/json') else None,
+                files=parse_form(scope, body).files if content_type.startswith('multipart/form-data') else None
+            )
+
+
+# ============================================
+# APLICACION ASGI
+# ============================================
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_engine.close_clients()
+            flask_asgi.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    if scope['type'] == 'http':
+        handler = ASYNC_ROUTES.get((scope['method'], scope['path']))
+        if handler:
+            body = await read_body(receive)
+            _accept_encoding.set(Headers(decode_headers(scope)).get('Accept-Encoding'))
+            if server.trace_recorder:
+                return await run_traced(handler, scope, body, send)
+            return await handler(scope, body, send)
+
+    await flask_asgi(scope, receive, send)
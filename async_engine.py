@@ -0,0 +1,450 @@
+# async_engine.py - Versión asyncio de captura, upload, inferencia y notificación
+#
+# Mismo flujo que server.process_alert_with_capture pero sin bloquear hilos:
+# todas las llamadas salientes usan httpx.AsyncClient con pools de conexiones
+# compartidos, de modo que un solo event loop puede mantener cientos de
+# alertas en vuelo. El estado (historial, throttling) pasa por server.state,
+# que puede ser SQLite o Redis: esas llamadas van con asyncio.to_thread.
+# Se expone vía asgi.py.
+import asyncio
+import os
+import time
+from urllib.parse import quote
+
+import httpx
+
+import server
+
+# Tamaño de los pools de conexiones (por destino)
+ASYNC_MAX_CONNECTIONS = int(os.getenv('ASYNC_MAX_CONNECTIONS', 200))
+ASYNC_MAX_KEEPALIVE = int(os.getenv('ASYNC_MAX_KEEPALIVE', 50))
+ASYNC_POOL_TIMEOUT = float(os.getenv('ASYNC_POOL_TIMEOUT', 120))
+
+STORAGE_API = server.STORAGE_EMULATOR_HOST or 'https://storage.googleapis.com'
+
+# Un cliente por destino: cada cámara (sin verificación SSL por ngrok), APIs de Google y n8n
+_clients = {}
+
+
+def _timeout(seconds):
+    """Timeout de red; la espera por una conexión libre del pool es aparte (cola bajo ráfagas)"""
+    return httpx.Timeout(seconds, pool=ASYNC_POOL_TIMEOUT)
+
+
+def get_client(name):
+    """Cliente httpx compartido (se crea al primer uso dentro del event loop)"""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        camera = name.startswith('camera')
+        limits = httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS,
+                              max_keepalive_connections=server.CAMERA_POOL_SIZE if camera else ASYNC_MAX_KEEPALIVE)
+        client = httpx.AsyncClient(limits=limits, verify=not camera, timeout=_timeout(60))
+        _clients[name] = client
+    return client
+
+
+async def close_clients():
+    """Cerrar los pools de conexiones (al apagar el servidor ASGI)"""
+    for client in list(_clients.values()):
+        await client.aclose()
+    _clients.clear()
+
+
+async def ensure_google_clients():
+    """Inicializar los clientes de Google en un hilo (default() y el primer refresh son bloqueantes)"""
+    if not server._google_init_done:
+        await asyncio.to_thread(server.ensure_google_clients)
+    return server.storage_client is not None
+
+
+async def get_auth_token():
+    """Token de Google: lectura sin bloqueo; la inicialización o un refresh en línea van a un hilo"""
+    token = server.get_auth_token(block=False)
+    if token:
+        return token
+    return await asyncio.to_thread(server.get_auth_token)
+
+
+# ============================================
+# CAPTURA DESDE IP WEBCAM
+# ============================================
+
+async def _read_stream(camera, path, duration):
+    """Leer un stream (MJPEG/WAV) de la cámara durante `duration` segundos"""
+    data = bytearray()
+    start = time.perf_counter()
+    async with get_client(camera.client_name).stream('GET', f"{camera.url}{path}", timeout=_timeout(15)) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        camera.record_success((time.perf_counter() - start) * 1000)
+        start_time = time.monotonic()
+        try:
+            async with asyncio.timeout(duration + 15):
+                async for chunk in response.aiter_bytes(8192):
+                    if chunk:
+                        data.extend(chunk)
+                    if time.monotonic() - start_time >= duration:
+                        break
+        except TimeoutError:
+            pass  # Se usa lo capturado hasta el timeout
+    return bytes(data)
+
+
+async def capture_photo_from_phone(camera=None):
+    """Captura foto desde IP Webcam"""
+    camera = camera or server.cameras.primary()
+    try:
+        print(f"   [PHOTO] Capturando desde {camera.name}...")
+        start = time.perf_counter()
+        response = await get_client(camera.client_name).get(f"{camera.url}/photo.jpg", timeout=_timeout(10))
+        if response.status_code == 200:
+            camera.record_success((time.perf_counter() - start) * 1000)
+            blob_name = server.content_blob_name('photos', response.content, 'jpg')
+            public_url, gcs_uri = await upload_bytes_to_cloud_storage(response.content, blob_name, 'image/jpeg')
+            print(f"   [PHOTO] ✓ Capturada y subida: {public_url}")
+            return public_url, gcs_uri
+        camera.record_failure(f"photo: HTTP {response.status_code}")
+        print(f"   [PHOTO] ✗ Error {response.status_code}")
+        return None, None
+    except Exception as e:
+        camera.record_failure(f"photo: {e}")
+        print(f"   [PHOTO ERROR] {camera.name}: {e}")
+        return None, None
+
+
+async def capture_video_from_phone(duration=5, camera=None):
+    """Captura video desde IP Webcam (MJPEG stream); retorna también los bytes del clip"""
+    camera = camera or server.cameras.primary()
+    try:
+        print(f"   [VIDEO] Capturando {duration}s desde {camera.name}...")
+        video_data = await _read_stream(camera, '/video', duration)
+        if video_data:
+            blob_name = server.content_blob_name('videos', video_data, 'mjpeg')
+            public_url, gcs_uri = await upload_bytes_to_cloud_storage(video_data, blob_name, 'video/x-motion-jpeg')
+            print(f"   [VIDEO] ✓ Capturado y subido: {public_url}")
+            return public_url, gcs_uri, video_data
+        print("   [VIDEO] ✗ No se capturó data")
+        return None, None, None
+    except Exception as e:
+        camera.record_failure(f"video: {e}")
+        print(f"   [VIDEO ERROR] {camera.name}: {e}")
+        return None, None, None
+
+
+async def capture_audio_from_phone(duration=5, camera=None):
+    """Captura audio desde IP Webcam"""
+    camera = camera or server.cameras.primary()
+    try:
+        print(f"   [AUDIO] Capturando {duration}s desde {camera.name}...")
+        audio_data = await _read_stream(camera, '/audio.wav', duration)
+        if audio_data:
+            blob_name = server.content_blob_name('audio', audio_data, 'wav')
+            public_url, gcs_uri = await upload_bytes_to_cloud_storage(audio_data, blob_name, 'audio/wav')
+            print(f"   [AUDIO] ✓ Capturado y subido: {public_url}")
+            return public_url, gcs_uri
+        print("   [AUDIO] ✗ No se capturó data")
+        return None, None
+    except Exception as e:
+        camera.record_failure(f"audio: {e}")
+        print(f"   [AUDIO ERROR] {camera.name}: {e}")
+        return None, None
+
+
+_CAPTURES = {
+    "photo": capture_photo_from_phone,
+    "video": capture_video_from_phone,
+    "audio": capture_audio_from_phone,
+}
+
+
+async def capture_from_cameras(camera_list):
+    """Capturar de todas las cámaras en paralelo con plazo total (ver server.capture_from_cameras)"""
+    tasks = {
+        asyncio.create_task(_CAPTURES[kind](*args)): (camera, kind)
+        for camera, kind, _, args in server.capture_jobs(camera_list)
+    }
+    done, pending = await asyncio.wait(tasks, timeout=server.CAPTURE_DEADLINE_SECONDS)
+
+    captures = {camera.name: {} for camera in camera_list}
+    for task in done:
+        camera, kind = tasks[task]
+        captures[camera.name][kind] = task.result()
+    for task in pending:
+        task.cancel()
+        server.capture_timed_out(*tasks[task])
+    return server.split_clips(captures)
+
+
+# ============================================
+# CLOUD STORAGE (API JSON)
+# ============================================
+
+def segment_params(blob_name):
+    # Segmentos privados: sin predefinedAcl aunque GCS_PUBLISH_MODE sea acl
+    return {"uploadType": "media", "name": blob_name, "ifGenerationMatch": "0"}
+
+
+def upload_params(destination_blob_name):
+    # ifGenerationMatch=0: solo crear, nunca sobrescribir (412 = ya existe)
+    params = segment_params(destination_blob_name)
+    if server.GCS_PUBLISH_MODE == 'acl':
+        params["predefinedAcl"] = "publicRead"
+    return params
+
+
+async def upload_bytes_to_cloud_storage(file_bytes, destination_blob_name, content_type, make_previews=True):
+    """Sube bytes a Cloud Storage en una sola llamada, salvo que el objeto ya exista (ver server.upload_bytes_to_cloud_storage)"""
+    try:
+        auth_token = await get_auth_token()
+        if not auth_token or not await ensure_google_clients():
+            print("[CLOUD ERROR] Sin token de autenticación")
+            return None, None
+
+        gcs_uri = f"gs://{server.BUCKET_NAME}/{destination_blob_name}"
+        public_url = server.public_url_for(server.get_bucket().blob(destination_blob_name))
+        size = len(file_bytes)
+
+        if server.media_index.contains(destination_blob_name):
+            server.media_index.record_hit(destination_blob_name, size, content_type)
+            print(f"[CLOUD] Ya existe, sin upload: {gcs_uri}")
+            return public_url, gcs_uri
+
+        response = await get_client('google').post(
+            f"{STORAGE_API}/upload/storage/v1/b/{server.BUCKET_NAME}/o",
+            params=upload_params(destination_blob_name),
+            headers={"Authorization": f"Bearer {auth_token}", "Content-Type": content_type},
+            content=file_bytes,
+            timeout=_timeout(120)
+        )
+        if response.status_code == 412:
+            server.media_index.record_hit(destination_blob_name, size, content_type)
+            print(f"[CLOUD] Ya existe (412), sin sobrescribir: {gcs_uri}")
+            return public_url, gcs_uri
+        if response.status_code != 200:
+            print(f"[CLOUD ERROR] {response.status_code}: {response.text[:200]}")
+            return None, None
+
+        server.media_index.record_upload(destination_blob_name, size, content_type)
+        print(f"[CLOUD] Subido: {gcs_uri}")
+        if make_previews:
+            server.schedule_previews(file_bytes, destination_blob_name, content_type, public_url, gcs_uri)
+        return public_url, gcs_uri
+
+    except Exception as e:
+        print(f"[CLOUD ERROR] {e}")
+        return None, None
+
+
+# ============================================
+# VERTEX AI
+# ============================================
+
+async def _predict(payload, timeout):
+    try:
+        auth_token = await get_auth_token()
+        if not auth_token:
+            return {"error": "No auth token", "fire_detected": False, "confidence": 0}
+
+        response = await get_client('google').post(
+            server.VERTEX_AI_ENDPOINT,
+            headers={"Authorization": f"Bearer {auth_token}", "Content-Type": "application/json"},
+            json=payload,
+            timeout=timeout
+        )
+        print(f"[VERTEX AI] Response status: {response.status_code}")
+
+        if response.status_code == 200:
+            return server.process_vertex_response(response.json())
+        print(f"[VERTEX AI ERROR] {response.status_code}: {response.text[:500]}")
+        return {"error": f"API Error: {response.status_code}", "fire_detected": False, "confidence": 0}
+
+    except Exception as e:
+        print(f"[VERTEX AI ERROR] {e}")
+        return {"error": str(e), "fire_detected": False, "confidence": 0}
+
+
+async def predict_image_from_gcs(image_gcs_uri):
+    """Analizar imagen desde Google Cloud Storage"""
+    analysis, _ = await predict_images_from_gcs([image_gcs_uri])
+    return analysis
+
+
+async def predict_images_from_gcs(image_gcs_uris):
+    """Varias imágenes en una sola llamada: (análisis combinado, [análisis de cada imagen])"""
+    print(f"[VERTEX AI] Analizando imagen: {', '.join(image_gcs_uris)}")
+    analysis = await _predict({"instances": [{"image_url": uri} for uri in image_gcs_uris]}, timeout=_timeout(60))
+    return analysis, server.split_batch_analysis(analysis, len(image_gcs_uris))
+
+
+async def predict_video_from_gcs(video_gcs_uri, frame_interval=15, max_detections=10, analyze_audio=True, timeout=300):
+    """Analizar video desde Google Cloud Storage"""
+    print(f"[VERTEX AI] Analizando video: {video_gcs_uri}")
+    return await _predict({
+        "instances": [{"video_url": video_gcs_uri}],
+        "parameters": {
+            "frame_interval": frame_interval,
+            "max_detections": max_detections,
+            "analyze_audio": analyze_audio,
+            "audio_top_k": 5
+        }
+    }, timeout=_timeout(timeout))
+
+
+async def download_object(name):
+    auth_token = await get_auth_token()
+    response = await get_client('google').get(
+        f"{STORAGE_API}/storage/v1/b/{server.BUCKET_NAME}/o/{quote(name, safe='')}",
+        params={"alt": "media"},
+        headers={"Authorization": f"Bearer {auth_token}"},
+        timeout=_timeout(60)
+    )
+    response.raise_for_status()
+    return response.content
+
+
+async def upload_segment(data, blob_name):
+    """Subir un segmento privado y sin contabilizar en media_index (ver server.upload_segment)"""
+    try:
+        auth_token = await get_auth_token()
+        if not auth_token:
+            return None
+        response = await get_client('google').post(
+            f"{STORAGE_API}/upload/storage/v1/b/{server.BUCKET_NAME}/o",
+            params=segment_params(blob_name),
+            headers={"Authorization": f"Bearer {auth_token}", "Content-Type": 'video/x-motion-jpeg'},
+            content=data,
+            timeout=_timeout(60)
+        )
+        if response.status_code != 200:
+            print(f"[CLOUD ERROR] Segmento {blob_name}: {response.status_code}")
+            return None
+        return f"gs://{server.BUCKET_NAME}/{blob_name}"
+    except Exception as e:
+        print(f"[CLOUD ERROR] Segmento {blob_name}: {e}")
+        return None
+
+
+async def delete_segment(blob_name):
+    try:
+        auth_token = await get_auth_token()
+        await get_client('google').delete(
+            f"{STORAGE_API}/storage/v1/b/{server.BUCKET_NAME}/o/{quote(blob_name, safe='')}",
+            headers={"Authorization": f"Bearer {auth_token}"},
+            timeout=_timeout(10)
+        )
+    except Exception as e:
+        print(f"[CLOUD] Segmento sin borrar {blob_name}: {e}")
+
+
+async def predict_video(video_gcs_uri, video_bytes=None):
+    """Analizar un video según server.VIDEO_ANALYSIS_MODE (ver server.predict_video)"""
+    name = server.gcs_object_name(video_gcs_uri)
+    if server.VIDEO_ANALYSIS_MODE == 'progressive' and name and name.endswith('.mjpeg'):
+        try:
+            plan = server.progressive_plan_for(video_bytes or await download_object(name))
+            if plan:
+                return await predict_video_progressive(plan, video_gcs_uri)
+        except Exception as e:
+            print(f"[VERTEX AI] Análisis progresivo no disponible ({e}); se analiza el clip completo")
+    return await predict_video_from_gcs(video_gcs_uri)
+
+
+async def predict_video_progressive(plan, video_gcs_uri):
+    """Analizar los segmentos del plan en orden hasta confirmar fuego o agotar el clip"""
+    print(f"[VERTEX AI] Análisis progresivo: {video_gcs_uri} ({plan.frames_total} frames)")
+    while True:
+        segment = plan.next_segment()
+        if segment is None:
+            break
+        blob_name = server.segment_blob_name(segment.data)
+        segment_gcs = await upload_segment(segment.data, blob_name)
+        if segment_gcs:
+            analysis = await predict_video_from_gcs(segment_gcs, frame_interval=1, max_detections=len(segment.frames),
+                                                    analyze_audio=False, timeout=60)
+            await delete_segment(blob_name)
+        else:
+            analysis = {"error": "Segment upload failed", "fire_detected": False, "confidence": 0}
+        plan.add_result(segment, analysis)
+        await asyncio.to_thread(server.log_segment, segment, analysis, video_gcs_uri, plan)
+    return await asyncio.to_thread(server.finish_progressive, plan, video_gcs_uri)
+
+
+# ============================================
+# N8N
+# ============================================
+
+async def send_n8n_result(result_data):
+    """Enviar RESULTADO de verificación a n8n webhook"""
+    try:
+        response = await get_client('n8n').post(server.N8N_WEBHOOK_RESULT, json=result_data, timeout=_timeout(10))
+        if response.status_code == 200:
+            print(f"[N8N RESULT] ✓ Email de resultado enviado")
+            return True
+        print(f"[N8N RESULT] ✗ Error {response.status_code}: {response.text[:200]}")
+        return False
+    except Exception as e:
+        print(f"[N8N RESULT ERROR] {e}")
+        return False
+
+
+# ============================================
+# FLUJOS COMPLETOS
+# ============================================
+
+async def analyze_and_notify(photo_gcs, video_gcs, files_info, log_tag):
+    """Analizar foto y video en paralelo, guardar en historial y notificar"""
+    results = server.new_analysis_results()
+
+    photo_task = predict_image_from_gcs(photo_gcs) if photo_gcs else None
+    video_task = predict_video(video_gcs) if video_gcs else None
+    analyses = await asyncio.gather(*(t for t in (photo_task, video_task) if t))
+
+    analyses = iter(analyses)
+    if photo_task:
+        server.merge_analysis(results, "photo_analysis", next(analyses))
+    if video_task:
+        server.merge_analysis(results, "video_analysis", next(analyses))
+
+    await asyncio.to_thread(server.save_analysis_record, results, files_info)
+    await send_n8n_result(server.build_result_data(results, files_info, log_tag))
+    return results
+
+
+async def _no_photos():
+    return None, []
+
+
+async def analyze_captures(captures, clips=None):
+    """Fotos de todas las cámaras en una llamada batch y videos en paralelo (ver server.analyze_captures)"""
+    clips = clips or {}
+    photos = server.gcs_uris_of(captures, "photo")
+    videos = server.gcs_uris_of(captures, "video")
+
+    (photo_batch, per_image), *video_analyses = await asyncio.gather(
+        predict_images_from_gcs(list(photos.values())) if photos else _no_photos(),
+        *(predict_video(uri, clips.get(uri)) for uri in videos.values())
+    )
+    return server.build_camera_results(captures, photo_batch, dict(zip(photos, per_image)),
+                                       dict(zip(videos, video_analyses)))
+
+
+async def process_alert_with_capture(alert_id=None, zone=None, device=None):
+    """Captura de todas las cámaras de la zona en paralelo, analiza con Vertex AI y envía el resultado"""
+    try:
+        camera_list = server.cameras.for_zone(zone)
+        print(f"\nPROCESANDO ALERTA - CAPTURA AUTOMÁTICA (async, {len(camera_list)} cámara(s), zona: {zone or 'todas'})")
+
+        captures, clips = await capture_from_cameras(camera_list)
+        results, files_info = await analyze_captures(captures, clips)
+        await asyncio.to_thread(server.link_alert_media, alert_id, captures)
+
+        await asyncio.to_thread(server.save_analysis_record, results, files_info, alert_id, device)
+        await send_n8n_result(server.build_result_data(results, files_info, "[RESULTADO]"))
+        print("="*60 + "\n")
+        return results
+
+    except Exception as e:
+        print(f"\n[PROCESS ERROR] {e}")
+        import traceback
+        traceback.print_exc()
+        return None
@@ -0,0 +1 @@
+# bench - Herramientas de benchmark y carga con servicios locales falsos
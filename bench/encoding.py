@@ -0,0 +1,202 @@
+# bench/encoding.py - Tiempo de codificación JSON y tamaño en la red de las respuestas
+#
+# Uso:
+#   python -m bench.encoding
+#   python -m bench.encoding --alerts 20 --analyses 20 --frames 75 --repeat 200
+#
+# Arma payloads con la forma real de /api/dashboard-data (alertas + análisis
+# con previews) y de /analyze (con la respuesta cruda de Vertex AI por frame y
+# el top-k de audio, generada por FakeVertex) y compara:
+#   - encoders: el de Flask por defecto (sort_keys, ensure_ascii), json de la
+#     stdlib compacto y orjson (si está instalado)
+#   - compresión: sin comprimir, gzip 1/6/9 y brotli 4/5/11 (si está instalado)
+# No levanta el servidor: mide solo la serialización y la compresión.
+import argparse
+import gzip
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from flask.json.provider import DefaultJSONProvider
+
+from analysis_records import AnalysisRecord
+from bench.fakes import FakeVertex
+from responses import load_json_backend
+
+BUCKET_URL = 'https://storage.googleapis.com/bench-bucket'
+
+
+# ============================================
+# PAYLOADS
+# ============================================
+
+def fake_alert(i, when):
+    return {
+        "id": i,
+        "timestamp": when.strftime('%Y-%m-%d %H:%M:%S'),
+        "temperatura": round(random.uniform(20, 70), 1),
+        "luz": random.randint(100, 1023),
+        "estado": random.choice(['normal', 'alert']),
+        "dispositivo": f"arduino-{random.randint(1, 4)}",
+        "zona": random.choice(['planta-1', 'planta-2']),
+    }
+
+
+def fake_analysis(vertex, frames, with_raw=False):
+    """Resultado de analyze_and_report para una foto y un video (raw_response opcional)"""
+    parameters = {'frame_interval': 1, 'max_detections': frames, 'analyze_audio': True, 'audio_top_k': 5}
+    photo_raw = {"predictions": [vertex.predict({'image_url': 'gs://b/p.jpg'}, {})]}
+    video_raw = {"predictions": [vertex.predict({'video_url': 'gs://b/v.mjpeg'}, parameters)]}
+    results = {}
+    for key, raw in (('photo_analysis', photo_raw), ('video_analysis', video_raw)):
+        detections = [d for p in raw['predictions'] for d in p['detections'] if 'class' in d]
+        results[key] = {
+            'fire_detected': any(d['class'] != 'other' for d in detections),
+            'confidence': max((d['confidence'] for d in detections), default=0.0),
+            'detections_count': len(detections),
+            'detections': [{'class': d['class'], 'confidence': d['confidence']} for d in detections][:10],
+        }
+        if with_raw:
+            results[key]['raw_response'] = raw
+    return results
+
+
+def fake_files(i):
+    digest = f"{random.getrandbits(128):032x}"
+    return {
+        "photo": f"{BUCKET_URL}/media/{digest}.jpg",
+        "video": f"{BUCKET_URL}/media/{digest}.mjpeg",
+        "audio": f"{BUCKET_URL}/media/{digest}.wav",
+    }
+
+
+def dashboard_payload(alerts, analyses, frames):
+    vertex = FakeVertex()
+    start = datetime(2026, 1, 1, 12, 0, 0)
+    alertas = [fake_alert(i, start + timedelta(seconds=30 * i)) for i in range(1, alerts + 1)]
+    history = []
+    for i in range(1, analyses + 1):
+        results = fake_analysis(vertex, frames)
+        results["timestamp"] = (start + timedelta(minutes=i)).isoformat()
+        results["fire_detected"] = results["photo_analysis"]["fire_detected"] or results["video_analysis"]["fire_detected"]
+        results["confidence"] = max(results["photo_analysis"]["confidence"], results["video_analysis"]["confidence"])
+        files = fake_files(i)
+        record = AnalysisRecord.from_results(i, results, files, alert_id=i, device="arduino-1").to_dict()
+        record["raw_url"] = f"/api/analysis/{i}/raw"
+        record["previews"] = {kind: url.rsplit('.', 1)[0] + '.thumb.jpg' for kind, url in files.items() if kind != 'audio'}
+        history.append(record)
+    return {
+        "alertas": alertas,
+        "analysis_history": history,
+        "total_alertas": alerts,
+        "total_analysis": analyses,
+        "fires_detected": sum(1 for a in history if a["fire_detected"]),
+        "pending_alerts": sum(1 for a in alertas[-10:] if a["estado"] == 'alert'),
+    }
+
+
+def analyze_payload(frames):
+    """Respuesta de /analyze: incluye la respuesta cruda de Vertex AI"""
+    results = fake_analysis(FakeVertex(), frames, with_raw=True)
+    results.update({
+        "success": True,
+        "timestamp": datetime(2026, 1, 1, 12, 0, 0).isoformat(),
+        "fire_detected": results["video_analysis"]["fire_detected"],
+        "confidence": results["video_analysis"]["confidence"],
+        "files": fake_files(0),
+    })
+    return results
+
+
+# ============================================
+# MEDICION
+# ============================================
+
+def encoders():
+    flask_default = DefaultJSONProvider.default
+    found = {
+        # Lo que hacía jsonify antes: claves ordenadas y escapes \uXXXX
+        'flask-default': lambda obj: json.dumps(obj, default=flask_default, sort_keys=True).encode(),
+        'stdlib-compact': load_json_backend('stdlib', flask_default)[1],
+    }
+    name, encode = load_json_backend('orjson', flask_default)
+    if name == 'orjson':
+        found['orjson'] = encode
+    return found
+
+
+def compressors():
+    found = {'identity': lambda body: body}
+    for level in (1, 6, 9):
+        found[f'gzip-{level}'] = lambda body, level=level: gzip.compress(body, compresslevel=level, mtime=0)
+    try:
+        import brotli
+    except ImportError:
+        print("[BENCH] brotli no instalado; solo gzip")
+    else:
+        for quality in (4, 5, 11):
+            found[f'br-{quality}'] = lambda body, quality=quality: brotli.compress(body, quality=quality)
+    return found
+
+
+def timed_us(fn, arg, repeat):
+    """Mediana en microsegundos de `repeat` llamadas"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        times.append((time.perf_counter() - start) * 1e6)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def run(payloads, repeat):
+    report = {}
+    available_encoders, available_compressors = encoders(), compressors()
+    for payload_name, payload in payloads.items():
+        rows = []
+        for encoder_name, encode in available_encoders.items():
+            body = encode(payload)
+            rows.append({"payload": payload_name, "step": f"encode:{encoder_name}",
+                         "us": timed_us(encode, payload, repeat), "bytes": len(body)})
+        body = available_encoders['stdlib-compact'](payload)
+        for compressor_name, compress in available_compressors.items():
+            rows.append({"payload": payload_name, "step": f"compress:{compressor_name}",
+                         "us": timed_us(compress, body, repeat), "bytes": len(compress(body))})
+        report[payload_name] = rows
+    return report
+
+
+def print_report(report):
+    print(f"{'payload':<12} {'paso':<24} {'mediana':>10} {'bytes':>10}")
+    for rows in report.values():
+        for row in rows:
+            print(f"{row['payload']:<12} {row['step']:<24} {row['us']:>8.0f}us {row['bytes']:>10}")
+        print()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiempo de codificación y tamaño de las respuestas JSON")
+    parser.add_argument('--alerts', type=int, default=20, help="Alertas en dashboard-data (la API manda las últimas 20)")
+    parser.add_argument('--analyses', type=int, default=20, help="Análisis en dashboard-data")
+    parser.add_argument('--frames', type=int, default=75, help="Frames con detecciones en la respuesta cruda del video")
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json-out', help="Guardar el reporte en JSON")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    payloads = {
+        'dashboard': dashboard_payload(args.alerts, args.analyses, args.frames),
+        'analyze': analyze_payload(args.frames),
+    }
+    report = run(payloads, args.repeat)
+    print_report(report)
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
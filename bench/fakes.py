@@ -0,0 +1,603 @@
+# bench/fakes.py - Servicios locales que reemplazan a IP Webcam, Cloud Storage, Vertex AI y n8n
+#
+# Cada servicio es un ThreadingHTTPServer que corre en un hilo propio. El
+# servidor IoT se apunta a ellos con variables de entorno (ver FakeEnvironment.env()),
+# de modo que todo el flujo de captura -> upload -> inferencia -> notificación
+# se ejecuta sin salir de la máquina.
+import base64
+import json
+import random
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+# JPEG mínimo válido (64x48). Se le agrega un segmento COM variable para que
+# cada frame tenga bytes distintos y el tamaño deseado.
+_BASE_JPEG = base64.b64decode(
+    '/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAA0JCgsKCA0LCgsODg0PEyAVExISEyccHhcgLikxMC4pLSwzOko+MzZGNywt'
+    'QFdBRkxOUlNSMj5aYVpQYEpRUk//2wBDAQ4ODhMREyYVFSZPNS01T09PT09PT09PT09PT09PT09PT09PT09PT09PT09P'
+    'T09PT09PT09PT09PT09PT09PT0//wAARCAAwAEADASIAAhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcI'
+    'CQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRol'
+    'JicoKSo0NTY3ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ip'
+    'qrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAA'
+    'AAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAECAxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLR'
+    'ChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6goOEhYaHiImKkpOUlZaX'
+    'mJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEA'
+    'PwDiaKKKACiitSw0Se7iEsjiGNhlcjJPvj0qKlSNNXk7FwpyqO0UZdFbF34fnhiLwSibAyV24P4dc1j0qdWFRXg7jqUp'
+    '03aSsFFFFaGYUUUUAaOh2i3V9mVd0cY3EEZBPYH+f4V1tc94XdRJcRk/MwVgPYZz/MV0NeJjpN1bPoezgopUrrqFc14j'
+    'tFinS4jXAlyHwON3r+P9K6WsbxM6izijJ+ZpNwHsAc/zFRg5NVlbqVi4p0nc5qiiivePECiiigCxY3b2V0s6DOOCucbh'
+    '6V2FrcxXcCzQtlT1HcH0NcPT4pZYW3QyPGxGMqxBxXJicKq2q0Z1YfEulo9UdxNLHBE0srBUUZJNchql+1/c7wCsajCK'
+    'T29T71Xlnmmx50skmOm9icVHSw2EVF8zd2PEYp1VyrRBRRRXYch//9k='
+)
+
+_frame_counter = 0
+_frame_lock = threading.Lock()
+
+
+def make_jpeg(size=50_000):
+    """Genera un JPEG válido de aproximadamente `size` bytes, distinto en cada llamada"""
+    global _frame_counter
+    with _frame_lock:
+        _frame_counter += 1
+        n = _frame_counter
+    tag = f'frame-{n}-{time.time_ns()}'.encode()
+    padding = max(0, size - len(_BASE_JPEG) - len(tag))
+    chunks = []
+    # Un segmento COM admite como máximo 65533 bytes de contenido
+    payload = tag + b'\x00' * padding
+    for i in range(0, len(payload), 65533):
+        part = payload[i:i + 65533]
+        chunks.append(b'\xff\xfe' + struct.pack('>H', len(part) + 2) + part)
+    return _BASE_JPEG[:2] + b''.join(chunks) + _BASE_JPEG[2:]
+
+
+def wav_header(sample_rate=16000, channels=1, bits=16):
+    """Cabecera WAV para un stream de longitud indefinida (como IP Webcam)"""
+    byte_rate = sample_rate * channels * bits // 8
+    return (b'RIFF' + struct.pack('<I', 0xFFFFFFFF) + b'WAVE'
+            + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, sample_rate,
+                                    byte_rate, channels * bits // 8, bits)
+            + b'data' + struct.pack('<I', 0xFFFFFFFF))
+
+
+# ============================================
+# INFRAESTRUCTURA COMUN
+# ============================================
+
+class _FakeHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 256
+
+
+class _BaseHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def send_bytes(self, status, body, content_type='application/octet-stream', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def send_json(self, status, data, headers=None):
+        self.send_bytes(status, json.dumps(data).encode(), 'application/json', headers)
+
+    def start_stream(self, content_type):
+        """Respuesta sin Content-Length: se cierra la conexión al terminar"""
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+
+class FakeService:
+    """Servidor HTTP falso corriendo en un hilo daemon"""
+
+    handler_class = _BaseHandler
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.httpd = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.httpd.server_address[1]}"
+
+    def start(self):
+        self.httpd = _FakeHTTPServer((self.host, self.port), self.handler_class)
+        self.httpd.service = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+
+    def count(self):
+        with self.lock:
+            self.requests += 1
+
+    def stats(self):
+        return {"requests": self.requests}
+
+
+# ============================================
+# IP WEBCAM
+# ============================================
+
+class _CameraHandler(_BaseHandler):
+
+    def do_GET(self):
+        cam = self.service
+        cam.count()
+        # Cualquier prefijo sirve (/cam2/photo.jpg): varias cámaras "distintas" en un solo servidor
+        path = '/' + urlsplit(self.path).path.rsplit('/', 1)[-1]
+        if path == '/photo.jpg':
+            with cam.lock:
+                cam.photos += 1
+            time.sleep(cam.photo_latency)
+            self.send_bytes(200, make_jpeg(cam.photo_size), 'image/jpeg')
+        elif path == '/video':
+            self._stream_mjpeg()
+        elif path == '/audio.wav':
+            self._stream_wav()
+        else:
+            self.send_bytes(404, b'not found', 'text/plain')
+
+    def _stream_mjpeg(self):
+        cam = self.service
+        boundary = 'ipwebcam'
+        self.start_stream(f'multipart/x-mixed-replace; boundary={boundary}')
+        deadline = time.time() + cam.max_stream_seconds
+        try:
+            while time.time() < deadline:
+                frame = make_jpeg(cam.frame_size)
+                self.wfile.write(
+                    f'--{boundary}\r\nContent-Type: image/jpeg\r\n'
+                    f'Content-Length: {len(frame)}\r\n\r\n'.encode() + frame + b'\r\n'
+                )
+                time.sleep(1.0 / cam.fps)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _stream_wav(self):
+        cam = self.service
+        self.start_stream('audio/wav')
+        chunk = b'\x00' * (cam.sample_rate * 2 // 10)  # 100 ms de silencio PCM16 mono
+        deadline = time.time() + cam.max_stream_seconds
+        try:
+            self.wfile.write(wav_header(cam.sample_rate))
+            while time.time() < deadline:
+                self.wfile.write(chunk)
+                time.sleep(0.1)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class FakeCamera(FakeService):
+    """IP Webcam falsa: /photo.jpg, /video (MJPEG) y /audio.wav"""
+
+    handler_class = _CameraHandler
+
+    def __init__(self, photo_size=150_000, frame_size=40_000, fps=10,
+                 sample_rate=16000, photo_latency=0.05, max_stream_seconds=60, **kwargs):
+        super().__init__(**kwargs)
+        self.photo_size = photo_size
+        self.frame_size = frame_size
+        self.fps = fps
+        self.sample_rate = sample_rate
+        self.photo_latency = photo_latency
+        self.max_stream_seconds = max_stream_seconds
+        self.photos = 0
+
+    def stats(self):
+        return {"requests": self.requests, "photos": self.photos}
+
+
+# ============================================
+# CLOUD STORAGE (API JSON)
+# ============================================
+
+def _parse_multipart_related(body, content_type):
+    """Separa metadata JSON y contenido de un upload multipart/related"""
+    boundary = content_type.split('boundary=')[1].strip('"').encode()
+    parts = [p for p in body.split(b'--' + boundary) if p.strip() not in (b'', b'--')]
+    metadata, media, media_type = {}, b'', None
+    for i, part in enumerate(parts):
+        headers, _, content = part.partition(b'\r\n\r\n')
+        if content.endswith(b'\r\n'):
+            content = content[:-2]
+        if i == 0:
+            metadata = json.loads(content or b'{}')
+        else:
+            media = content
+            for line in headers.decode('latin-1').split('\r\n'):
+                if line.lower().startswith('content-type:'):
+                    media_type = line.split(':', 1)[1].strip()
+    # google-cloud-storage manda el content-type en la parte del contenido, no en la metadata
+    if media_type and 'contentType' not in metadata:
+        metadata['contentType'] = media_type
+    return metadata, media
+
+
+class _GCSHandler(_BaseHandler):
+
+    def _route(self):
+        parts = urlsplit(self.path)
+        return parts.path, {k: v[0] for k, v in parse_qs(parts.query).items()}
+
+    def do_POST(self):
+        gcs = self.service
+        gcs.count()
+        path, query = self._route()
+        body = self.read_body()
+        time.sleep(gcs.latency)
+        if not path.startswith('/upload/storage/v1/b/'):
+            return self.send_json(404, {"error": {"code": 404, "message": "Not Found"}})
+        bucket = path.split('/')[5]
+        upload_type = query.get('uploadType', 'media')
+
+        if upload_type == 'multipart':
+            metadata, media = _parse_multipart_related(body, self.headers['Content-Type'])
+            name = metadata.get('name') or query.get('name')
+        elif upload_type == 'resumable':
+            metadata = json.loads(body or b'{}')
+            name = metadata.get('name') or query.get('name')
+            upload_id = uuid.uuid4().hex
+            with gcs.lock:
+                gcs.sessions[upload_id] = (bucket, name, metadata, bytearray(), query)
+            location = f"{gcs.url}{path}?uploadType=resumable&upload_id={upload_id}"
+            return self.send_bytes(200, b'', 'text/plain', {'Location': location})
+        else:
+            metadata, media = {}, body
+            name = query.get('name')
+            metadata['contentType'] = self.headers.get('Content-Type')
+
+        self._store(bucket, name, metadata, media, query)
+
+    def do_PUT(self):
+        gcs = self.service
+        gcs.count()
+        path, query = self._route()
+        body = self.read_body()
+        with gcs.lock:
+            session = gcs.sessions.get(query.get('upload_id'))
+        if not session:
+            return self.send_json(404, {"error": {"code": 404, "message": "No upload session"}})
+        bucket, name, metadata, data, original_query = session
+        data.extend(body)
+        content_range = self.headers.get('Content-Range', '')
+        total = content_range.rsplit('/', 1)[-1]
+        if total not in ('*', '') and len(data) < int(total):
+            return self.send_bytes(308, b'', 'text/plain', {'Range': f'bytes=0-{len(data) - 1}'})
+        with gcs.lock:
+            gcs.sessions.pop(query.get('upload_id'), None)
+        self._store(bucket, name, metadata, bytes(data), original_query)
+
+    def _store(self, bucket, name, metadata, media, query):
+        gcs = self.service
+        with gcs.lock:
+            existing = gcs.objects.get((bucket, name))
+            precondition = query.get('ifGenerationMatch')
+            if precondition is not None:
+                current = existing['generation'] if existing else 0
+                if int(precondition) != current:
+                    return self.send_json(412, {"error": {"code": 412, "message": "Precondition Failed"}})
+            gcs.generation += 1
+            obj = {
+                "data": bytes(media),
+                "contentType": metadata.get('contentType', 'application/octet-stream'),
+                "cacheControl": metadata.get('cacheControl'),
+                "metadata": metadata.get('metadata'),
+                "generation": gcs.generation,
+                "acl": [{"entity": "allUsers", "role": "READER"}] if query.get('predefinedAcl') == 'publicRead' else [],
+            }
+            gcs.objects[(bucket, name)] = obj
+            gcs.bytes_received += len(media)
+        self.send_json(200, gcs.resource(bucket, name, obj))
+
+    def _object_route(self, path):
+        # /storage/v1/b/<bucket>/o/<name>
+        rest = path[len('/storage/v1/b/'):]
+        bucket, _, name = rest.partition('/o/')
+        return bucket, unquote(name)
+
+    def do_PATCH(self):
+        gcs = self.service
+        gcs.count()
+        path, _ = self._route()
+        body = json.loads(self.read_body() or b'{}')
+        time.sleep(gcs.latency)
+        bucket, name = self._object_route(path)
+        with gcs.lock:
+            obj = gcs.objects.get((bucket, name))
+            if obj and 'acl' in body:
+                obj['acl'] = body['acl']
+        if not obj:
+            return self.send_json(404, {"error": {"code": 404, "message": "No such object"}})
+        self.send_json(200, gcs.resource(bucket, name, obj))
+
+    def do_GET(self):
+        gcs = self.service
+        gcs.count()
+        path, query = self._route()
+        if path.startswith('/storage/v1/b/'):
+            if '/o/' not in path:
+                bucket = path[len('/storage/v1/b/'):].strip('/')
+                return self.send_json(200, {"kind": "storage#bucket", "name": bucket, "id": bucket})
+            bucket, name = self._object_route(path)
+            if name.endswith('/acl'):
+                name = name[:-len('/acl')]
+                query['alt'] = 'acl'
+        elif path.startswith('/download/storage/v1/b/'):
+            bucket, name = self._object_route(path[len('/download'):])
+            query['alt'] = 'media'
+        else:
+            bucket, _, name = path.lstrip('/').partition('/')
+            name = unquote(name)
+            query['alt'] = 'media'
+        with gcs.lock:
+            obj = gcs.objects.get((bucket, name))
+        if not obj:
+            return self.send_json(404, {"error": {"code": 404, "message": "No such object"}})
+        if query.get('alt') == 'acl':
+            return self.send_json(200, {"kind": "storage#objectAccessControls", "items": obj['acl']})
+        if query.get('alt') == 'media':
+            return self.send_bytes(200, obj['data'], obj['contentType'])
+        self.send_json(200, gcs.resource(bucket, name, obj))
+
+    def do_DELETE(self):
+        gcs = self.service
+        gcs.count()
+        path, _ = self._route()
+        bucket, name = self._object_route(path)
+        with gcs.lock:
+            obj = gcs.objects.pop((bucket, name), None)
+            if obj:
+                gcs.deleted += 1
+        if not obj:
+            return self.send_json(404, {"error": {"code": 404, "message": "No such object"}})
+        self.send_bytes(204, b'', 'text/plain')
+
+
+class FakeGCS(FakeService):
+    """API JSON de Cloud Storage en memoria (uploads multipart/media/resumable, PATCH, descargas y borrado)"""
+
+    handler_class = _GCSHandler
+
+    def __init__(self, latency=0.02, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.objects = {}
+        self.sessions = {}
+        self.generation = 0
+        self.bytes_received = 0
+        self.deleted = 0
+
+    def resource(self, bucket, name, obj):
+        return {
+            "kind": "storage#object",
+            "id": f"{bucket}/{name}/{obj['generation']}",
+            "bucket": bucket,
+            "name": name,
+            "size": str(len(obj['data'])),
+            "contentType": obj['contentType'],
+            "cacheControl": obj.get('cacheControl'),
+            "metadata": obj.get('metadata'),
+            "generation": str(obj['generation']),
+            "metageneration": "1",
+            "acl": obj['acl'],
+        }
+
+    def put_object(self, bucket, name, data, content_type='application/octet-stream'):
+        """Precarga un objeto (p. ej. para /analyze) sin pasar por HTTP"""
+        with self.lock:
+            self.generation += 1
+            self.objects[(bucket, name)] = {
+                "data": data, "contentType": content_type, "generation": self.generation, "acl": []
+            }
+        return f"gs://{bucket}/{name}"
+
+    def stats(self):
+        return {"requests": self.requests, "objects": len(self.objects), "bytes_received": self.bytes_received,
+                "deleted": self.deleted}
+
+
+# ============================================
+# VERTEX AI
+# ============================================
+
+class _VertexHandler(_BaseHandler):
+
+    def do_POST(self):
+        vertex = self.service
+        vertex.count()
+        body = json.loads(self.read_body() or b'{}')
+        if not urlsplit(self.path).path.endswith(':predict'):
+            return self.send_json(404, {"error": {"code": 404, "message": "Not Found"}})
+        instances = body.get('instances', [])
+        vertex.wait(instances, body.get('parameters', {}))
+        if vertex.error_rate and random.random() < vertex.error_rate:
+            return self.send_json(503, {"error": {"code": 503, "message": "Service Unavailable"}})
+        predictions = [vertex.predict(inst, body.get('parameters', {})) for inst in instances]
+        self.send_json(200, {"predictions": predictions, "deployedModelId": "fake"})
+
+
+class FakeVertex(FakeService):
+    """
+    Endpoint `:predict` falso con latencia configurable.
+    Si tiene acceso al GCS falso, los videos MJPEG cuestan según los frames
+    que realmente se analizan: `video_latency` corresponde a REFERENCE_FRAMES.
+    """
+
+    handler_class = _VertexHandler
+    REFERENCE_FRAMES = 5  # Clip de 5 s con frame_interval=15 (modo clip completo)
+    DEFAULT_FRAMES = 75
+
+    def __init__(self, latency=0.5, video_latency=None, jitter=0.2, fire_rate=0.3,
+                 error_rate=0.0, gcs=None, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.video_latency = video_latency if video_latency is not None else latency * 4
+        self.jitter = jitter
+        self.fire_rate = fire_rate
+        self.error_rate = error_rate
+        self.gcs = gcs
+
+    def video_frames(self, instance):
+        """Frames JPEG del video en el GCS falso (DEFAULT_FRAMES si no se conoce)"""
+        uri = instance.get('video_url', '')
+        if self.gcs is None or not uri.startswith('gs://'):
+            return self.DEFAULT_FRAMES
+        bucket, _, name = uri[5:].partition('/')
+        obj = self.gcs.objects.get((bucket, name))
+        if not obj or not obj['contentType'].startswith('video/x-motion-jpeg'):
+            return self.DEFAULT_FRAMES
+        return obj['data'].count(b'\xff\xd8')
+
+    def analyzed_frames(self, instance, parameters):
+        return max(1, -(-self.video_frames(instance) // max(1, parameters.get('frame_interval', 15))))
+
+    def wait(self, instances, parameters):
+        videos = [inst for inst in instances if 'video_url' in inst]
+        if not videos:
+            base = self.latency
+        elif self.gcs is None:
+            base = self.video_latency
+        else:
+            frames = max(self.analyzed_frames(inst, parameters) for inst in videos)
+            base = self.latency + (self.video_latency - self.latency) * frames / self.REFERENCE_FRAMES
+        time.sleep(max(0.0, base * (1 + random.uniform(-self.jitter, self.jitter))))
+
+    def _detection(self):
+        fire = random.random() < self.fire_rate
+        return {
+            "class": random.choice(['fire', 'smoke']) if fire else 'other',
+            "confidence": round(random.uniform(0.55, 0.97), 3),
+            "bbox": [random.randint(0, 300) for _ in range(4)],
+        }
+
+    def predict(self, instance, parameters):
+        if 'video_url' in instance:
+            frames = self.analyzed_frames(instance, parameters)
+            per_frame = [{"frame": i, "detections": [self._detection()]} for i in range(frames)]
+            with_fire = sum(1 for f in per_frame if f['detections'][0]['class'] != 'other')
+            prediction = {
+                "detections": per_frame[:parameters.get('max_detections', 10)],
+                "analysis_summary": {
+                    "frames_analyzed": frames,
+                    "frames_with_fire": with_fire,
+                    "fire_detection_percentage": 100.0 * with_fire / max(1, frames),
+                },
+            }
+            if parameters.get('analyze_audio'):
+                prediction["audio"] = {"top_k": [
+                    {"label": label, "score": round(random.random(), 3)}
+                    for label in ['Crackle', 'Fire', 'Speech', 'Silence', 'Wind'][:parameters.get('audio_top_k', 5)]
+                ]}
+            return prediction
+        return {"detections": [self._detection() for _ in range(random.randint(1, 3))]}
+
+
+# ============================================
+# WEBHOOK N8N
+# ============================================
+
+class _WebhookHandler(_BaseHandler):
+
+    def do_POST(self):
+        sink = self.service
+        sink.count()
+        body = self.read_body()
+        with sink.lock:
+            sink.received.append(json.loads(body or b'{}'))
+            del sink.received[:-sink.keep]
+        self.send_json(200, {"ok": True})
+
+
+class FakeWebhook(FakeService):
+    """Sumidero de webhooks: acepta cualquier POST y guarda los últimos payloads"""
+
+    handler_class = _WebhookHandler
+
+    def __init__(self, keep=100, **kwargs):
+        super().__init__(**kwargs)
+        self.keep = keep
+        self.received = []
+
+
+# ============================================
+# ENTORNO COMPLETO
+# ============================================
+
+class FakeEnvironment:
+    """Levanta cámara, GCS, Vertex y n8n falsos y expone las variables de entorno del servidor"""
+
+    BUCKET = 'bench-bucket'
+
+    def __init__(self, camera=None, gcs=None, vertex=None, webhook=None, cameras=1):
+        self.camera = FakeCamera(**(camera or {}))
+        self.cameras = cameras  # Cámaras registradas en el servidor (todas servidas por la misma cámara falsa)
+        self.gcs = FakeGCS(**(gcs or {}))
+        self.vertex = FakeVertex(gcs=self.gcs, **(vertex or {}))
+        self.webhook = FakeWebhook(**(webhook or {}))
+        self.services = [self.camera, self.gcs, self.vertex, self.webhook]
+
+    def start(self):
+        for service in self.services:
+            service.start()
+        return self
+
+    def stop(self):
+        for service in self.services:
+            service.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def env(self):
+        cameras = [{"name": f"cam{i}", "url": f"{self.camera.url}/cam{i}"} for i in range(1, self.cameras + 1)]
+        return {
+            "PHONE_IP": self.camera.url,
+            "CAMERAS": json.dumps({"cameras": cameras}) if self.cameras > 1 else '',
+            "STORAGE_EMULATOR_HOST": self.gcs.url,
+            "BUCKET_NAME": self.BUCKET,
+            "VERTEX_AI_ENDPOINT": f"{self.vertex.url}/v1/projects/bench/locations/local/endpoints/1:predict",
+            "N8N_WEBHOOK_RESULT": f"{self.webhook.url}/webhook/send-result",
+        }
+
+    def stats(self):
+        return {
+            "camera": self.camera.stats(),
+            "gcs": self.gcs.stats(),
+            "vertex": self.vertex.stats(),
+            "webhook": self.webhook.stats(),
+        }
@@ -0,0 +1,438 @@
+# bench/loadtest.py - Benchmark de extremo a extremo del servidor IoT con servicios falsos
+#
+# Uso:
+#   python -m bench.loadtest --concurrency 16 --requests 400
+#   python -m bench.loadtest --endpoints upload,dashboard --duration 30 --json-out base.json
+#   python -m bench.loadtest --baseline base.json          # compara contra una corrida previa
+#   python -m bench.loadtest --server-cmd 'uvicorn asgi:application --port {port}'   # modo ASGI
+#
+# Levanta FakeEnvironment, arranca `main.py` en un subproceso apuntado a los
+# servicios falsos y lo golpea con N hilos concurrentes. Reporta throughput,
+# percentiles de latencia por endpoint y memoria (RSS) del proceso servidor.
+import argparse
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench.fakes import FakeEnvironment, make_jpeg, wav_header
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = ('alert', 'upload', 'analyze', 'dashboard')
+
+
+# ============================================
+# SERVIDOR BAJO PRUEBA
+# ============================================
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class ServerProcess:
+    """Ejecuta el servidor en un subproceso para medir su memoria de forma aislada"""
+
+    def __init__(self, env, command=None, log_path=None):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = dict(os.environ, PORT=str(self.port), PYTHONUNBUFFERED='1', **env)
+        # `{port}` en el comando se reemplaza por el puerto asignado
+        self.command = [part.format(port=self.port) for part in (command or [sys.executable, 'main.py'])]
+        self.log_path = log_path
+        self.proc = None
+
+    def start(self, timeout=30):
+        log = open(self.log_path, 'w') if self.log_path else subprocess.DEVNULL
+        self.proc = subprocess.Popen(self.command, cwd=ROOT, env=self.env,
+                                     stdout=log, stderr=subprocess.STDOUT)
+        wait_until_ready(self.url, timeout, self.proc)
+        return self
+
+    def stop(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+    @property
+    def pid(self):
+        return self.proc.pid if self.proc else None
+
+
+def wait_until_ready(url, timeout=30, proc=None):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"El servidor terminó con código {proc.returncode}")
+        try:
+            if requests.get(f"{url}/status", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"El servidor no respondió en {timeout}s")
+
+
+def process_tree(pid):
+    """El proceso y sus descendientes (workers de gunicorn/uvicorn), desde /proc"""
+    pids = [pid]
+    for current in pids:
+        try:
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def read_rss_mb(pid):
+    """
+    RSS actual y pico (VmHWM) en MB, desde /proc (solo Linux), sumando los
+    procesos hijos: con varios workers el pico es la suma de los picos de cada uno
+    """
+    rss = hwm = 0.0
+    found = False
+    for current in process_tree(pid):
+        try:
+            with open(f'/proc/{current}/status') as f:
+                fields = dict(line.split(':', 1) for line in f if ':' in line)
+            rss += int(fields['VmRSS'].split()[0]) / 1024
+            hwm += int(fields['VmHWM'].split()[0]) / 1024
+            found = True
+        except (OSError, KeyError, ValueError):
+            continue
+    return (rss, hwm) if found else (None, None)
+
+
+class MemorySampler(threading.Thread):
+    """Muestrea la memoria del servidor durante la corrida"""
+
+    def __init__(self, pid, interval=0.25):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.peak = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            rss, hwm = read_rss_mb(self.pid)
+            if rss is not None:
+                self.samples.append(rss)
+                self.peak = hwm
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def report(self):
+        if not self.samples:
+            return None
+        return {
+            "start_mb": round(self.samples[0], 1),
+            "end_mb": round(self.samples[-1], 1),
+            "max_sampled_mb": round(max(self.samples), 1),
+            "peak_mb": round(self.peak, 1) if self.peak else None,
+        }
+
+
+# ============================================
+# CARGA
+# ============================================
+
+class Workload:
+    """Genera las peticiones de cada endpoint"""
+
+    def __init__(self, env, args):
+        self.env = env
+        self.args = args
+        self.photo = make_jpeg(args.photo_kb * 1024)
+        self.video = b''.join(make_jpeg(40_000) for _ in range(max(1, args.video_kb // 40)))
+        self.audio = wav_header() + b'\x00' * (args.audio_kb * 1024)
+        # Objetos precargados en el GCS falso para /analyze
+        bucket = FakeEnvironment.BUCKET
+        self.photo_gcs = env.gcs.put_object(bucket, 'bench/photo.jpg', self.photo, 'image/jpeg')
+        self.video_gcs = env.gcs.put_object(bucket, 'bench/video.mjpeg', self.video, 'video/x-motion-jpeg')
+        self._upload_kinds = itertools.cycle([
+            ('photo', self.photo, 'capture.jpg', 'image/jpeg'),
+            ('video', self.video, 'capture.webm', 'video/webm'),
+            ('audio', self.audio, 'capture.webm', 'audio/webm'),
+        ])
+
+    def request(self, session, base_url, endpoint):
+        """Ejecuta una petición y devuelve (nombre, status)"""
+        timeout = self.args.timeout
+        if endpoint == 'alert':
+            status = 'alert' if random.random() < self.args.alert_ratio else 'normal'
+            r = session.post(f"{base_url}/alert", timeout=timeout,
+                             json={"temp": 45.5, "light": 850, "status": status})
+            return f"alert[{status}]", r.status_code
+        if endpoint == 'upload':
+            kind, data, filename, content_type = next(self._upload_kinds)
+            r = session.post(f"{base_url}/upload/{kind}", timeout=timeout,
+                             files={kind: (filename, data, content_type)})
+            return f"upload/{kind}", r.status_code
+        if endpoint == 'analyze':
+            r = session.post(f"{base_url}/analyze", timeout=timeout, json={
+                "photo_gcs_uri": self.photo_gcs,
+                "video_gcs_uri": self.video_gcs if self.args.analyze_video else None,
+            })
+            return 'analyze', r.status_code
+        if endpoint == 'dashboard':
+            r = session.get(f"{base_url}/api/dashboard-data", timeout=timeout)
+            return 'dashboard', r.status_code
+        raise ValueError(endpoint)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies, elapsed, errors):
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0,
+        "p50_ms": _ms(percentile(values, 50)),
+        "p90_ms": _ms(percentile(values, 90)),
+        "p99_ms": _ms(percentile(values, 99)),
+        "max_ms": _ms(values[-1] if values else None),
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def run_load(base_url, workload, endpoints, concurrency, total_requests=None, duration=None):
+    """Lanza `concurrency` hilos que recorren los endpoints en ronda"""
+    results = []  # (nombre, latencia, ok)
+    results_lock = threading.Lock()
+    counter = itertools.count()
+    deadline = time.time() + duration if duration else None
+
+    def worker(worker_id):
+        session = requests.Session()
+        # Cada hilo es un cliente distinto para los límites por cliente del servidor
+        session.headers['X-Appengine-User-Ip'] = f"10.0.{worker_id // 250}.{worker_id % 250 + 1}"
+        cycle = itertools.cycle(endpoints[worker_id % len(endpoints):] + endpoints[:worker_id % len(endpoints)])
+        while True:
+            n = next(counter)
+            if total_requests is not None and n >= total_requests:
+                break
+            if deadline is not None and time.time() >= deadline:
+                break
+            endpoint = next(cycle)
+            start = time.perf_counter()
+            try:
+                name, status = workload.request(session, base_url, endpoint)
+                ok = status < 400
+                if status == 429:
+                    # Rechazo del control de admisión: fila aparte, no es un error del servidor
+                    name, ok = f"{name}:429", True
+            except requests.RequestException:
+                name, ok = endpoint, False
+            latency = time.perf_counter() - start
+            with results_lock:
+                results.append((name, latency, ok))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    by_endpoint = {}
+    for name, latency, ok in results:
+        by_endpoint.setdefault(name, []).append((latency, ok))
+    report = {
+        "elapsed_s": round(elapsed, 2),
+        "overall": summarize([l for _, l, _ in results], elapsed, sum(1 for *_, ok in results if not ok)),
+        "endpoints": {
+            name: summarize([l for l, _ in items], elapsed, sum(1 for _, ok in items if not ok))
+            for name, items in sorted(by_endpoint.items())
+        },
+    }
+    return report
+
+
+# ============================================
+# REPORTE
+# ============================================
+
+def print_report(report, baseline=None):
+    print(f"\n{'='*78}")
+    print("  BENCHMARK - SERVIDOR IoT")
+    print(f"{'='*78}")
+    cfg = report['config']
+    print(f"  Concurrencia: {cfg['concurrency']}  |  Endpoints: {','.join(cfg['endpoints'])}"
+          f"  |  Vertex: {cfg['vertex_latency']}s")
+    print(f"  Duración: {report['elapsed_s']}s")
+    print(f"{'-'*78}")
+    print(f"  {'endpoint':<20}{'n':>7}{'err':>6}{'req/s':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    rows = list(report['endpoints'].items()) + [('TOTAL', report['overall'])]
+    for name, s in rows:
+        print(f"  {name:<20}{s['count']:>7}{s['errors']:>6}{s['throughput_rps']:>9}"
+              f"{_fmt(s['p50_ms']):>9}{_fmt(s['p90_ms']):>9}{_fmt(s['p99_ms']):>9}{_fmt(s['max_ms']):>9}")
+    memory = report.get('memory')
+    if memory:
+        print(f"{'-'*78}")
+        print(f"  Memoria servidor: inicio {memory['start_mb']} MB, fin {memory['end_mb']} MB, "
+              f"pico {memory['peak_mb']} MB")
+    if baseline:
+        print(f"{'-'*78}")
+        print("  Comparación con baseline (TOTAL):")
+        for key in ('throughput_rps', 'p50_ms', 'p99_ms'):
+            old, new = baseline['overall'].get(key), report['overall'].get(key)
+            if old and new:
+                print(f"    {key:<16}{old:>10} -> {new:<10} ({(new - old) / old:+.1%})")
+        old_mem, new_mem = (baseline.get('memory') or {}).get('peak_mb'), (memory or {}).get('peak_mb')
+        if old_mem and new_mem:
+            print(f"    {'peak_mb':<16}{old_mem:>10} -> {new_mem:<10} ({(new_mem - old_mem) / old_mem:+.1%})")
+    print(f"{'='*78}\n")
+
+
+def _fmt(value):
+    return '-' if value is None else f"{value:.0f}"
+
+
+# ============================================
+# MAIN
+# ============================================
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark de extremo a extremo con servicios falsos")
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                        help=f"Lista separada por comas de: {', '.join(ENDPOINTS)}")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help="Total de peticiones (ignorado con --duration)")
+    parser.add_argument('--duration', type=float, help="Duración de la corrida en segundos")
+    parser.add_argument('--warmup', type=int, default=5, help="Peticiones de calentamiento por endpoint")
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--target', help="URL de un servidor ya levantado (no se mide memoria)")
+    parser.add_argument('--server-cmd', help="Comando alternativo para arrancar el servidor ({port} = puerto asignado), "
+                             "p. ej. 'uvicorn asgi:application --port {port}'")
+    parser.add_argument('--server-log', help="Archivo donde guardar la salida del servidor")
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                        help="Variables de entorno extra para el servidor")
+    # Servicios falsos
+    parser.add_argument('--vertex-latency', type=float, default=0.5)
+    parser.add_argument('--vertex-video-latency', type=float)
+    parser.add_argument('--vertex-error-rate', type=float, default=0.0)
+    parser.add_argument('--gcs-latency', type=float, default=0.02)
+    parser.add_argument('--cameras', type=int, default=1, help="Cámaras registradas (CAMERAS) por alerta")
+    parser.add_argument('--capture-seconds', type=float, default=1.0, help="DURATION de video/audio")
+    parser.add_argument('--alert-cooldown', type=int, default=60)
+    parser.add_argument('--alert-ratio', type=float, default=0.1,
+                        help="Fracción de /alert con status=alert (disparan captura)")
+    parser.add_argument('--analyze-video', action='store_true', help="Incluir video en /analyze")
+    parser.add_argument('--photo-kb', type=int, default=150)
+    parser.add_argument('--video-kb', type=int, default=800)
+    parser.add_argument('--audio-kb', type=int, default=160)
+    # Resultados
+    parser.add_argument('--json-out', help="Guardar el reporte en JSON")
+    parser.add_argument('--baseline', help="Reporte JSON previo para comparar")
+    return parser
+
+
+def fake_env_from_args(args):
+    return FakeEnvironment(
+        gcs={"latency": args.gcs_latency},
+        vertex={"latency": args.vertex_latency, "video_latency": args.vertex_video_latency,
+                "error_rate": args.vertex_error_rate},
+        cameras=args.cameras,
+    )
+
+
+def server_env_from_args(args, env):
+    server_env = env.env()
+    server_env.update({
+        "DURATION": str(args.capture_seconds),
+        "ALERT_COOLDOWN_SECONDS": str(args.alert_cooldown),
+    })
+    for item in args.server_env:
+        key, _, value = item.partition('=')
+        server_env[key] = value
+    return server_env
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    endpoints = [e.strip() for e in args.endpoints.split(',') if e.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        raise SystemExit(f"Endpoints desconocidos: {', '.join(sorted(unknown))}")
+
+    env = fake_env_from_args(args).start()
+    server = None
+    try:
+        if args.target:
+            base_url = args.target.rstrip('/')
+        else:
+            command = args.server_cmd.split() if args.server_cmd else None
+            server = ServerProcess(server_env_from_args(args, env), command, args.server_log).start()
+            base_url = server.url
+        workload = Workload(env, args)
+
+        # Calentamiento (no se reporta)
+        if args.warmup:
+            session = requests.Session()
+            for endpoint in endpoints:
+                for _ in range(args.warmup):
+                    workload.request(session, base_url, endpoint)
+
+        sampler = MemorySampler(server.pid) if server else None
+        if sampler:
+            sampler.start()
+        report = run_load(base_url, workload, endpoints, args.concurrency,
+                          None if args.duration else args.requests, args.duration)
+        if sampler:
+            sampler.stop()
+            report['memory'] = sampler.report()
+
+        report['config'] = {
+            "concurrency": args.concurrency,
+            "endpoints": endpoints,
+            "vertex_latency": args.vertex_latency,
+            "capture_seconds": args.capture_seconds,
+            "cameras": args.cameras,
+        }
+        report['fakes'] = env.stats()
+
+        baseline = None
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        print_report(report, baseline)
+        if args.json_out:
+            with open(args.json_out, 'w') as f:
+                json.dump(report, f, indent=2)
+        return report
+    finally:
+        if server:
+            server.stop()
+        env.stop()
+
+
+if __name__ == '__main__':
+    main()
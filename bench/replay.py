@@ -0,0 +1,216 @@
+# bench/replay.py - Reproduce una grabación de tráfico real contra el servidor
+#
+# Uso:
+#   TRACE_RECORD_FILE=traces/prod.jsonl.gz python main.py     # grabar
+#   python -m bench.replay traces/prod.jsonl.gz               # reproducir a 1x
+#   python -m bench.replay traces/prod.jsonl.gz --speed 10    # ráfagas 10 veces más rápidas
+#   python -m bench.replay 'traces/prod.*.jsonl.gz'           # un archivo por worker de gunicorn
+#
+# Las peticiones se lanzan en lazo abierto: cada una sale en su instante
+# original (dividido por --speed) sin esperar a que terminen las anteriores,
+# igual que los Arduinos y cámaras reales. Los servicios externos se
+# reemplazan por los de bench/fakes.py.
+import argparse
+import base64
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench.fakes import make_jpeg, wav_header
+from bench.loadtest import (ServerProcess, MemorySampler, fake_env_from_args, build_parser as loadtest_parser,
+                            server_env_from_args, summarize)
+from recorder import read_trace
+
+# El mismo header que usa el servidor para identificar al cliente (server.CLIENT_IP_HEADER)
+CLIENT_IP_HEADER = os.getenv('CLIENT_IP_HEADER', 'X-Appengine-User-Ip')
+
+
+def synthesize_media(info):
+    """Contenido de reemplazo cuando la grabación no incluye los bytes"""
+    if info.get("data"):
+        return base64.b64decode(info["data"])
+    size = info.get("size", 0)
+    content_type = info.get("content_type") or ''
+    if content_type.startswith('image/'):
+        return make_jpeg(size)
+    if content_type == 'audio/wav':
+        return wav_header() + b'\x00' * max(0, size - 44)
+    return b'\x00' * size
+
+
+def send(session, base_url, entry, timeout, client_header=CLIENT_IP_HEADER):
+    """Reenvía una petición grabada (con la IP original en `client_header`); devuelve el status code"""
+    url = f"{base_url}{entry['path']}"
+    headers = {client_header: entry["client"]} if entry.get("client") else None
+    if entry.get("files"):
+        files = {
+            name: (info.get("filename") or name, synthesize_media(info), info.get("content_type"))
+            for name, info in entry["files"].items()
+        }
+        return session.post(url, files=files, headers=headers, timeout=timeout).status_code
+    return session.request(entry["method"], url, json=entry.get("json"), headers=headers,
+                           timeout=timeout).status_code
+
+
+class Replayer:
+    """Programa cada petición en su instante relativo original"""
+
+    def __init__(self, entries, base_url, speed=1.0, max_workers=256, timeout=600, client_header=CLIENT_IP_HEADER):
+        self.entries = entries
+        self.base_url = base_url
+        self.speed = speed
+        self.timeout = timeout
+        self.client_header = client_header
+        self.max_workers = max_workers
+        self.results = []  # (path, latencia, ok, retraso de salida)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _fire(self, entry, scheduled):
+        lag = time.perf_counter() - scheduled
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        start = time.perf_counter()
+        try:
+            ok = send(self._session(), self.base_url, entry, self.timeout, self.client_header) < 400
+        except requests.RequestException:
+            ok = False
+        latency = time.perf_counter() - start
+        with self._lock:
+            self.in_flight -= 1
+            self.results.append((entry["path"], latency, ok, lag))
+
+    def run(self):
+        if not self.entries:
+            return 0.0
+        t0 = self.entries[0]["ts"]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for entry in self.entries:
+                scheduled = start + (entry["ts"] - t0) / self.speed
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._fire, entry, scheduled)
+        return time.perf_counter() - start
+
+    def report(self, elapsed):
+        by_path = {}
+        for path, latency, ok, _ in self.results:
+            by_path.setdefault(path, []).append((latency, ok))
+        lags = sorted(lag for *_, lag in self.results)
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "speed": self.speed,
+            "max_in_flight": self.max_in_flight,
+            "max_dispatch_lag_ms": round(lags[-1] * 1000, 1) if lags else None,
+            "overall": summarize([l for _, l, _, _ in self.results], elapsed,
+                                 sum(1 for _, _, ok, _ in self.results if not ok)),
+            "endpoints": {
+                path: summarize([l for l, _ in items], elapsed, sum(1 for _, ok in items if not ok))
+                for path, items in sorted(by_path.items())
+            },
+        }
+
+
+def print_report(report, entries):
+    alerts = [e for e in entries if e["path"] == '/alert' and (e.get("json") or {}).get("status") == 'alert']
+    devices = {e.get("client") for e in entries}
+    span = entries[-1]["ts"] - entries[0]["ts"] if entries else 0
+
+    print(f"\n{'='*78}")
+    print("  REPLAY - SERVIDOR IoT")
+    print(f"{'='*78}")
+    print(f"  Grabación: {len(entries)} peticiones en {span:.1f}s, {len(devices)} clientes, "
+          f"{len(alerts)} lecturas 'alert'")
+    print(f"  Velocidad: {report['speed']}x  |  Duración real: {report['elapsed_s']}s  |  "
+          f"Máx. en vuelo: {report['max_in_flight']}  |  Retraso máx. de salida: {report['max_dispatch_lag_ms']} ms")
+    print(f"{'-'*78}")
+    print(f"  {'endpoint':<20}{'n':>7}{'err':>6}{'req/s':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    rows = list(report['endpoints'].items()) + [('TOTAL', report['overall'])]
+    for name, s in rows:
+        print(f"  {name:<20}{s['count']:>7}{s['errors']:>6}{s['throughput_rps']:>9}"
+              f"{_fmt(s['p50_ms']):>9}{_fmt(s['p90_ms']):>9}{_fmt(s['p99_ms']):>9}{_fmt(s['max_ms']):>9}")
+    fakes = report.get('fakes')
+    if fakes:
+        print(f"{'-'*78}")
+        print(f"  Throttling: {len(alerts)} lecturas 'alert' -> {fakes['camera']['photos']} capturas, "
+              f"{fakes['vertex']['requests']} llamadas a Vertex, {fakes['webhook']['requests']} notificaciones n8n")
+    memory = report.get('memory')
+    if memory:
+        print(f"  Memoria servidor: inicio {memory['start_mb']} MB, pico {memory['peak_mb']} MB")
+    print(f"{'='*78}\n")
+
+
+def _fmt(value):
+    return '-' if value is None else f"{value:.0f}"
+
+
+def build_parser():
+    # Reutiliza las opciones de servicios falsos y servidor de bench.loadtest
+    parser = argparse.ArgumentParser(description="Reproducir una grabación de tráfico",
+                                     parents=[loadtest_parser()], add_help=False, conflict_handler='resolve')
+    parser.add_argument('trace', nargs='+',
+                        help="Archivos .jsonl.gz (o patrones) generados con TRACE_RECORD_FILE; se mezclan por timestamp")
+    parser.add_argument('--speed', type=float, default=1.0, help="Factor de aceleración (1 = tiempo real)")
+    parser.add_argument('--limit', type=int, help="Reproducir solo las primeras N peticiones")
+    parser.add_argument('--max-workers', type=int, default=256)
+    parser.add_argument('--client-header', default=CLIENT_IP_HEADER,
+                        help="Header con la IP del cliente grabada (el CLIENT_IP_HEADER del servidor)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    entries = read_trace(*args.trace)
+    if args.limit:
+        entries = entries[:args.limit]
+    if not entries:
+        raise SystemExit("La grabación no contiene peticiones")
+
+    env = fake_env_from_args(args).start()
+    server = None
+    try:
+        if args.target:
+            base_url = args.target.rstrip('/')
+        else:
+            command = args.server_cmd.split() if args.server_cmd else None
+            server = ServerProcess(server_env_from_args(args, env), command, args.server_log).start()
+            base_url = server.url
+
+        sampler = MemorySampler(server.pid) if server else None
+        if sampler:
+            sampler.start()
+        replayer = Replayer(entries, base_url, args.speed, args.max_workers, args.timeout, args.client_header)
+        elapsed = replayer.run()
+        report = replayer.report(elapsed)
+        if sampler:
+            sampler.stop()
+            report['memory'] = sampler.report()
+        report['fakes'] = env.stats()
+
+        print_report(report, entries)
+        if args.json_out:
+            with open(args.json_out, 'w') as f:
+                json.dump(report, f, indent=2)
+        return report
+    finally:
+        if server:
+            server.stop()
+        env.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+# cameras.py - Registro de cámaras IP Webcam por zona
+#
+# PHONE_IP era una sola cámara: cada alerta juntaba evidencia de un solo punto
+# de vista. Ahora las cámaras se declaran en CAMERAS (JSON) o CAMERAS_FILE:
+#
+#   {"cameras": [{"name": "cocina", "url": "https://...", "zones": ["planta-1"]},
+#                {"name": "pasillo", "url": "https://...", "zones": ["planta-1", "planta-2"]}],
+#    "devices": {"arduino-cocina": "planta-1"}}
+#
+# Una alerta captura de todas las cámaras de su zona (la zona viene en el JSON
+# de la alerta o se deduce del dispositivo). Sin zona, o si la zona no tiene
+# cámaras, se usan todas. Cada cámara tiene su propio pool de conexiones y su
+# estado de salud: tras varias fallas seguidas queda fuera de las capturas
+# durante un rato y después se vuelve a intentar.
+# Sin CAMERAS se mantiene el comportamiento anterior: una cámara en PHONE_IP.
+import json
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_ZONE = 'default'
+ALL_ZONES = '*'
+
+
+class Camera:
+    """Una IP Webcam con su pool de conexiones y su estado de salud"""
+
+    def __init__(self, name, url, zones=(DEFAULT_ZONE,), session_factory=None, pool_size=4,
+                 failure_threshold=3, retry_seconds=60):
+        self.name = name
+        self.url = url.rstrip('/')
+        self.zones = tuple(zones) or (DEFAULT_ZONE,)
+        self.session_factory = session_factory
+        self.pool_size = pool_size
+        self.failure_threshold = failure_threshold  # Fallas seguidas para marcarla caída
+        self.retry_seconds = retry_seconds          # Tiempo fuera de las capturas antes de reintentar
+        self.captures = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_ok = None
+        self.last_error = None
+        self.last_latency_ms = None
+        self.down_until = 0.0
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def client_name(self):
+        """Nombre del cliente httpx de esta cámara en async_engine"""
+        return f"camera:{self.name}"
+
+    def session(self):
+        """Sesión requests propia de la cámara (se crea al primer uso)"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self.session_factory(self.pool_size)
+        return self._session
+
+    def covers(self, zone):
+        return zone in self.zones or ALL_ZONES in self.zones
+
+    def available(self):
+        return time.time() >= self.down_until
+
+    def record_success(self, latency_ms):
+        with self._lock:
+            self.captures += 1
+            self.consecutive_failures = 0
+            self.down_until = 0.0
+            self.last_ok = datetime.now().isoformat()
+            self.last_latency_ms = round(latency_ms, 1)
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error)[:200]
+            if self.consecutive_failures >= self.failure_threshold:
+                self.down_until = time.time() + self.retry_seconds
+                print(f"[CAMERAS] {self.name} sin responder ({self.consecutive_failures} fallas); "
+                      f"se reintenta en {self.retry_seconds}s")
+
+    def health(self):
+        if not self.available():
+            state = "down"
+        elif self.consecutive_failures:
+            state = "degraded"
+        else:
+            state = "ok"
+        return {
+            "name": self.name,
+            "url": self.url,
+            "zones": list(self.zones),
+            "state": state,
+            "captures": self.captures,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_ok": self.last_ok,
+            "last_error": self.last_error,
+            "last_latency_ms": self.last_latency_ms,
+        }
+
+
+class CameraRegistry:
+    """Cámaras por zona y zona de cada dispositivo Arduino"""
+
+    def __init__(self, cameras, devices=None):
+        if not cameras:
+            raise ValueError("Se necesita al menos una cámara")
+        self.cameras = list(cameras)
+        self.devices = dict(devices or {})
+
+    @classmethod
+    def from_config(cls, config, default_url, **camera_options):
+        """
+        `config`: dict o texto JSON con "cameras" y "devices" (ver arriba).
+        Vacío -> una sola cámara "phone" en `default_url`.
+        """
+        if isinstance(config, str):
+            config = json.loads(config) if config.strip() else None
+        if not config or not config.get('cameras'):
+            return cls([Camera('phone', default_url, (ALL_ZONES,), **camera_options)])
+
+        cameras = []
+        for i, entry in enumerate(config['cameras'], 1):
+            zones = entry.get('zones') or [entry.get('zone', DEFAULT_ZONE)]
+            cameras.append(Camera(entry.get('name') or f"camera-{i}", entry['url'], zones, **camera_options))
+        return cls(cameras, config.get('devices'))
+
+    def primary(self):
+        return self.cameras[0]
+
+    def zone_for(self, device=None, zone=None):
+        """Zona de una alerta: la explícita o la del dispositivo (None si no se conoce)"""
+        return zone or self.devices.get(device)
+
+    def for_zone(self, zone=None):
+        """Cámaras disponibles para una zona (todas si no hay zona o no tiene cámaras)"""
+        selected = [c for c in self.cameras if c.covers(zone)] if zone else []
+        selected = selected or list(self.cameras)
+        available = [c for c in selected if c.available()]
+        return available or selected  # Si todas están caídas se intenta igual
+
+    def health(self):
+        return [camera.health() for camera in self.cameras]
@@ -0,0 +1,113 @@
+# credentials_manager.py - Tokens de Google refrescados en segundo plano
+#
+# google-auth refresca las credenciales de forma bloqueante y solo cuando ya
+# expiraron, así que la primera petición después de la expiración paga el
+# refresh. CredentialsManager lo hace en un hilo daemon antes de que el token
+# venza y publica (token, expiry) como una tupla inmutable: los lectores no
+# toman ningún lock.
+import threading
+import time
+from datetime import datetime
+
+import requests
+from google.auth.transport.requests import Request
+
+
+class CredentialsManager:
+    """Mantiene un token de acceso válido para credenciales de google-auth"""
+
+    def __init__(self, credentials, refresh_margin=300, retry_interval=15, default_lifetime=3300):
+        self.credentials = credentials
+        self.refresh_margin = refresh_margin      # Refrescar N segundos antes de expirar
+        self.retry_interval = retry_interval      # Espera tras un refresh fallido
+        self.default_lifetime = default_lifetime  # Si las credenciales no informan expiry
+        self.refreshes = 0
+        self.failures = 0
+        self._snapshot = (None, 0.0)              # (token, expiry como epoch)
+        self._refresh_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        # Sesión HTTP reutilizada para los refresh (evita un handshake TLS cada vez)
+        self._request = Request(session=requests.Session())
+
+    def start(self):
+        """Primer refresh síncrono y arranque del hilo de refresco"""
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name='credentials-refresh', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def refresh(self):
+        """Refrescar el token ahora; retorna True si se obtuvo uno nuevo"""
+        with self._refresh_lock:
+            return self._do_refresh()
+
+    def _do_refresh(self):
+        try:
+            self.credentials.refresh(self._request)
+        except Exception as e:
+            self.failures += 1
+            print(f"[AUTH ERROR] Refresh falló: {e}")
+            return False
+        expiry = self.credentials.expiry
+        if expiry is not None:
+            # google-auth usa datetime UTC sin tzinfo
+            expires_at = time.time() + (expiry - datetime.utcnow()).total_seconds()
+        else:
+            expires_at = time.time() + self.default_lifetime
+        self._snapshot = (self.credentials.token, expires_at)
+        self.refreshes += 1
+        return True
+
+    def _is_fresh(self):
+        token, expires_at = self._snapshot
+        return bool(token) and expires_at - time.time() > 10
+
+    def get_token(self, block=True):
+        """
+        Token vigente sin locks en el camino normal.
+        Si el token ya expiró (p. ej. el hilo de refresco falló) y block=True,
+        se refresca en línea como último recurso.
+        """
+        if self._is_fresh():
+            return self._snapshot[0]
+        if not block:
+            return None
+        with self._refresh_lock:
+            # Otro hilo pudo haber refrescado mientras esperábamos el lock
+            if not self._is_fresh():
+                self._do_refresh()
+        self._wakeup.set()
+        return self._snapshot[0]
+
+    def _run(self):
+        while not self._stopped:
+            _, expires_at = self._snapshot
+            wait = expires_at - self.refresh_margin - time.time()
+            if self._snapshot[0] is None:
+                wait = self.retry_interval
+            if wait > 0:
+                self._wakeup.wait(wait)
+                self._wakeup.clear()
+                if self._stopped:
+                    return
+                # Despertado antes de tiempo (refresh en línea): recalcular
+                if self._snapshot[1] - self.refresh_margin - time.time() > 0:
+                    continue
+            if not self.refresh():
+                self._wakeup.wait(self.retry_interval)
+                self._wakeup.clear()
+
+    def stats(self):
+        token, expires_at = self._snapshot
+        return {
+            "valid": bool(token) and expires_at > time.time(),
+            "expires_in": max(0, int(expires_at - time.time())) if token else None,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+        }
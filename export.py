@@ -0,0 +1,131 @@
+# export.py - Exportación del historial completo en NDJSON o CSV
+#
+# /alertas y /api/dashboard-data solo devuelven los últimos 20 elementos. La
+# revisión semanal de falsas alarmas necesita todas las lecturas y veredictos,
+# así que /api/export/alerts y /api/export/analyses recorren el historial con
+# generadores y mandan la respuesta por partes (chunked): la memoria no crece
+# con el tamaño del rango y los primeros bytes salen de inmediato.
+import csv
+import io
+import json
+from datetime import datetime
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',  # Flask agrega charset=utf-8
+}
+
+CHUNK_BYTES = 64 * 1024  # Filas agrupadas por chunk (un write por fila sería muy lento)
+
+ALERT_COLUMNS = ('id', 'timestamp', 'temperatura', 'luz', 'estado', 'dispositivo', 'zona', 'test')
+ANALYSIS_COLUMNS = (
+    'id', 'timestamp', 'alert_id', 'device', 'fire_detected', 'confidence',
+    'photo_fire', 'photo_confidence', 'video_fire', 'video_confidence',
+    'photo', 'video', 'audio', 'raw_url',
+)
+
+
+def parse_time(value):
+    """
+    '2026-01-31' o '2026-01-31T12:00:00' -> datetime (None si no viene).
+    Con zona horaria ('...Z', '...-05:00') se pasa a la hora local sin zona,
+    como los timestamps del historial: comparar con y sin zona falla a mitad
+    del stream, cuando la respuesta ya salió con 200.
+    """
+    if not value:
+        return None
+    return local_naive(datetime.fromisoformat(value))
+
+
+def local_naive(moment):
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone().replace(tzinfo=None)
+
+
+def select(items, timestamp_of, device_of, since=None, until=None, device=None):
+    """
+    Elementos del historial dentro del rango [since, until) y del dispositivo.
+    `items` es el iterador de state.iterate(): lo que llega durante la
+    exportación no entra y el historial no se copia.
+    """
+    for item in items:
+        if device is not None and device_of(item) != device:
+            continue
+        if since or until:
+            timestamp = local_naive(datetime.fromisoformat(timestamp_of(item)))
+            if since and timestamp < since:
+                continue
+            if until and timestamp >= until:
+                continue
+        yield item
+
+
+def alert_row(alerta):
+    return {column: alerta.get(column) for column in ALERT_COLUMNS}
+
+
+def analysis_row(record):
+    """Fila plana de un AnalysisRecord (sin detecciones ni respuesta cruda)"""
+    photo, video = record.photo, record.video
+    return {
+        'id': record.id,
+        'timestamp': record.timestamp,
+        'alert_id': record.alert_id,
+        'device': record.device,
+        'fire_detected': record.fire_detected,
+        'confidence': record.confidence,
+        'photo_fire': photo.fire_detected if photo else None,
+        'photo_confidence': photo.confidence if photo else None,
+        'video_fire': video.fire_detected if video else None,
+        'video_confidence': video.confidence if video else None,
+        'photo': record.files.get('photo'),
+        'video': record.files.get('video'),
+        'audio': record.files.get('audio'),
+        'raw_url': f"/api/analysis/{record.id}/raw" if record.raw_key else None,
+    }
+
+
+def _chunked(lines):
+    """Agrupar líneas ya codificadas en chunks de ~CHUNK_BYTES (la primera sale sola, de inmediato)"""
+    buffer = []
+    size = 0
+    first = True
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if first or size >= CHUNK_BYTES:
+            first = False
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def ndjson_stream(rows):
+    return _chunked(
+        (json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n').encode()
+        for row in rows
+    )
+
+
+def _drain(out):
+    data = out.getvalue().encode()
+    out.seek(0)
+    out.truncate()
+    return data
+
+
+def csv_stream(rows, columns):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=columns, extrasaction='ignore')
+
+    def lines():
+        writer.writeheader()
+        yield _drain(out)
+        for row in rows:
+            writer.writerow(row)
+            yield _drain(out)
+
+    return _chunked(lines())
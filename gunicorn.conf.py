@@ -0,0 +1,98 @@
+# gunicorn.conf.py - Modo producción: varios procesos con hilos por instancia
+#
+#   gunicorn -c gunicorn.conf.py                     # WSGI (Flask) con hilos
+#   WEB_MODE=asgi gunicorn -c gunicorn.conf.py       # asgi.py con workers de uvicorn
+#
+# `app.run` (main.py) es el servidor de desarrollo de Flask: un solo proceso,
+# así que una instancia con varios núcleos usaba uno solo. Aquí cada proceso
+# importa server.py por su cuenta (sin preload: pools, clientes y hilos no se
+# comparten tras el fork) y el historial, los ids y el cooldown de capturas van
+# a STATE_BACKEND (ver state_store.py).
+import multiprocessing
+import os
+
+
+def instance_memory_mb():
+    """Memoria de la instancia: límite del cgroup si lo hay, si no MemTotal"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                limit = f.read().strip()
+            if limit.isdigit() and int(limit) < 1 << 50:
+                return int(limit) // (1024 * 1024)
+        except OSError:
+            pass
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+
+def default_processes():
+    """Un proceso por núcleo, sin pasarse de la memoria (una F1 tiene 384 MB)"""
+    processes = multiprocessing.cpu_count()
+    memory_mb = instance_memory_mb()
+    if memory_mb:
+        processes = min(processes, (memory_mb - 64) // WEB_WORKER_MB)  # 64 MB para el master
+    return max(1, processes)
+
+
+WEB_MODE = os.getenv('WEB_MODE', 'wsgi')                           # wsgi (Flask + hilos) o asgi (uvicorn)
+WEB_WORKER_MB = int(os.getenv('WEB_WORKER_MB', 128))               # Memoria estimada por proceso (~90 MB RSS)
+WEB_PROCESSES = int(os.getenv('WEB_PROCESSES', 0)) or default_processes()
+
+# Los límites PIPELINE_* son de la instancia y cada proceso aplica su parte
+# (server.py los divide por WEB_WORKERS, ver admission.process_share). Cada
+# hilo con un pipeline en curso o en cola queda ocupado hasta que termina: con
+# menos hilos que esos lugares, las alertas llenan el proceso y el dashboard espera
+os.environ['WEB_WORKERS'] = str(WEB_PROCESSES)
+PIPELINE_SLOTS = sum(max(1, int(os.getenv(name, default)) // WEB_PROCESSES)
+                     for name, default in (('PIPELINE_MAX_ACTIVE', 8), ('PIPELINE_QUEUE_SIZE', 16)))
+
+WEB_THREADS = int(os.getenv('WEB_THREADS', 0)) or PIPELINE_SLOTS + 8  # Hilos por proceso (solo wsgi)
+WEB_TIMEOUT = int(os.getenv('WEB_TIMEOUT', 120))                   # Captura + Vertex AI pueden tardar
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = WEB_PROCESSES
+if WEB_MODE == 'asgi':
+    wsgi_app = 'asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'main:app'
+    worker_class = 'gthread'
+    threads = WEB_THREADS
+timeout = WEB_TIMEOUT
+graceful_timeout = 30
+preload_app = False
+accesslog = os.getenv('WEB_ACCESS_LOG')  # '-' para stdout; sin definir, sin log de accesos
+
+# Con varios procesos el estado en memoria quedaría repartido entre ellos:
+# sin STATE_BACKEND explícito se usa el archivo SQLite compartido de la instancia
+if workers > 1 and 'STATE_BACKEND' not in os.environ:
+    os.environ['STATE_BACKEND'] = 'sqlite'
+
+# Un archivo de grabación por worker (ver recorder.py); bench.replay los mezcla
+_trace = os.getenv('TRACE_RECORD_FILE')
+if workers > 1 and _trace and '{pid}' not in _trace:
+    base, dot, ext = _trace.partition('.jsonl')
+    os.environ['TRACE_RECORD_FILE'] = f"{base}.{{pid}}{dot}{ext}"
+
+
+def on_starting(server):
+    print(f"[SERVER] {WEB_MODE}: {workers} procesos"
+          f"{'' if WEB_MODE == 'asgi' else f' x {WEB_THREADS} hilos'}, estado en {os.environ.get('STATE_BACKEND', 'memory')}")
+    if WEB_MODE != 'asgi' and WEB_THREADS <= PIPELINE_SLOTS:
+        print(f"[SERVER] WEB_THREADS={WEB_THREADS} no supera los {PIPELINE_SLOTS} pipelines en curso + en cola: "
+              f"las alertas pueden ocupar todos los hilos")
+
+
+def post_worker_init(worker):
+    # /_ah/warmup lo atiende un solo worker: cada proceso se prepara al arrancar
+    # (en un hilo, para aceptar requests mientras tanto)
+    import threading
+    import server
+    threading.Thread(target=server.warmup, name='warmup', daemon=True).start()
@@ -1,4 +1,5 @@
 # main.py - Punto de entrada para Google App Engine
+# Producción: gunicorn -c gunicorn.conf.py (importa main:app). `python main.py`: desarrollo local
 import os
 from server import app
 
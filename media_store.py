@@ -0,0 +1,120 @@
+# media_store.py - Nombres de objeto por contenido e índice de multimedia
+#
+# Los nombres con timestamp (photos/photo_YYYYmmdd_HHMMSS.jpg) tienen resolución
+# de un segundo: una captura y un upload del mismo segundo se pisaban. Ahora el
+# nombre es el hash SHA-256 del contenido (photos/<hash>.jpg):
+#   - dos archivos distintos nunca comparten nombre
+#   - un archivo idéntico ya subido no se vuelve a subir (el upload usa
+#     ifGenerationMatch=0 y un 412 significa "ya existe")
+# MediaIndex recuerda qué objetos subió este proceso (para saltar el upload
+# sin ir a la red) y anota qué archivos se capturaron para cada alerta en un
+# mapa persistente (state.map('alert_media') en el servidor), que sobrevive a
+# los reinicios en frío y es el mismo para todos los procesos e instancias.
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+HASH_CHARS = 32  # 128 bits del SHA-256: suficiente para evitar colisiones
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_CHARS]
+
+
+def content_blob_name(folder, data, extension):
+    """Nombre de objeto por contenido: folder/<sha256>.ext"""
+    return f"{folder}/{content_hash(data)}.{extension}"
+
+
+class _LocalLinks:
+    """Multimedia por alerta en memoria (sin estado compartido)"""
+
+    def __init__(self):
+        self._links = {}
+
+    def set(self, key, value):
+        self._links[str(key)] = value
+
+    def get(self, key):
+        return self._links.get(str(key))
+
+
+class MediaIndex:
+    """
+    Objetos conocidos en el bucket (caché en memoria, acotada) y multimedia de
+    cada alerta. `links`: objeto con set(alerta, dict) y get(alerta) (un StateMap).
+    """
+
+    def __init__(self, links=None, max_objects=5000):
+        self.links = links if links is not None else _LocalLinks()
+        self.max_objects = max_objects
+        self.linked = 0
+        self.uploads = 0
+        self.dedupe_hits = 0
+        self.bytes_uploaded = 0
+        self.bytes_skipped = 0
+        self._objects = OrderedDict()  # nombre -> {content_type, size, created}
+        self._lock = threading.Lock()
+
+    def contains(self, name):
+        with self._lock:
+            if name in self._objects:
+                self._objects.move_to_end(name)
+                return True
+            return False
+
+    def record_upload(self, name, size, content_type):
+        """Objeto subido por esta instancia"""
+        with self._lock:
+            self.uploads += 1
+            self.bytes_uploaded += size
+            self._remember(name, size, content_type)
+
+    def record_hit(self, name, size, content_type):
+        """Objeto que ya existía: no se subieron sus bytes"""
+        with self._lock:
+            self.dedupe_hits += 1
+            self.bytes_skipped += size
+            self._remember(name, size, content_type)
+
+    def _remember(self, name, size, content_type):
+        if name not in self._objects:
+            self._objects[name] = {
+                "content_type": content_type,
+                "size": size,
+                "created": datetime.now().isoformat(),
+            }
+        self._objects.move_to_end(name)
+        while len(self._objects) > self.max_objects:
+            self._objects.popitem(last=False)
+
+    def link_alert(self, alert_id, files):
+        """
+        Asociar los archivos capturados ({tipo: gs://...}) a una alerta. Los
+        datos del objeto se toman ahora, mientras este proceso los conoce.
+        """
+        files = {kind: gcs_uri for kind, gcs_uri in files.items() if gcs_uri}
+        if alert_id is None or not files:
+            return
+        with self._lock:
+            media = {
+                kind: {"gcs_uri": gcs_uri, **self._objects.get(gcs_uri.split('/', 3)[-1], {})}
+                for kind, gcs_uri in files.items()
+            }
+            self.linked += 1
+        self.links.set(alert_id, media)
+
+    def alert_media(self, alert_id):
+        """{tipo: {gcs_uri, content_type, size, created}} de una alerta, o None"""
+        return self.links.get(alert_id)
+
+    def stats(self):
+        return {
+            "objects": len(self._objects),
+            "alerts_linked": self.linked,
+            "uploads": self.uploads,
+            "dedupe_hits": self.dedupe_hits,
+            "bytes_uploaded": self.bytes_uploaded,
+            "bytes_skipped": self.bytes_skipped,
+        }
@@ -0,0 +1,263 @@
+# previews.py - Miniaturas y hojas de contacto para la evidencia del dashboard
+#
+# Después de cada upload se generan, en un pool de hilos aparte, versiones
+# livianas de la evidencia:
+#   photos/<hash>.jpg    -> photos/<hash>.thumb.jpg   (JPEG reducido)
+#   videos/<hash>.mjpeg  -> videos/<hash>.sheet.jpg   (cuadrícula de frames muestreados)
+# Se guardan junto a los originales con Cache-Control inmutable, y
+# /api/dashboard-data las referencia para que la página cargue rápido en móvil.
+# La URL de cada preview se anota en un índice (original -> preview): en el
+# servidor es state.map('previews'), así sobrevive a reinicios y la ven todos
+# los procesos e instancias. Cada entrada lleva su hora y el índice se recorta
+# a las max_index más recientes.
+#
+# Pillow es opcional: si no está instalado, no se generan previews y el
+# dashboard sigue enlazando a los originales. Los .webm subidos desde el
+# navegador no se pueden decodificar sin ffmpeg, así que solo tienen miniatura
+# las fotos y los videos MJPEG de IP Webcam.
+import io
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Los nombres de preview derivan del hash del original (ver media_store.py): nunca cambian de contenido
+PREVIEW_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+SOI = b'\xff\xd8'  # Inicio de imagen JPEG
+EOI = b'\xff\xd9'  # Fin de imagen JPEG
+
+
+def preview_blob_name(blob_name, suffix):
+    """photos/<hash>.jpg -> photos/<hash>.<suffix>.jpg"""
+    base = blob_name.rsplit('.', 1)[0]
+    return f"{base}.{suffix}.jpg"
+
+
+def make_thumbnail(image_bytes, max_size=320, quality=70):
+    """JPEG reducido (sin agrandar) que entra en un cuadro de max_size x max_size"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        # draft() deja que el decoder JPEG reduzca en escala 1/2..1/8 al decodificar
+        img.draft('RGB', (max_size, max_size))
+        img = img.convert('RGB')
+        img.thumbnail((max_size, max_size))
+        img.info.pop('comment', None)  # Pillow copiaría los segmentos COM del original
+        out = io.BytesIO()
+        img.save(out, 'JPEG', quality=quality, optimize=True, progressive=True)
+        return out.getvalue()
+
+
+def split_mjpeg_frames(data):
+    """Posiciones (inicio, fin) de cada frame JPEG dentro de un stream MJPEG"""
+    spans = []
+    start = data.find(SOI)
+    while start != -1:
+        end = data.find(EOI, start + 2)
+        if end == -1:
+            break  # Último frame cortado al terminar la captura
+        spans.append((start, end + 2))
+        start = data.find(SOI, end + 2)
+    return spans
+
+
+def sample_evenly(items, count):
+    """Hasta `count` elementos repartidos a lo largo de la lista"""
+    if len(items) <= count:
+        return list(items)
+    step = (len(items) - 1) / (count - 1) if count > 1 else 0
+    return [items[round(i * step)] for i in range(count)]
+
+
+def make_contact_sheet(video_bytes, frames=6, columns=3, tile_width=240, quality=65):
+    """Cuadrícula JPEG con `frames` frames muestreados de un video MJPEG"""
+    from PIL import Image
+
+    tiles = []
+    for start, end in sample_evenly(split_mjpeg_frames(video_bytes), frames):
+        try:
+            with Image.open(io.BytesIO(video_bytes[start:end])) as img:
+                img.draft('RGB', (tile_width, tile_width))
+                img = img.convert('RGB')
+                img.thumbnail((tile_width, tile_width))
+                tiles.append(img)
+        except Exception:
+            continue  # Frame corrupto: se omite
+    if not tiles:
+        return None
+
+    tile_height = max(t.height for t in tiles)
+    columns = min(columns, len(tiles))
+    rows = (len(tiles) + columns - 1) // columns
+    sheet = Image.new('RGB', (columns * tile_width, rows * tile_height), (17, 17, 17))
+    for i, tile in enumerate(tiles):
+        x = (i % columns) * tile_width + (tile_width - tile.width) // 2
+        y = (i // columns) * tile_height + (tile_height - tile.height) // 2
+        sheet.paste(tile, (x, y))
+
+    out = io.BytesIO()
+    sheet.save(out, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+class MemoryIndex:
+    """Índice original -> preview en memoria, acotado (sin estado compartido)"""
+
+    def __init__(self, max_items=2000):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def get_many(self, keys):
+        with self._lock:
+            return {key: self._items[key] for key in keys if key in self._items}
+
+    def items(self):
+        with self._lock:
+            return dict(self._items)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._items.pop(key, None)
+
+
+def _entry_time(entry):
+    # Entradas anteriores a la hora en el índice (solo la URL): las primeras en recortarse
+    return entry.get("ts", 0) if isinstance(entry, dict) else 0
+
+
+def _entry_url(entry):
+    return entry["url"] if isinstance(entry, dict) else entry
+
+
+class PreviewGenerator:
+    """
+    Genera y sube previews en segundo plano.
+    `upload(data, blob_name, content_type)` debe retornar (public_url, gcs_uri).
+    `index`: objeto con set, get_many, items y delete (MemoryIndex o un StateMap);
+    cada `prune_every` previews se recorta a las `max_index` más recientes.
+    """
+
+    def __init__(self, upload, workers=2, max_pending=20, thumb_size=320, sheet_frames=6, index=None,
+                 max_index=2000, prune_every=100):
+        self.upload = upload
+        self.workers = workers
+        self.max_pending = max_pending    # Con más trabajos en cola se descartan (ráfagas de uploads)
+        self.thumb_size = thumb_size
+        self.sheet_frames = sheet_frames
+        self.index = index if index is not None else MemoryIndex()  # URL/URI del original -> {url, ts} del preview
+        self.max_index = max_index
+        self.prune_every = prune_every
+        self._since_prune = 0
+        self.generated = 0
+        self.failed = 0
+        self.dropped = 0
+        self.pending = 0
+        self.available = None             # None = Pillow aún no verificado
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _pillow_available(self):
+        if self.available is None:
+            try:
+                import PIL  # noqa: F401
+                self.available = True
+            except ImportError:
+                self.available = False
+                print("[PREVIEW] Pillow no instalado; el dashboard usará los archivos originales")
+        return self.available
+
+    def schedule(self, data, blob_name, content_type, *keys):
+        """Encolar la generación del preview de un archivo ya subido"""
+        if content_type == 'image/jpeg':
+            kind = 'thumb'
+        elif content_type == 'video/x-motion-jpeg':
+            kind = 'sheet'
+        else:
+            return False
+        if not self._pillow_available():
+            return False
+
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.dropped += 1
+                return False
+            self.pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='preview')
+        self._executor.submit(self._generate, kind, data, blob_name, keys)
+        return True
+
+    def _generate(self, kind, data, blob_name, keys):
+        try:
+            if kind == 'thumb':
+                preview = make_thumbnail(data, self.thumb_size)
+            else:
+                preview = make_contact_sheet(data, self.sheet_frames)
+            if not preview:
+                raise ValueError("sin frames decodificables")
+
+            public_url, _ = self.upload(preview, preview_blob_name(blob_name, kind), 'image/jpeg')
+            if not public_url:
+                raise RuntimeError("upload falló")
+
+            stored = 0
+            for key in keys:
+                if key:
+                    self.index.set(key, {"url": public_url, "ts": time.time()})
+                    stored += 1
+            with self._lock:
+                self.generated += 1
+                self._since_prune += stored
+                prune = self._since_prune >= self.prune_every
+                if prune:
+                    self._since_prune = 0
+            if prune:
+                self.prune()
+            print(f"[PREVIEW] {kind} {len(data)} -> {len(preview)} bytes: {public_url}")
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            print(f"[PREVIEW ERROR] {blob_name}: {e}")
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def prune(self):
+        """Borrar del índice las entradas más viejas por encima de max_index"""
+        try:
+            entries = self.index.items()
+            extra = len(entries) - self.max_index
+            if extra > 0:
+                oldest = sorted(entries, key=lambda key: _entry_time(entries[key]))
+                self.index.delete(oldest[:extra])
+        except Exception as e:
+            print(f"[PREVIEW ERROR] Recorte del índice: {e}")
+
+    def lookup(self, files):
+        """Previews disponibles para el dict `files` de un análisis ({tipo: url})"""
+        return self.lookup_many([files])[0]
+
+    def lookup_many(self, files_list):
+        """lookup() de varios análisis con una sola consulta al índice"""
+        urls = {url for files in files_list for url in (files or {}).values() if url}
+        found = self.index.get_many(list(urls)) if urls else {}
+        return [{kind: _entry_url(found[url]) for kind, url in (files or {}).items() if url in found}
+                for files in files_list]
+
+    def stats(self):
+        return {
+            "available": self.available,
+            "generated": self.generated,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "pending": self.pending,
+        }
@@ -0,0 +1,199 @@
+# progressive.py - Análisis progresivo de video con salida anticipada
+#
+# En vez de mandar el clip completo a Vertex AI en una sola llamada (y esperar
+# hasta 300 s), el video MJPEG se parte en segmentos cortos con frames
+# muestreados que se analizan en orden:
+#   - el primer segmento es chico (pocos frames) para confirmar rápido
+#   - si un segmento sale limpio, el siguiente es más grande y más espaciado
+#   - si aparece fuego/humo por debajo del umbral, se vuelve a muestrear denso
+#   - apenas la confianza de fuego supera el umbral, se deja de analizar
+# ProgressivePlan solo decide qué frames mandar y arma el resultado; las
+# llamadas de red las hacen server.py (síncrono) y async_engine.py (asyncio).
+import threading
+import time
+
+from previews import split_mjpeg_frames
+
+MAX_DETECTIONS = 10
+
+
+class Segment:
+    """Frames muestreados de un tramo del clip, listos para subir como MJPEG"""
+
+    __slots__ = ('number', 'frames', 'stride', 'data')
+
+    def __init__(self, number, frames, stride, data):
+        self.number = number
+        self.frames = frames  # Índices de frame dentro del clip original
+        self.stride = stride
+        self.data = data
+
+
+class ProgressivePlan:
+    """Muestreo adaptativo y criterio de parada para un clip MJPEG"""
+
+    def __init__(self, video_bytes, confirm_confidence=0.6, min_frames=2, max_frames=8,
+                 min_stride=1, initial_stride=4, max_stride=15, max_segments=20):
+        self.data = video_bytes
+        self.spans = split_mjpeg_frames(video_bytes)
+        self.confirm_confidence = confirm_confidence
+        self.min_frames = min_frames
+        self.max_frames = max_frames
+        self.min_stride = min_stride
+        self.max_stride = max_stride
+        self.max_segments = max_segments
+        self.stride = initial_stride
+        self.frames_per_segment = min_frames
+        self.position = 0
+
+        self.timeline = []
+        self.raw = []
+        self.detections = []
+        self.detections_count = 0
+        self.frames_analyzed = 0
+        self.fire_detected = False
+        self.confidence = 0.0
+        self.confirmed = False
+        self.errors = 0
+        self.started = time.perf_counter()
+        self.confirm_ms = None
+
+    @property
+    def frames_total(self):
+        return len(self.spans)
+
+    def _frames_left(self):
+        return self.position < len(self.spans) and len(self.timeline) < self.max_segments
+
+    def next_segment(self):
+        """Siguiente tramo a analizar, o None si ya se confirmó o no quedan frames"""
+        if self.confirmed or not self._frames_left():
+            return None
+        frames = list(range(self.position, len(self.spans), self.stride))[:self.frames_per_segment]
+        self.position = frames[-1] + self.stride
+        data = b''.join(self.data[start:end] for start, end in (self.spans[i] for i in frames))
+        return Segment(len(self.timeline) + 1, frames, self.stride, data)
+
+    def add_result(self, segment, analysis):
+        """
+        Registrar el análisis de un segmento (salida de process_vertex_response)
+        y ajustar la densidad de muestreo. Retorna True si el fuego quedó confirmado.
+        """
+        entry = {
+            "segment": segment.number,
+            "frames": [segment.frames[0], segment.frames[-1]],
+            "stride": segment.stride,
+            "fire_detected": bool(analysis.get('fire_detected')),
+            "confidence": analysis.get('confidence', 0),
+            "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 1),
+        }
+        if analysis.get('error'):
+            entry["error"] = analysis['error']
+            self.errors += 1
+        self.timeline.append(entry)
+        self.raw.append(analysis.get('raw_response'))
+        self.frames_analyzed += len(segment.frames)
+        self.detections_count += analysis.get('detections_count', 0)
+        self.detections.extend(analysis.get('detections', [])[:MAX_DETECTIONS - len(self.detections)])
+
+        if entry["fire_detected"]:
+            self.fire_detected = True
+            self.confidence = max(self.confidence, entry["confidence"])
+
+        if self.confidence >= self.confirm_confidence:
+            self.confirmed = True
+            self.confirm_ms = entry["elapsed_ms"]
+        elif entry["fire_detected"]:
+            # Sospecha sin confirmar: muestreo denso y segmentos cortos
+            self.stride = self.min_stride
+            self.frames_per_segment = self.min_frames
+        elif not entry.get("error"):
+            # Tramo limpio: más espaciado y segmentos más grandes
+            self.stride = min(self.stride * 2, self.max_stride)
+            self.frames_per_segment = min(self.frames_per_segment * 2, self.max_frames)
+        return self.confirmed
+
+    def progress(self):
+        """Resultado parcial (se publica después de cada segmento)"""
+        if self.confirmed:
+            state = "confirmed"
+        elif self._frames_left():
+            state = "running"
+        else:
+            state = "done"
+        return {
+            "state": state,
+            "segments": len(self.timeline),
+            "frames_analyzed": self.frames_analyzed,
+            "frames_total": self.frames_total,
+            "fire_detected": self.fire_detected,
+            "confidence": self.confidence,
+            "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "last_segment": self.timeline[-1] if self.timeline else None,
+        }
+
+    def result(self):
+        """Resultado final con la misma forma que process_vertex_response"""
+        result = {
+            'fire_detected': self.fire_detected,
+            'confidence': self.confidence,
+            'detections_count': self.detections_count,
+            'detections': self.detections,
+            'raw_response': {"timeline": self.timeline, "segments": self.raw},
+            'progressive': {
+                "segments": len(self.timeline),
+                "frames_analyzed": self.frames_analyzed,
+                "frames_total": self.frames_total,
+                "early_exit": self.confirmed and self._frames_left(),  # Quedaban frames sin analizar
+                "confirm_ms": self.confirm_ms,
+                "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 1),
+                "timeline": self.timeline,
+            }
+        }
+        if self.timeline and self.errors == len(self.timeline):
+            result['error'] = self.timeline[-1]['error']
+        return result
+
+
+class _LocalRuns:
+    """Análisis en memoria (sin estado compartido)"""
+
+    def __init__(self):
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def set(self, key, value):
+        with self._lock:
+            self._runs[str(key)] = value
+
+    def items(self):
+        with self._lock:
+            return dict(self._runs)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._runs.pop(str(key), None)
+
+
+class ProgressTracker:
+    """
+    Últimos análisis progresivos (en curso y terminados) para /api/video-analysis/progress.
+    `runs` es un mapa de server.state: con varios procesos, el progreso de un
+    análisis se ve desde cualquiera de ellos.
+    """
+
+    def __init__(self, keep=20, runs=None):
+        self.keep = keep
+        self.runs = runs if runs is not None else _LocalRuns()
+
+    def update(self, video, progress):
+        self.runs.set(video, {"video": video, **progress, "updated": time.time()})
+        runs = self.runs.items()
+        if len(runs) > self.keep:
+            oldest = sorted(runs, key=lambda key: runs[key]["updated"])
+            self.runs.delete(oldest[:len(runs) - self.keep])
+
+    def recent(self):
+        runs = sorted(self.runs.items().values(), key=lambda run: run["updated"], reverse=True)
+        return runs[:self.keep]
@@ -0,0 +1,204 @@
+# recorder.py - Grabación de tráfico entrante (alertas, uploads y análisis) para reproducirlo luego
+#
+# Cada petición a las rutas grabadas se guarda como una línea JSON en un
+# archivo gzip (NDJSON comprimido). La escritura se hace en un hilo aparte
+# para no sumar latencia al request. Se reproduce con `python -m bench.replay`.
+# Con Flask se graba con hooks (init_app); asgi.py llama a record() desde sus
+# handlers async, que no pasan por Flask.
+# Cada proceso necesita su propio archivo (dos escritores gzip sobre el mismo
+# archivo lo corrompen): `{pid}` en la ruta se reemplaza por el pid del proceso
+# y gunicorn.conf.py lo agrega solo con más de un worker.
+import atexit
+import base64
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from flask import g, request
+
+TRACE_VERSION = 1
+
+# Rutas que se graban (las mismas que generan carga costosa)
+RECORDED_PATHS = ('/alert', '/analyze', '/upload/photo', '/upload/video', '/upload/audio')
+
+
+class TraceRecorder:
+    """Graba las peticiones de RECORDED_PATHS en un archivo .jsonl.gz"""
+
+    def __init__(self, path, record_media=False, flush_interval=2.0, client_header='X-Appengine-User-Ip'):
+        self.path = path.replace('{pid}', str(os.getpid()))
+        self.record_media = record_media
+        # Header con la IP del cliente (server.CLIENT_IP_HEADER); replay lo vuelve a mandar
+        self.client_header = client_header
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=10000)
+        self._file = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Registrar hooks de Flask y arrancar el hilo escritor"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # Modo append: gzip admite varios miembros concatenados en un mismo archivo
+        self._file = gzip.open(self.path, 'at', encoding='utf-8')
+        self._write({
+            "type": "header",
+            "version": TRACE_VERSION,
+            "started": datetime.now().isoformat(),
+            "media": self.record_media,
+            "client_header": self.client_header,
+        })
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        print(f"[TRACE] Grabando tráfico en {self.path} (media={'sí' if self.record_media else 'no'})")
+        return self
+
+    def _before_request(self):
+        g._trace_start = time.time()
+
+    def _after_request(self, response):
+        if request.path in RECORDED_PATHS:
+            self.record(
+                request.method, request.path,
+                request.headers.get(self.client_header, request.remote_addr),
+                response.status_code,
+                getattr(g, '_trace_start', time.time()),
+                json_body=request.get_json(silent=True) if request.is_json else None,
+                files=request.files
+            )
+        return response
+
+    def record(self, method, path, client, status, start, json_body=None, files=None):
+        """Encolar un request atendido (`start`: time.time() al recibirlo; `files`: FileStorage por campo)"""
+        try:
+            self._enqueue(self._build_entry(method, path, client, status, start, json_body, files))
+        except Exception as e:
+            print(f"[TRACE ERROR] {e}")
+
+    def _build_entry(self, method, path, client, status, start, json_body, files):
+        entry = {
+            "type": "request",
+            "ts": round(start, 4),
+            "method": method,
+            "path": path,
+            "client": client,
+            "status": status,
+            "duration_ms": round((time.time() - start) * 1000, 1),
+        }
+        if json_body is not None:
+            entry["json"] = json_body
+        if files:
+            entry["files"] = {name: self._describe_file(f) for name, f in files.items()}
+        return entry
+
+    def _describe_file(self, file):
+        """Tamaño y tipo del archivo subido (y contenido en base64 si record_media)"""
+        stream = file.stream
+        stream.seek(0, os.SEEK_END)
+        info = {
+            "filename": file.filename,
+            "content_type": file.content_type,
+            "size": stream.tell(),
+        }
+        if self.record_media:
+            stream.seek(0)
+            info["data"] = base64.b64encode(stream.read()).decode('ascii')
+        return info
+
+    def _enqueue(self, entry):
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self, entry):
+        with self._lock:
+            if self._file:
+                self._file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+    def _writer(self):
+        last_flush = time.time()
+        while self._file:
+            try:
+                entry = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                entry = None
+            if entry is not None:
+                self._write(entry)
+                self.recorded += 1
+            if time.time() - last_flush >= self.flush_interval:
+                with self._lock:
+                    if self._file:
+                        self._file.flush()
+                last_flush = time.time()
+
+    def close(self):
+        """Vaciar la cola y cerrar el archivo"""
+        if not self._file:
+            return
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._write(entry)
+            self.recorded += 1
+        with self._lock:
+            self._file.close()
+            self._file = None
+
+    def stats(self):
+        return {"file": self.path, "recorded": self.recorded, "dropped": self.dropped}
+
+
+def trace_files(paths):
+    """Expandir rutas y patrones (traces/prod.*.jsonl.gz) a la lista de archivos"""
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(path)) or [path])
+    return files
+
+
+def read_trace(*paths):
+    """
+    Leer una o varias grabaciones (por ejemplo, una por worker de gunicorn) y
+    devolver las peticiones de todas, ordenadas por timestamp
+    """
+    entries = []
+    for path in trace_files(paths):
+        entries.extend(_read_requests(path))
+    entries.sort(key=lambda e: e["ts"])
+    return entries
+
+
+def _read_requests(path):
+    entries = []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Línea truncada (proceso terminado a mitad de escritura)
+                if entry.get("type") == "request":
+                    entries.append(entry)
+        except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+            # Último bloque sin cerrar o dañado: se usa lo leído hasta ahí
+            print(f"[TRACE] {path}: lectura cortada ({e.__class__.__name__}), {len(entries)} peticiones")
+    return entries
@@ -0,0 +1,181 @@
+# responses.py - JSON rápido y compresión de respuestas
+#
+# Todas las respuestas de la API pasan por jsonify, y /api/dashboard-data o
+# /analyze (con las respuestas de Vertex AI) son grandes y muy repetitivas.
+# Antes se mandaban sin comprimir y con el encoder por defecto de Flask, que
+# además ordena las claves. Este módulo agrega:
+#   - FastJSONProvider: app.json con orjson si está instalado (o json de la
+#     stdlib compacto), con los mismos tipos especiales que Flask
+#   - Compressor: gzip o brotli según Accept-Encoding, solo para tipos de
+#     texto y cuerpos sobre un tamaño mínimo
+# orjson y brotli vienen en requirements.txt, pero si faltan se usa json de la
+# stdlib y gzip.
+# Ver bench/encoding.py para comparar tiempos y tamaños.
+import gzip
+import json
+import threading
+
+from flask.json.provider import DefaultJSONProvider
+
+COMPRESSIBLE_TYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'text/html',
+    'text/css',
+    'text/csv',
+    'text/plain',
+}
+
+
+# ============================================
+# JSON
+# ============================================
+
+def load_json_backend(name='auto', default=None):
+    """
+    (nombre, función obj -> bytes) del encoder pedido:
+    'orjson', 'stdlib' o 'auto' (orjson si está instalado)
+    """
+    if name in ('auto', 'orjson'):
+        try:
+            import orjson
+        except ImportError:
+            if name == 'orjson':
+                print("[JSON] orjson no instalado; se usa json de la stdlib")
+        else:
+            # Fechas y dataclasses pasan por `default` para serializarse igual que con Flask
+            options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+            return 'orjson', lambda obj: orjson.dumps(obj, default=default, option=options)
+
+    encoder = json.JSONEncoder(default=default, ensure_ascii=False, separators=(',', ':'))
+    return 'stdlib', lambda obj: encoder.encode(obj).encode()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """app.json con un encoder intercambiable (JSON_ENCODER) y sin ordenar claves"""
+
+    sort_keys = False
+
+    def __init__(self, app, backend='auto'):
+        super().__init__(app)
+        self.backend, self.encode = load_json_backend(backend, DefaultJSONProvider.default)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)  # Opciones explícitas (indent, ...): stdlib
+        return self.encode(obj).decode()
+
+    def response(self, *args, **kwargs):
+        # Bytes directo al cuerpo, sin pasar por str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.encode(obj) + b'\n', mimetype=self.mimetype)
+
+
+# ============================================
+# COMPRESION
+# ============================================
+
+def parse_accept_encoding(header):
+    """{codificación: q} de un header Accept-Encoding"""
+    encodings = {}
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[name.strip().lower()] = q
+    return encodings
+
+
+class Compressor:
+    """Compresión gzip/brotli negociada por Accept-Encoding"""
+
+    def __init__(self, min_bytes=1024, gzip_level=6, brotli_quality=5, enabled=True):
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality  # 4-6: buena relación tiempo/tamaño para respuestas dinámicas
+        self.enabled = enabled
+        try:
+            import brotli
+            self._brotli = brotli
+        except ImportError:
+            self._brotli = None
+        self.preference = ('br', 'gzip') if self._brotli else ('gzip',)
+        self.compressed = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.skipped_small = 0
+        self._lock = threading.Lock()
+
+    def negotiate(self, accept_encoding):
+        """Codificación a usar ('br', 'gzip') o None"""
+        if not self.enabled or not accept_encoding:
+            return None
+        accepted = parse_accept_encoding(accept_encoding)
+        for encoding in self.preference:
+            if accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding
+        return None
+
+    def compress(self, body, encoding):
+        if encoding == 'br':
+            return self._brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def encode_body(self, body, mimetype, accept_encoding):
+        """(cuerpo, codificación) para una respuesta completa; codificación None = sin comprimir"""
+        if mimetype not in COMPRESSIBLE_TYPES:
+            return body, None
+        encoding = self.negotiate(accept_encoding)
+        if not encoding:
+            return body, None
+        if len(body) < self.min_bytes:
+            with self._lock:
+                self.skipped_small += 1
+            return body, None
+        data = self.compress(body, encoding)
+        with self._lock:
+            self.compressed[encoding] = self.compressed.get(encoding, 0) + 1
+            self.bytes_in += len(body)
+            self.bytes_out += len(data)
+        return data, encoding
+
+    def init_app(self, app):
+        from flask import request
+
+        @app.after_request
+        def compress_response(response):
+            # Las respuestas en streaming (exportaciones) y los archivos se mandan tal cual
+            if (response.direct_passthrough or response.is_streamed
+                    or response.status_code < 200 or response.status_code in (204, 304)
+                    or 'Content-Encoding' in response.headers
+                    or response.mimetype not in COMPRESSIBLE_TYPES):
+                return response
+            response.vary.add('Accept-Encoding')
+            body, encoding = self.encode_body(response.get_data(), response.mimetype,
+                                              request.headers.get('Accept-Encoding'))
+            if encoding:
+                response.set_data(body)
+                response.headers['Content-Encoding'] = encoding
+            return response
+
+        return self
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "encodings": list(self.preference),
+                "compressed": dict(self.compressed),
+                "skipped_small": self.skipped_small,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "ratio": round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None,
+            }
@@ -1,24 +1,26 @@
 # server.py - Sistema IoT de Detección de Incendios
-from flask import Flask, request, jsonify, render_template
-from datetime import datetime
-import sys
-import os
-import requests
 import time
-import json
-import base64
-import io
+_STARTUP_T0 = time.perf_counter()  # Referencia para el reporte de arranque
+
+from flask import Flask, Response, request, jsonify, render_template
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+import os
+import threading
+import uuid
 from dotenv import load_dotenv
-from google.cloud import storage
-from google.auth import default
-from google.auth.transport.requests import Request
-from google.oauth2 import service_account
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 
-# Suprimir warnings de SSL para ngrok
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+import export
+from admission import AdmissionController, Rejected, process_share
+from analysis_records import AnalysisRecord, GCSBlobStore, LocalBlobStore, RawResponseStore
+from cameras import CameraRegistry
+from media_store import MediaIndex, content_blob_name, content_hash
+from progressive import ProgressTracker
+from responses import Compressor, FastJSONProvider
+from state_store import create_state_store
+
+# google-cloud-storage, google-auth y requests se importan al primer uso
+# (ver ensure_google_clients y http_session) para acelerar el arranque en frío
 
 # Cargar variables de entorno
 load_dotenv()
@@ -35,70 +37,316 @@ APP_URL = os.getenv('APP_URL', 'https://project-iot-481620.ue.r.appspot.com')
 
 # IP Webcam - Captura automática desde celular
 PHONE_IP = os.getenv('PHONE_IP', 'https://populationless-amada-unobservedly.ngrok-free.dev')  # URL pública de ngrok
-CAPTURE_VIDEO = True   # Si capturar video
-CAPTURE_AUDIO = True   # Si capturar audio
-VIDEO_DURATION = 5     # Duración en segundos
+CAPTURE_VIDEO = os.getenv('CAPTURE_VIDEO', 'True') == 'True'   # Si capturar video
+CAPTURE_AUDIO = os.getenv('CAPTURE_AUDIO', 'True') == 'True'   # Si capturar audio
+VIDEO_DURATION = float(os.getenv('DURATION', 5))                # Duración en segundos
+
+# Varias cámaras por zona (JSON, ver cameras.py). Sin definir: una sola cámara en PHONE_IP
+CAMERAS = os.getenv('CAMERAS', '')
+CAMERAS_FILE = os.getenv('CAMERAS_FILE')
+CAMERA_POOL_SIZE = int(os.getenv('CAMERA_POOL_SIZE', 4))               # Conexiones por cámara
+CAMERA_FAILURE_THRESHOLD = int(os.getenv('CAMERA_FAILURE_THRESHOLD', 3))  # Fallas seguidas para marcarla caída
+CAMERA_RETRY_SECONDS = int(os.getenv('CAMERA_RETRY_SECONDS', 60))
+CAPTURE_DEADLINE_SECONDS = float(os.getenv('CAPTURE_DEADLINE_SECONDS', VIDEO_DURATION + 15))  # Plazo total de captura
+CAPTURE_WORKERS = int(os.getenv('CAPTURE_WORKERS', 32))                # Hilos para capturas y análisis en paralelo
+
+N8N_WEBHOOK_RESULT = os.getenv('N8N_WEBHOOK_RESULT', 'https://christiantestcloud.app.n8n.cloud/webhook/send-result')  # Email: "Resultado de verificación"
+
+# Emulador local de Cloud Storage (benchmarks y pruebas con servicios falsos)
+STORAGE_EMULATOR_HOST = os.getenv('STORAGE_EMULATOR_HOST')
+
+# IP del cliente: App Engine la pone en este header (X-Forwarded-For lo puede armar el cliente)
+CLIENT_IP_HEADER = os.getenv('CLIENT_IP_HEADER', 'X-Appengine-User-Ip')
+
+# Grabación de tráfico para reproducirlo con bench/replay.py (opcional)
+TRACE_RECORD_FILE = os.getenv('TRACE_RECORD_FILE')
+TRACE_RECORD_MEDIA = os.getenv('TRACE_RECORD_MEDIA', 'False') == 'True'
+
+trace_recorder = None
+if TRACE_RECORD_FILE:
+    from recorder import TraceRecorder
+    trace_recorder = TraceRecorder(TRACE_RECORD_FILE, record_media=TRACE_RECORD_MEDIA,
+                                   client_header=CLIENT_IP_HEADER).init_app(app)
+
+# Publicación de archivos subidos:
+#   acl    -> objeto público vía predefinedAcl en el mismo upload (1 sola llamada)
+#   bucket -> el bucket ya es público (uniform bucket-level access + IAM allUsers)
+#   signed -> URL firmada V4 generada localmente (requiere cuenta de servicio con clave)
+GCS_PUBLISH_MODE = os.getenv('GCS_PUBLISH_MODE', 'acl')
+SIGNED_URL_TTL_SECONDS = int(os.getenv('SIGNED_URL_TTL_SECONDS', 7 * 24 * 3600))  # Máximo V4: 7 días
+
+# Miniaturas y hojas de contacto para el dashboard (requiere Pillow)
+PREVIEWS_ENABLED = os.getenv('PREVIEWS_ENABLED', 'True') == 'True'
+THUMBNAIL_SIZE = int(os.getenv('THUMBNAIL_SIZE', 320))          # Lado máximo en px
+CONTACT_SHEET_FRAMES = int(os.getenv('CONTACT_SHEET_FRAMES', 6))  # Frames por video
+
+# Análisis de video:
+#   progressive -> segmentos cortos de frames muestreados, se detiene al confirmar fuego (solo MJPEG)
+#   full        -> el clip completo en una sola llamada
+VIDEO_ANALYSIS_MODE = os.getenv('VIDEO_ANALYSIS_MODE', 'progressive')
+FIRE_CONFIRM_CONFIDENCE = float(os.getenv('FIRE_CONFIRM_CONFIDENCE', 0.6))  # Umbral para dejar de analizar
+SEGMENT_PREFIX = 'videos/segments'  # Segmentos privados; se borran al analizarlos (ver README)
+
+# Respuestas crudas de Vertex AI (ver /api/analysis/<id>/raw):
+#   gcs   -> objetos privados en BUCKET_NAME bajo analysis/raw/
+#   local -> archivos en RAW_RESPONSE_DIR (desarrollo)
+RAW_RESPONSE_STORE = os.getenv('RAW_RESPONSE_STORE', 'gcs')
+RAW_RESPONSE_DIR = os.getenv('RAW_RESPONSE_DIR', '/tmp/analysis_raw')
+
+# Control de admisión de los pipelines de captura + Vertex AI (/alert, /api/test-alert, /analyze).
+# Límites de la instancia: con gunicorn, cada uno de los WEB_WORKERS procesos
+# aplica su parte (ver admission.process_share)
+PIPELINE_MAX_ACTIVE = int(os.getenv('PIPELINE_MAX_ACTIVE', 8))          # En curso en la instancia
+PIPELINE_MAX_PER_CLIENT = int(os.getenv('PIPELINE_MAX_PER_CLIENT', 2))  # En curso o en cola por cliente
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 16))         # En cola en la instancia
+PIPELINE_QUEUE_TIMEOUT = float(os.getenv('PIPELINE_QUEUE_TIMEOUT', 30))  # Espera máxima en la cola
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', 1))  # Procesos de la instancia (lo define gunicorn.conf.py)
+
+# Respuestas de la API (ver responses.py):
+#   JSON_ENCODER: auto (orjson si está instalado), orjson o stdlib
+#   gzip/brotli según Accept-Encoding para cuerpos de texto desde COMPRESSION_MIN_BYTES
+JSON_ENCODER = os.getenv('JSON_ENCODER', 'auto')
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'True') == 'True'
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 5))
 
-N8N_WEBHOOK_RESULT = 'https://christiantestcloud.app.n8n.cloud/webhook/send-result'  # Email: "Resultado de verificación"
+app.json = FastJSONProvider(app, JSON_ENCODER)
+compressor = Compressor(
+    min_bytes=COMPRESSION_MIN_BYTES,
+    gzip_level=GZIP_LEVEL,
+    brotli_quality=BROTLI_QUALITY,
+    enabled=COMPRESSION_ENABLED
+).init_app(app)
 
-# Cliente de autenticación
+# Estado compartido: historial, ids, contadores y cooldown (ver state_store.py)
+#   memory -> en el proceso (un solo proceso)
+#   sqlite -> archivo compartido por los procesos de la instancia (gunicorn.conf.py)
+#   redis  -> compartido por todas las instancias (REDIS_URL, p. ej. Memorystore)
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory')
+STATE_SQLITE_PATH = os.getenv('STATE_SQLITE_PATH', '/tmp/iot_state.sqlite3')
+REDIS_URL = os.getenv('REDIS_URL')
+
+# Conexiones HTTP salientes (cámara, Vertex AI, n8n)
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 20))
+
+# Reporte de tiempos de arranque (ver /api/startup-report)
+startup_report = {
+    "imports_ms": round((time.perf_counter() - _STARTUP_T0) * 1000, 1),
+    "module_ready_ms": None,
+    "google_clients_ms": None,
+    "warmup_ms": None,
+    "first_request": None
+}
+
+# Cliente de autenticación (se inicializan de forma perezosa)
 credentials = None
+credentials_manager = None
 storage_client = None
+_bucket_cache = {}
+_emulator_mode = False
+_can_sign = False
+_google_init_done = False
+_google_lock = threading.Lock()
+
+_http_session = None
+_http_lock = threading.Lock()
 
 def init_google_clients():
     """Inicializar clientes de Google Cloud"""
-    global credentials, storage_client
+    global credentials, credentials_manager, storage_client, _emulator_mode, _can_sign
     try:
+        from google.cloud import storage
+        from google.auth.credentials import AnonymousCredentials, Signing
+        if STORAGE_EMULATOR_HOST:
+            # Sin credenciales reales: el emulador acepta peticiones anónimas
+            credentials = AnonymousCredentials()
+            storage_client = storage.Client(project='local', credentials=credentials)
+            _emulator_mode = True
+            print(f"[AUTH] Usando emulador de Storage: {STORAGE_EMULATOR_HOST}")
+            return True
+        from google.auth import default
+        from credentials_manager import CredentialsManager
         credentials, project = default(scopes=[
             'https://www.googleapis.com/auth/cloud-platform',
             'https://www.googleapis.com/auth/devstorage.full_control',
             'https://www.googleapis.com/auth/gmail.send'
         ])
+        # Token refrescado en segundo plano antes de expirar
+        credentials_manager = CredentialsManager(credentials).start()
         storage_client = storage.Client(credentials=credentials)
+        _can_sign = isinstance(credentials, Signing)
         print(f"[AUTH] Credenciales inicializadas para proyecto: {project}")
+        if GCS_PUBLISH_MODE == 'signed' and not _can_sign:
+            print("[AUTH] Las credenciales no pueden firmar localmente; se usarán URLs públicas")
         return True
     except Exception as e:
         print(f"[AUTH ERROR] {e}")
         return False
 
-# Inicializar al cargar
-init_google_clients()
+def ensure_google_clients():
+    """Inicializar los clientes de Google la primera vez que se necesitan"""
+    global _google_init_done
+    if not _google_init_done:
+        with _google_lock:
+            if not _google_init_done:
+                start = time.perf_counter()
+                init_google_clients()
+                startup_report["google_clients_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                _google_init_done = True
+    return storage_client is not None
+
+def new_http_session(pool_size, pool_connections=10):
+    """Sesión requests con su propio pool de conexiones"""
+    import requests
+    import urllib3
+    # Suprimir warnings de SSL para ngrok
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def http_session():
+    """Sesión requests compartida con pool de conexiones (se crea al primer uso)"""
+    global _http_session
+    if _http_session is None:
+        with _http_lock:
+            if _http_session is None:
+                _http_session = new_http_session(HTTP_POOL_SIZE)
+    return _http_session
+
+def camera_session(pool_size):
+    """Sesión de una cámara: un solo host, sin verificación SSL (ngrok)"""
+    session = new_http_session(pool_size, pool_connections=1)
+    session.verify = False
+    return session
 
-def get_auth_token():
-    """Obtener token de autenticación actualizado"""
-    global credentials
+def load_cameras():
+    config = CAMERAS
+    if CAMERAS_FILE:
+        with open(CAMERAS_FILE) as f:
+            config = f.read()
+    registry = CameraRegistry.from_config(
+        config, PHONE_IP,
+        session_factory=camera_session,
+        pool_size=CAMERA_POOL_SIZE,
+        failure_threshold=CAMERA_FAILURE_THRESHOLD,
+        retry_seconds=CAMERA_RETRY_SECONDS
+    )
+    print(f"[CAMERAS] {len(registry.cameras)} cámara(s): {', '.join(c.name for c in registry.cameras)}")
+    return registry
+
+cameras = load_cameras()
+
+_fanout_pool = None
+
+def fanout_pool():
+    """Pool de hilos para capturar y analizar varias cámaras en paralelo (se crea al primer uso)"""
+    global _fanout_pool
+    if _fanout_pool is None:
+        with _http_lock:
+            if _fanout_pool is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _fanout_pool = ThreadPoolExecutor(max_workers=CAPTURE_WORKERS, thread_name_prefix='fanout')
+    return _fanout_pool
+
+def get_auth_token(block=True):
+    """
+    Obtener token de autenticación vigente (lo refresca CredentialsManager
+    en segundo plano). Con block=False retorna None en vez de esperar un refresh
+    o la inicialización de los clientes de Google (async_engine la hace en un hilo).
+    """
+    if not block and not _google_init_done:
+        return None
     try:
-        if credentials:
-            if not credentials.valid:
-                credentials.refresh(Request())
-            return credentials.token
+        ensure_google_clients()
+        if _emulator_mode:
+            return 'emulator-token'
+        if credentials_manager:
+            return credentials_manager.get_token(block)
         return None
     except Exception as e:
         print(f"[AUTH ERROR] {e}")
         return None
 
-# Historial
-alertas = []
-analysis_history = []
+def get_bucket(bucket_name=None):
+    """Handle del bucket, creado una sola vez por nombre"""
+    ensure_google_clients()
+    bucket_name = bucket_name or BUCKET_NAME
+    bucket = _bucket_cache.get(bucket_name)
+    if bucket is None:
+        bucket = _bucket_cache.setdefault(bucket_name, storage_client.bucket(bucket_name))
+    return bucket
+
+def warmup():
+    """
+    Preparar la instancia antes del primer request real: clientes de Google,
+    token de acceso y conexiones abiertas en los pools hacia Vertex AI, GCS,
+    n8n y la cámara.
+    """
+    start = time.perf_counter()
+    ensure_google_clients()
+    get_auth_token()
+    
+    targets = [(http_session(), url) for url in (VERTEX_AI_ENDPOINT, N8N_WEBHOOK_RESULT)]
+    targets += [(camera.session(), camera.url) for camera in cameras.cameras]
+    for session, url in targets:
+        parts = urlsplit(url)
+        try:
+            session.head(f"{parts.scheme}://{parts.netloc}/", timeout=5, verify=False)
+        except Exception as e:
+            print(f"[WARMUP] {parts.netloc}: {e}")
+    
+    # La sesión autorizada del cliente de Storage abre su propia conexión
+    try:
+        get_bucket().blob('_warmup').exists()
+    except Exception as e:
+        print(f"[WARMUP] Storage: {e}")
+    
+    startup_report["warmup_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    print(f"[WARMUP] Instancia lista en {startup_report['warmup_ms']} ms")
+    return startup_report
+
+# Historial: alertas (dicts) y análisis (AnalysisRecord, ver analysis_records.py)
+state = create_state_store(
+    STATE_BACKEND,
+    codecs={'analyses': (AnalysisRecord.to_state, AnalysisRecord.from_state)},
+    sqlite_path=STATE_SQLITE_PATH,
+    redis_url=REDIS_URL
+)
+
+# Progreso de los análisis de video progresivos (ver /api/video-analysis/progress)
+video_progress = ProgressTracker(runs=state.map('video_progress'))
 
 # Control de throttling para alertas (evitar spam de emails)
-last_alert_time = 0
-ALERT_COOLDOWN_SECONDS = 60  # Solo enviar un email cada 60 segundos
+ALERT_COOLDOWN_SECONDS = int(os.getenv('ALERT_COOLDOWN_SECONDS', 60))  # Solo enviar un email cada 60 segundos
+
+# Pipelines en curso y en cola (ver admission.py)
+admission = AdmissionController(
+    max_active=process_share(PIPELINE_MAX_ACTIVE, WEB_WORKERS),
+    max_per_client=process_share(PIPELINE_MAX_PER_CLIENT, WEB_WORKERS),
+    max_queue=process_share(PIPELINE_QUEUE_SIZE, WEB_WORKERS),
+    queue_timeout=PIPELINE_QUEUE_TIMEOUT
+)
 
 # ============================================
 # FUNCIONES DE CAPTURA DESDE IP WEBCAM
 # ============================================
 
-def capture_photo_from_phone():
+def capture_photo_from_phone(camera=None):
     """Captura foto desde IP Webcam"""
+    camera = camera or cameras.primary()
     try:
-        print("   [PHOTO] Capturando desde IP Webcam...")
-        url = f"{PHONE_IP}/photo.jpg"
+        print(f"   [PHOTO] Capturando desde {camera.name}...")
+        url = f"{camera.url}/photo.jpg"
         
-        response = requests.get(url, timeout=10, verify=False)  # verify=False para ngrok
+        start = time.perf_counter()
+        response = camera.session().get(url, timeout=10)
         if response.status_code == 200:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            blob_name = f"photos/photo_{timestamp}.jpg"
+            camera.record_success((time.perf_counter() - start) * 1000)
+            blob_name = content_blob_name('photos', response.content, 'jpg')
             
             # Subir directamente a Cloud Storage
             public_url, gcs_uri = upload_bytes_to_cloud_storage(
@@ -110,75 +358,78 @@ def capture_photo_from_phone():
             print(f"   [PHOTO] ✓ Capturada y subida: {public_url}")
             return public_url, gcs_uri
         else:
+            camera.record_failure(f"photo: HTTP {response.status_code}")
             print(f"   [PHOTO] ✗ Error {response.status_code}")
             return None, None
             
     except Exception as e:
-        print(f"   [PHOTO ERROR] {e}")
+        camera.record_failure(f"photo: {e}")
+        print(f"   [PHOTO ERROR] {camera.name}: {e}")
         return None, None
 
-def capture_video_from_phone(duration=5):
-    """Captura video desde IP Webcam (MJPEG stream)"""
-    try:
-        print(f"   [VIDEO] Capturando {duration}s desde IP Webcam...")
-        url = f"{PHONE_IP}/video"
-        
-        response = requests.get(url, stream=True, timeout=15, verify=False)  # verify=False para ngrok
+def read_camera_stream(camera, path, duration):
+    """Leer un stream (MJPEG/WAV) de la cámara durante `duration` segundos"""
+    data = bytearray()
+    start = time.perf_counter()
+    
+    # El context manager devuelve la conexión al pool al cortar el stream
+    with camera.session().get(f"{camera.url}{path}", stream=True, timeout=15) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        camera.record_success((time.perf_counter() - start) * 1000)
         start_time = time.time()
-        
-        video_data = bytearray()
-        
         for chunk in response.iter_content(chunk_size=8192):
             if chunk:
-                video_data.extend(chunk)
+                data.extend(chunk)
             if time.time() - start_time >= duration:
                 break
+    return bytes(data)
+
+def capture_video_from_phone(duration=5, camera=None):
+    """
+    Captura video desde IP Webcam (MJPEG stream).
+    Retorna (public_url, gcs_uri, bytes del clip): el análisis progresivo parte
+    el clip en memoria en vez de volver a bajarlo de GCS.
+    """
+    camera = camera or cameras.primary()
+    try:
+        print(f"   [VIDEO] Capturando {duration}s desde {camera.name}...")
+        video_data = read_camera_stream(camera, '/video', duration)
         
         if len(video_data) > 0:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            blob_name = f"videos/video_{timestamp}.mjpeg"
+            blob_name = content_blob_name('videos', video_data, 'mjpeg')
             
             # Subir a Cloud Storage (el formato MJPEG es soportado por Vertex AI)
             public_url, gcs_uri = upload_bytes_to_cloud_storage(
-                bytes(video_data),
+                video_data,
                 blob_name,
                 'video/x-motion-jpeg'
             )
             
             print(f"   [VIDEO] ✓ Capturado y subido: {public_url}")
-            return public_url, gcs_uri
+            return public_url, gcs_uri, video_data
         else:
             print("   [VIDEO] ✗ No se capturó data")
-            return None, None
+            return None, None, None
             
     except Exception as e:
-        print(f"   [VIDEO ERROR] {e}")
-        return None, None
+        camera.record_failure(f"video: {e}")
+        print(f"   [VIDEO ERROR] {camera.name}: {e}")
+        return None, None, None
 
-def capture_audio_from_phone(duration=5):
+def capture_audio_from_phone(duration=5, camera=None):
     """Captura audio desde IP Webcam"""
+    camera = camera or cameras.primary()
     try:
-        print(f"   [AUDIO] Capturando {duration}s desde IP Webcam...")
-        url = f"{PHONE_IP}/audio.wav"
-        
-        response = requests.get(url, stream=True, timeout=15, verify=False)  # verify=False para ngrok
-        start_time = time.time()
-        
-        audio_data = bytearray()
-        
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                audio_data.extend(chunk)
-            if time.time() - start_time >= duration:
-                break
+        print(f"   [AUDIO] Capturando {duration}s desde {camera.name}...")
+        audio_data = read_camera_stream(camera, '/audio.wav', duration)
         
         if len(audio_data) > 0:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            blob_name = f"audio/audio_{timestamp}.wav"
+            blob_name = content_blob_name('audio', audio_data, 'wav')
             
             # Subir a Cloud Storage
             public_url, gcs_uri = upload_bytes_to_cloud_storage(
-                bytes(audio_data),
+                audio_data,
                 blob_name,
                 'audio/wav'
             )
@@ -190,100 +441,115 @@ def capture_audio_from_phone(duration=5):
             return None, None
             
     except Exception as e:
-        print(f"   [AUDIO ERROR] {e}")
+        camera.record_failure(f"audio: {e}")
+        print(f"   [AUDIO ERROR] {camera.name}: {e}")
         return None, None
 
-def process_alert_with_capture():
+def capture_jobs(camera_list):
+    """(cámara, tipo, función, argumentos) de cada captura de una alerta"""
+    jobs = []
+    for camera in camera_list:
+        jobs.append((camera, "photo", capture_photo_from_phone, (camera,)))
+        if CAPTURE_VIDEO:
+            jobs.append((camera, "video", capture_video_from_phone, (VIDEO_DURATION, camera)))
+        if CAPTURE_AUDIO:
+            jobs.append((camera, "audio", capture_audio_from_phone, (VIDEO_DURATION, camera)))
+    return jobs
+
+def capture_timed_out(camera, kind):
+    camera.record_failure(f"{kind}: sin terminar en {CAPTURE_DEADLINE_SECONDS}s")
+    print(f"   [CAPTURE] {camera.name}/{kind} excedió el plazo de {CAPTURE_DEADLINE_SECONDS}s")
+
+def capture_from_cameras(camera_list):
+    """
+    Capturar foto, video y audio de todas las cámaras en paralelo, con un plazo
+    total de CAPTURE_DEADLINE_SECONDS (lo que no terminó a tiempo se descarta).
+    Retorna ({cámara: {tipo: (public_url, gcs_uri)}}, {gcs_uri: bytes de cada video}).
+    """
+    from concurrent.futures import wait
+    
+    futures = {
+        fanout_pool().submit(function, *args): (camera, kind)
+        for camera, kind, function, args in capture_jobs(camera_list)
+    }
+    done, pending = wait(futures, timeout=CAPTURE_DEADLINE_SECONDS)
+    
+    captures = {camera.name: {} for camera in camera_list}
+    for future in done:
+        camera, kind = futures[future]
+        captures[camera.name][kind] = future.result()
+    for future in pending:
+        future.cancel()
+        capture_timed_out(*futures[future])
+    return split_clips(captures)
+
+def split_clips(captures):
+    """Separar los bytes de los videos de las capturas: {gcs_uri: bytes}"""
+    clips = {}
+    for media in captures.values():
+        if "video" in media:
+            public_url, gcs_uri, data = media["video"]
+            media["video"] = (public_url, gcs_uri)
+            if gcs_uri and data:
+                clips[gcs_uri] = data
+    return captures, clips
+
+def analyze_captures(captures, clips=None):
+    """
+    Analizar con Vertex AI las capturas de todas las cámaras: las fotos van
+    juntas en una sola llamada batch y los videos se analizan en paralelo
+    (con los bytes de `clips` si ya están en memoria).
+    Retorna (results, files_info).
+    """
+    clips = clips or {}
+    photos = gcs_uris_of(captures, "photo")
+    videos = gcs_uris_of(captures, "video")
+    pool = fanout_pool()
+    
+    if photos:
+        print(f"\n[VERTEX AI] Analizando {len(photos)} foto(s) en una llamada...")
+        photo_future = pool.submit(predict_images_from_gcs, list(photos.values()))
+    if videos:
+        print(f"\n[VERTEX AI] Analizando {len(videos)} video(s)...")
+        video_futures = {name: pool.submit(predict_video, uri, clips.get(uri)) for name, uri in videos.items()}
+    
+    photo_batch, photo_by_camera = None, {}
+    if photos:
+        photo_batch, per_image = photo_future.result()
+        photo_by_camera = dict(zip(photos, per_image))
+    video_by_camera = {name: future.result() for name, future in video_futures.items()} if videos else {}
+    
+    return build_camera_results(captures, photo_batch, photo_by_camera, video_by_camera)
+
+def link_alert_media(alert_id, captures):
+    """Asociar los archivos capturados a la alerta (tipo "cámara:foto" si hay varias cámaras)"""
+    media_index.link_alert(alert_id, {
+        kind if len(captures) == 1 else f"{name}:{kind}": gcs_uri
+        for name, media in captures.items()
+        for kind, (_, gcs_uri) in media.items()
+    })
+
+def process_alert_with_capture(alert_id=None, zone=None, device=None):
     """
-    Función principal: captura foto, video y audio automáticamente,
-    analiza con Vertex AI y envía email de resultado
+    Función principal: captura foto, video y audio automáticamente de las
+    cámaras de la zona, analiza con Vertex AI y envía email de resultado
     """
     try:
-        print("\nPROCESANDO ALERTA - CAPTURA AUTOMÁTICA")
-        
-        # 1. Capturar multimedia desde el celular
-        photo_url, photo_gcs = capture_photo_from_phone()
-        
-        video_url, video_gcs = None, None
-        if CAPTURE_VIDEO:
-            video_url, video_gcs = capture_video_from_phone(VIDEO_DURATION)
+        camera_list = cameras.for_zone(zone)
+        print(f"\nPROCESANDO ALERTA - CAPTURA AUTOMÁTICA ({len(camera_list)} cámara(s), zona: {zone or 'todas'})")
         
-        audio_url, audio_gcs = None, None
-        if CAPTURE_AUDIO:
-            audio_url, audio_gcs = capture_audio_from_phone(VIDEO_DURATION)
+        # 1. Capturar multimedia de todas las cámaras en paralelo
+        captures, clips = capture_from_cameras(camera_list)
         
         # 2. Analizar con Vertex AI
-        results = {
-            "timestamp": datetime.now().isoformat(),
-            "photo_analysis": None,
-            "video_analysis": None,
-            "fire_detected": False,
-            "confidence": 0.0
-        }
-        
-        files_info = {}
-        
-        # Analizar foto
-        if photo_gcs:
-            print(f"\n[VERTEX AI] Analizando foto...")
-            photo_result = predict_image_from_gcs(photo_gcs)
-            results["photo_analysis"] = photo_result
-            files_info["photo"] = photo_url
-            
-            if photo_result.get('fire_detected'):
-                results["fire_detected"] = True
-                results["confidence"] = max(results["confidence"], photo_result.get('confidence', 0))
-        
-        # Analizar video
-        if video_gcs:
-            print(f"\n[VERTEX AI] Analizando video...")
-            video_result = predict_video_from_gcs(video_gcs)
-            results["video_analysis"] = video_result
-            files_info["video"] = video_url
-            
-            if video_result.get('fire_detected'):
-                results["fire_detected"] = True
-                results["confidence"] = max(results["confidence"], video_result.get('confidence', 0))
-        
-        if audio_url:
-            files_info["audio"] = audio_url
+        results, files_info = analyze_captures(captures, clips)
+        link_alert_media(alert_id, captures)
         
         # 3. Guardar en historial
-        record = {
-            "id": len(analysis_history) + 1,
-            "timestamp": results["timestamp"],
-            "files": files_info,
-            "fire_detected": results["fire_detected"],
-            "confidence": results["confidence"],
-            "photo_analysis": results["photo_analysis"],
-            "video_analysis": results["video_analysis"]
-        }
-        analysis_history.append(record)
+        save_analysis_record(results, files_info, alert_id, device)
         
         # 4. Enviar email de RESULTADO
-        if results["fire_detected"]:
-            status_text = "INCENDIO CONFIRMADO"
-            status_bg_color = "#dc2626"  # Rojo
-            user_response = f"Vertex AI detectó fuego con {results['confidence']:.1%} de Precisión"
-            print(f"\n[RESULTADO] 🔥 FUEGO DETECTADO - Precisión: {results['confidence']:.1%}")
-        else:
-            status_text = "FALSA ALARMA"
-            status_bg_color = "#22c55e"  # Verde
-            user_response = f"Vertex AI no detectó fuego (Precisión: {results['confidence']:.1%})"
-            print(f"\n[RESULTADO] ✅ SIN FUEGO - Precisión: {results['confidence']:.1%}")
-        
-        result_data = {
-            "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            "user_confirmed": results["fire_detected"],
-            "is_false_alarm": not results["fire_detected"],
-            "status_text": status_text,
-            "status_bg_color": status_bg_color,
-            "user_response": user_response,
-            "photo_url": files_info.get("photo", ""),
-            "video_url": files_info.get("video", ""),
-            "audio_url": files_info.get("audio", ""),
-            "dashboard_url": f"{APP_URL}/dashboard"
-        }
+        result_data = build_result_data(results, files_info, "[RESULTADO]")
         
         send_n8n_result(result_data)
         
@@ -301,29 +567,44 @@ def process_alert_with_capture():
 # FUNCIONES CLOUD STORAGE
 # ============================================
 
+media_index = MediaIndex(links=state.map('alert_media'))
+
+def upload_options():
+    """Parámetros extra del upload según GCS_PUBLISH_MODE"""
+    if GCS_PUBLISH_MODE == 'acl':
+        return {"predefined_acl": "publicRead"}
+    return {}
+
+def public_url_for(blob):
+    """URL de acceso para un blob subido, sin llamadas de red"""
+    if GCS_PUBLISH_MODE == 'signed' and _can_sign:
+        return blob.generate_signed_url(
+            version='v4',
+            expiration=timedelta(seconds=SIGNED_URL_TTL_SECONDS),
+            method='GET',
+            credentials=credentials
+        )
+    return blob.public_url
+
 def upload_to_cloud_storage(file_data, destination_blob_name, content_type='application/octet-stream'):
     """Sube datos de archivo a Google Cloud Storage"""
     try:
-        if not storage_client:
+        if not ensure_google_clients():
             print("[CLOUD ERROR] Storage client no inicializado")
             return None, None
         
-        bucket = storage_client.bucket(BUCKET_NAME)
-        blob = bucket.blob(destination_blob_name)
+        blob = get_bucket().blob(destination_blob_name)
         
         # Si file_data es bytes, subir directamente
         if isinstance(file_data, bytes):
-            blob.upload_from_string(file_data, content_type=content_type)
+            blob.upload_from_string(file_data, content_type=content_type, **upload_options())
         else:
             # Si es un path, subir desde archivo
-            blob.upload_from_filename(file_data, content_type=content_type)
-        
-        # Hacer público
-        blob.make_public()
+            blob.upload_from_filename(file_data, content_type=content_type, **upload_options())
         
         # Generar URI de GCS (formato que Vertex AI necesita)
         gcs_uri = f"gs://{BUCKET_NAME}/{destination_blob_name}"
-        public_url = blob.public_url
+        public_url = public_url_for(blob)
         
         print(f"[CLOUD] Subido: {gcs_uri}")
         return public_url, gcs_uri
@@ -334,23 +615,40 @@ def upload_to_cloud_storage(file_data, destination_blob_name, content_type='appl
         traceback.print_exc()
         return None, None
 
-def upload_bytes_to_cloud_storage(file_bytes, destination_blob_name, content_type):
-    """Sube bytes directamente a Cloud Storage"""
+def upload_bytes_to_cloud_storage(file_bytes, destination_blob_name, content_type, cache_control=None, make_previews=True):
+    """Sube bytes directamente a Cloud Storage (una sola llamada: el ACL va en el upload)"""
     try:
-        if not storage_client:
+        if not ensure_google_clients():
             print("[CLOUD ERROR] Storage client no inicializado")
             return None, None
         
-        bucket = storage_client.bucket(BUCKET_NAME)
-        blob = bucket.blob(destination_blob_name)
-        
-        blob.upload_from_string(file_bytes, content_type=content_type)
-        blob.make_public()
+        from google.api_core.exceptions import PreconditionFailed
         
+        blob = get_bucket().blob(destination_blob_name)
         gcs_uri = f"gs://{BUCKET_NAME}/{destination_blob_name}"
-        public_url = blob.public_url
+        public_url = public_url_for(blob)
+        
+        # Objeto ya subido por este proceso: sin ir a la red. Si no, el upload
+        # create-only (ifGenerationMatch=0) resuelve los duplicados con un 412
+        if media_index.contains(destination_blob_name):
+            media_index.record_hit(destination_blob_name, len(file_bytes), content_type)
+            print(f"[CLOUD] Ya existe, sin upload: {gcs_uri}")
+            return public_url, gcs_uri
+        
+        if cache_control:
+            blob.cache_control = cache_control
+        try:
+            # ifGenerationMatch=0: solo crear, nunca sobrescribir
+            blob.upload_from_string(file_bytes, content_type=content_type, if_generation_match=0, **upload_options())
+        except PreconditionFailed:
+            media_index.record_hit(destination_blob_name, len(file_bytes), content_type)
+            print(f"[CLOUD] Ya existe (412), sin sobrescribir: {gcs_uri}")
+            return public_url, gcs_uri
         
+        media_index.record_upload(destination_blob_name, len(file_bytes), content_type)
         print(f"[CLOUD] Subido: {gcs_uri}")
+        if make_previews:
+            schedule_previews(file_bytes, destination_blob_name, content_type, public_url, gcs_uri)
         return public_url, gcs_uri
         
     except Exception as e:
@@ -359,6 +657,34 @@ def upload_bytes_to_cloud_storage(file_bytes, destination_blob_name, content_typ
         traceback.print_exc()
         return None, None
 
+# ============================================
+# PREVIEWS (MINIATURAS Y HOJAS DE CONTACTO)
+# ============================================
+
+def upload_preview(preview_bytes, blob_name, content_type):
+    """Subir un preview: caché inmutable y sin generar previews del preview"""
+    from previews import PREVIEW_CACHE_CONTROL
+    return upload_bytes_to_cloud_storage(preview_bytes, blob_name, content_type,
+                                         cache_control=PREVIEW_CACHE_CONTROL, make_previews=False)
+
+preview_generator = None
+if PREVIEWS_ENABLED:
+    from previews import PreviewGenerator
+    preview_generator = PreviewGenerator(upload_preview, thumb_size=THUMBNAIL_SIZE, sheet_frames=CONTACT_SHEET_FRAMES,
+                                         index=state.map('previews'))
+
+def schedule_previews(file_bytes, blob_name, content_type, public_url, gcs_uri):
+    """Generar el preview de un archivo recién subido en segundo plano"""
+    if preview_generator:
+        preview_generator.schedule(file_bytes, blob_name, content_type, public_url, gcs_uri)
+
+def with_previews(records):
+    """Copias de los análisis con las URLs de sus previews (si ya se generaron)"""
+    if not preview_generator:
+        return records
+    previews = preview_generator.lookup_many([record.get("files") for record in records])
+    return [{**record, "previews": found} for record, found in zip(records, previews)]
+
 # ============================================
 # FUNCIONES VERTEX AI (siguiendo ejemplo del colab)
 # ============================================
@@ -368,6 +694,18 @@ def predict_image_from_gcs(image_gcs_uri):
     Analizar imagen desde Google Cloud Storage
     Siguiendo el formato del ejemplo: gs://bucket/path/to/image.jpg
     """
+    analysis, _ = predict_images_from_gcs([image_gcs_uri])
+    return analysis
+
+def predict_images_from_gcs(image_gcs_uris):
+    """
+    Analizar varias imágenes en una sola llamada (una instancia por imagen).
+    Retorna (análisis combinado, [análisis de cada imagen])
+    """
+    analysis = _predict_images(image_gcs_uris)
+    return analysis, split_batch_analysis(analysis, len(image_gcs_uris))
+
+def _predict_images(image_gcs_uris):
     try:
         auth_token = get_auth_token()
         if not auth_token:
@@ -375,7 +713,7 @@ def predict_image_from_gcs(image_gcs_uri):
         
         payload = {
             "instances": [
-                {"image_url": image_gcs_uri}
+                {"image_url": image_gcs_uri} for image_gcs_uri in image_gcs_uris
             ]
         }
         
@@ -384,9 +722,9 @@ def predict_image_from_gcs(image_gcs_uri):
             "Content-Type": "application/json"
         }
         
-        print(f"[VERTEX AI] Analizando imagen: {image_gcs_uri}")
+        print(f"[VERTEX AI] Analizando imagen: {', '.join(image_gcs_uris)}")
         
-        response = requests.post(
+        response = http_session().post(
             VERTEX_AI_ENDPOINT,
             headers=headers,
             json=payload,
@@ -406,7 +744,7 @@ def predict_image_from_gcs(image_gcs_uri):
         print(f"[VERTEX AI ERROR] {e}")
         return {"error": str(e), "fire_detected": False, "confidence": 0}
 
-def predict_video_from_gcs(video_gcs_uri, frame_interval=15, max_detections=10, analyze_audio=True):
+def predict_video_from_gcs(video_gcs_uri, frame_interval=15, max_detections=10, analyze_audio=True, timeout=300):
     """
     Analizar video desde Google Cloud Storage
     Siguiendo el formato del ejemplo: gs://bucket/path/to/video.mp4
@@ -435,11 +773,11 @@ def predict_video_from_gcs(video_gcs_uri, frame_interval=15, max_detections=10,
         
         print(f"[VERTEX AI] Analizando video: {video_gcs_uri}")
         
-        response = requests.post(
+        response = http_session().post(
             VERTEX_AI_ENDPOINT,
             headers=headers,
             json=payload,
-            timeout=300
+            timeout=timeout
         )
         
         print(f"[VERTEX AI] Response status: {response.status_code}")
@@ -455,6 +793,97 @@ def predict_video_from_gcs(video_gcs_uri, frame_interval=15, max_detections=10,
         print(f"[VERTEX AI ERROR] {e}")
         return {"error": str(e), "fire_detected": False, "confidence": 0}
 
+def progressive_plan_for(video_bytes):
+    """Plan de análisis progresivo, o None si el video no se puede partir en frames"""
+    from progressive import ProgressivePlan
+    plan = ProgressivePlan(video_bytes, confirm_confidence=FIRE_CONFIRM_CONFIDENCE)
+    return plan if plan.frames_total else None
+
+def gcs_object_name(gcs_uri):
+    """gs://BUCKET_NAME/<nombre> -> <nombre> (None si es de otro bucket)"""
+    prefix = f"gs://{BUCKET_NAME}/"
+    return gcs_uri[len(prefix):] if gcs_uri and gcs_uri.startswith(prefix) else None
+
+def predict_video(video_gcs_uri, video_bytes=None):
+    """
+    Analizar un video según VIDEO_ANALYSIS_MODE (los .webm siempre van completos).
+    Sin `video_bytes` (archivos subidos por /analyze) el clip se baja de GCS.
+    """
+    name = gcs_object_name(video_gcs_uri)
+    if VIDEO_ANALYSIS_MODE == 'progressive' and name and name.endswith('.mjpeg'):
+        try:
+            plan = progressive_plan_for(video_bytes or get_bucket().blob(name).download_as_bytes())
+            if plan:
+                return predict_video_progressive(plan, video_gcs_uri)
+        except Exception as e:
+            print(f"[VERTEX AI] Análisis progresivo no disponible ({e}); se analiza el clip completo")
+    return predict_video_from_gcs(video_gcs_uri)
+
+def predict_video_progressive(plan, video_gcs_uri):
+    """Analizar los segmentos del plan en orden hasta confirmar fuego o agotar el clip"""
+    print(f"[VERTEX AI] Análisis progresivo: {video_gcs_uri} ({plan.frames_total} frames)")
+    while True:
+        segment = plan.next_segment()
+        if segment is None:
+            break
+        blob_name = segment_blob_name(segment.data)
+        segment_gcs = upload_segment(segment.data, blob_name)
+        if segment_gcs:
+            analysis = predict_video_from_gcs(segment_gcs, frame_interval=1, max_detections=len(segment.frames),
+                                              analyze_audio=False, timeout=60)
+            delete_segment(blob_name)
+        else:
+            analysis = {"error": "Segment upload failed", "fire_detected": False, "confidence": 0}
+        plan.add_result(segment, analysis)
+        log_segment(segment, analysis, video_gcs_uri, plan)
+    return finish_progressive(plan, video_gcs_uri)
+
+def segment_blob_name(data):
+    """
+    Nombre propio de cada segmento subido: hash + sufijo aleatorio. Dos análisis
+    del mismo clip no comparten objeto, así que el borrado de uno no deja al otro
+    leyendo un segmento inexistente (un error cuenta como segmento sin fuego).
+    """
+    return f"{SEGMENT_PREFIX}/{content_hash(data)}-{uuid.uuid4().hex[:12]}.mjpeg"
+
+def upload_segment(data, blob_name):
+    """
+    Subir un segmento solo para que Vertex AI lo lea: privado (sin ACL público ni
+    URL firmada), sin previews y fuera de media_index. Retorna el gs:// o None.
+    """
+    gcs_uri = f"gs://{BUCKET_NAME}/{blob_name}"
+    try:
+        if not ensure_google_clients():
+            return None
+        # Create-only: con nombres únicos un 412 es un error, nunca un segmento ajeno
+        get_bucket().blob(blob_name).upload_from_string(data, content_type='video/x-motion-jpeg', if_generation_match=0)
+    except Exception as e:
+        print(f"[CLOUD ERROR] Segmento {blob_name}: {e}")
+        return None
+    return gcs_uri
+
+def delete_segment(blob_name):
+    """Borrar un segmento ya analizado (la regla de ciclo de vida del bucket cubre los que queden)"""
+    try:
+        get_bucket().blob(blob_name).delete()
+    except Exception as e:
+        print(f"[CLOUD] Segmento sin borrar {blob_name}: {e}")
+
+def log_segment(segment, analysis, video_gcs_uri, plan):
+    """Publicar el resultado parcial de un segmento"""
+    video_progress.update(video_gcs_uri, plan.progress())
+    print(f"[VERTEX AI] Segmento {segment.number}: frames {segment.frames[0]}-{segment.frames[-1]} "
+          f"(cada {segment.stride}) -> fuego={analysis.get('fire_detected')} ({analysis.get('confidence', 0):.1%})")
+
+def finish_progressive(plan, video_gcs_uri):
+    result = plan.result()
+    video_progress.update(video_gcs_uri, plan.progress())
+    summary = result['progressive']
+    if plan.confirmed:
+        print(f"[VERTEX AI] 🔥 Fuego confirmado en {summary['confirm_ms']} ms "
+              f"({summary['frames_analyzed']}/{summary['frames_total']} frames)")
+    return result
+
 def process_vertex_response(result):
     """Procesar respuesta de Vertex AI"""
     fire_detected = False
@@ -497,6 +926,151 @@ def process_vertex_response(result):
         'raw_response': result
     }
 
+def split_batch_analysis(analysis, count):
+    """Análisis de cada instancia de una llamada batch (sin raw_response)"""
+    predictions = (analysis.get('raw_response') or {}).get('predictions')
+    if analysis.get('error') or not predictions or len(predictions) != count:
+        shared = {k: v for k, v in analysis.items() if k != 'raw_response'}
+        return [shared] * count
+    analyses = []
+    for prediction in predictions:
+        single = process_vertex_response({"predictions": [prediction]})
+        del single['raw_response']
+        analyses.append(single)
+    return analyses
+
+# ============================================
+# RESULTADOS DE ANALISIS
+# ============================================
+def new_analysis_results():
+    """Estructura vacía de resultados de un análisis"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "photo_analysis": None,
+        "video_analysis": None,
+        "fire_detected": False,
+        "confidence": 0.0
+    }
+
+def merge_analysis(results, key, analysis):
+    """Agregar el análisis de un archivo al resultado global"""
+    results[key] = analysis
+    if analysis.get('fire_detected'):
+        results["fire_detected"] = True
+        results["confidence"] = max(results["confidence"], analysis.get('confidence', 0))
+
+def gcs_uris_of(captures, kind):
+    """{cámara: gs://...} de las capturas de un tipo que se subieron bien"""
+    return {name: media[kind][1] for name, media in captures.items() if media.get(kind, (None, None))[1]}
+
+def fire_rank(analysis):
+    return (bool(analysis.get('fire_detected')), analysis.get('confidence', 0))
+
+def combine_analyses(analyses):
+    """Un solo análisis a partir de los de varias cámaras ({cámara: análisis})"""
+    if len(analyses) == 1:
+        return next(iter(analyses.values()))
+    best = max(analyses.values(), key=fire_rank)
+    detections = sorted((d for a in analyses.values() for d in a.get('detections', [])),
+                        key=lambda d: d.get('confidence', 0), reverse=True)
+    combined = {
+        'fire_detected': any(a.get('fire_detected') for a in analyses.values()),
+        'confidence': max(a.get('confidence', 0) for a in analyses.values()),
+        'detections_count': sum(a.get('detections_count', 0) for a in analyses.values()),
+        'detections': detections[:10],
+        'raw_response': {name: a.get('raw_response') for name, a in analyses.items()}
+    }
+    if best.get('progressive'):
+        combined['progressive'] = best['progressive']
+    if all(a.get('error') for a in analyses.values()):
+        combined['error'] = best['error']
+    return combined
+
+def build_camera_results(captures, photo_batch, photo_by_camera, video_by_camera):
+    """
+    Resultado global y files_info a partir de las capturas de varias cámaras.
+    El email y el dashboard muestran la evidencia de la cámara con más
+    confianza de fuego; el veredicto de cada cámara queda en results["cameras"].
+    """
+    results = new_analysis_results()
+    if photo_batch:
+        merge_analysis(results, "photo_analysis", photo_batch)
+    if video_by_camera:
+        merge_analysis(results, "video_analysis", combine_analyses(video_by_camera))
+    
+    verdicts = {}
+    for name, media in captures.items():
+        analyses = [a for a in (photo_by_camera.get(name), video_by_camera.get(name)) if a]
+        fire = [a.get('confidence', 0) for a in analyses if a.get('fire_detected')]
+        verdicts[name] = {
+            "fire_detected": bool(fire),
+            "confidence": max(fire, default=0.0),
+            **{kind: url for kind, (url, _) in media.items() if url}
+        }
+    
+    files_info = {}
+    ranked = sorted(verdicts.values(), key=fire_rank, reverse=True)
+    for kind in ("photo", "video", "audio"):
+        url = next((v[kind] for v in ranked if v.get(kind)), None)
+        if url:
+            files_info[kind] = url
+    
+    if len(captures) > 1:
+        results["cameras"] = verdicts
+    return results, files_info
+
+if RAW_RESPONSE_STORE == 'local':
+    raw_store = RawResponseStore(LocalBlobStore(RAW_RESPONSE_DIR))
+else:
+    raw_store = RawResponseStore(GCSBlobStore(get_bucket))
+
+def save_analysis_record(results, files_info, alert_id=None, device=None):
+    """Guardar el análisis en el historial (la respuesta cruda va a raw_store)"""
+    record = AnalysisRecord.from_results(state.next_id('analyses'), results, files_info, alert_id, device)
+    
+    raw = {}
+    for key in ("photo_analysis", "video_analysis"):
+        if results.get(key) and results[key].get("raw_response") is not None:
+            raw[key] = results[key]["raw_response"]
+    if raw:
+        record.raw_key = f"{record.id}_{uuid.uuid4().hex[:12]}"
+        raw_store.put(record.raw_key, raw)
+    
+    state.append('analyses', record.id, record)
+    if record.fire_detected:
+        state.incr('fires_detected')
+    return record
+
+def find_analysis(analysis_id):
+    """Buscar un análisis del historial por id"""
+    return state.get('analyses', analysis_id)
+
+def build_result_data(results, files_info, log_tag):
+    """Armar el payload del email de RESULTADO para n8n"""
+    if results["fire_detected"]:
+        status_text = "INCENDIO CONFIRMADO"
+        status_bg_color = "#dc2626"  # Rojo
+        user_response = f"Vertex AI detectó fuego con {results['confidence']:.1%} de precisión"
+        print(f"\n{log_tag} 🔥 FUEGO DETECTADO - Precisión: {results['confidence']:.1%}")
+    else:
+        status_text = "FALSA ALARMA"
+        status_bg_color = "#22c55e"  # Verde
+        user_response = f"Vertex AI no detectó fuego (precisión: {results['confidence']:.1%})"
+        print(f"\n{log_tag} ✅ SIN FUEGO - Precisión: {results['confidence']:.1%}")
+    
+    return {
+        "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "user_confirmed": results["fire_detected"],
+        "is_false_alarm": not results["fire_detected"],
+        "status_text": status_text,
+        "status_bg_color": status_bg_color,
+        "user_response": user_response,
+        "photo_url": files_info.get("photo", ""),
+        "video_url": files_info.get("video", ""),
+        "audio_url": files_info.get("audio", ""),
+        "dashboard_url": f"{APP_URL}/dashboard"
+    }
+
 # ============================================
 # FUNCIONES EMAIL (Gmail API) Y N8N
 # ============================================
@@ -504,7 +1078,7 @@ def process_vertex_response(result):
 def send_n8n_result(result_data):
     """Enviar RESULTADO de verificación a n8n webhook (email: RESULTADO)"""
     try:
-        response = requests.post(
+        response = http_session().post(
             N8N_WEBHOOK_RESULT,
             json=result_data,
             timeout=10
@@ -541,50 +1115,132 @@ def status():
         "status": "online",
         "timestamp": datetime.now().isoformat(),
         "bucket": BUCKET_NAME,
-        "total_alertas": len(alertas),
-        "total_analysis": len(analysis_history)
+        "total_alertas": state.count('alerts'),
+        "total_analysis": state.count('analyses'),
+        "state": {**state.stats(), "pid": os.getpid()},
+        "auth": credentials_manager.stats() if credentials_manager else None,
+        "trace": trace_recorder.stats() if trace_recorder else None,
+        "previews": preview_generator.stats() if preview_generator else None,
+        "raw_store": raw_store.stats(),
+        "media": media_index.stats(),
+        "cameras": {c["name"]: c["state"] for c in cameras.health()},
+        # Solo el proceso que respondió (su parte de los límites, ver "state" -> pid)
+        "admission": {**admission.stats(), "pid": os.getpid(), "processes": WEB_WORKERS},
+        "responses": {"json_encoder": app.json.backend, "compression": compressor.stats()},
+        "startup": startup_report
     })
 
+@app.route('/_ah/warmup')
+def warmup_request():
+    """Warmup de App Engine (inbound_services: warmup en app.yaml)"""
+    return jsonify({"status": "warm", "startup": warmup()})
+
+@app.route('/api/startup-report')
+def startup_report_data():
+    """Tiempos de arranque: imports, clientes de Google, warmup y primer request"""
+    return jsonify(startup_report)
+
+# Medir el primer request atendido por la instancia
+_first_request_pending = True
+
+@app.before_request
+def _mark_first_request():
+    if _first_request_pending:
+        request.environ['startup.t0'] = time.perf_counter()
+
+@app.after_request
+def _record_first_request(response):
+    global _first_request_pending
+    t0 = request.environ.get('startup.t0')
+    if _first_request_pending and t0 is not None:
+        _first_request_pending = False
+        now = time.perf_counter()
+        startup_report["first_request"] = {
+            "path": request.path,
+            "duration_ms": round((now - t0) * 1000, 1),
+            "since_start_ms": round((now - _STARTUP_T0) * 1000, 1)
+        }
+        print(f"[STARTUP] Primer request {request.path}: {startup_report['first_request']['duration_ms']} ms")
+    return response
+
 # ============================================
 # ENDPOINTS DE ALERTAS
 # ============================================
 
+def register_alert(datos, test=False):
+    """Registrar una lectura del Arduino en el historial"""
+    alerta = {
+        "id": state.next_id('alerts'),
+        "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "temperatura": datos.get('temp', 0),
+        "luz": datos.get('light', 0),
+        "estado": datos.get('status', 'unknown'),
+        "dispositivo": datos.get('device'),
+        "zona": cameras.zone_for(datos.get('device'), datos.get('zone'))
+    }
+    if test:
+        alerta["test"] = True
+    
+    print(f"[ALERTA] {alerta['timestamp']} - Temp: {alerta['temperatura']}C, Luz: {alerta['luz']}, Estado: {alerta['estado']}")
+    
+    state.append('alerts', alerta['id'], alerta)
+    return alerta
+
+def claim_alert_slot():
+    """
+    Reservar la ventana de captura si pasó el cooldown.
+    Se marca al inicio (no al terminar) para que las alertas que llegan
+    mientras se procesa la captura no disparen capturas en paralelo.
+    Con un backend compartido la ventana es la misma para todos los procesos.
+    Retorna (permitido, segundos_restantes).
+    """
+    return state.claim_cooldown('alert_capture', ALERT_COOLDOWN_SECONDS)
+
+def release_alert_slot():
+    """Devolver la ventana de captura reservada si la alerta no se pudo procesar"""
+    state.release_cooldown('alert_capture')
+
+def client_id(headers, remote_addr):
+    """Identidad del cliente para los límites por cliente"""
+    return headers.get(CLIENT_IP_HEADER) or remote_addr or 'unknown'
+
+def pipeline_rejected(rejection, **extra):
+    """429 con Retry-After para un pipeline no admitido"""
+    print(f"[ADMISSION] Rechazado ({rejection.reason}), reintentar en {rejection.retry_after}s")
+    response = jsonify({
+        "error": "Too many requests",
+        "reason": rejection.reason,
+        "retry_after": rejection.retry_after,
+        **extra
+    })
+    response.headers['Retry-After'] = str(rejection.retry_after)
+    return response, 429
+
 @app.route('/alert', methods=['POST'])
 def recibir_alerta():
     """Recibe alertas del Arduino"""
-    global last_alert_time
-    
     try:
         datos = request.get_json() or {}
-        
-        alerta = {
-            "id": len(alertas) + 1,
-            "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            "temperatura": datos.get('temp', 0),
-            "luz": datos.get('light', 0),
-            "estado": datos.get('status', 'unknown')
-        }
-        
-        print(f"[ALERTA] {alerta['timestamp']} - Temp: {alerta['temperatura']}C, Luz: {alerta['luz']}, Estado: {alerta['estado']}")
-        
-        alertas.append(alerta)
+        alerta = register_alert(datos)
         
         # Si es una alerta real, capturar multimedia y analizar con IA
         # SOLO si ha pasado el tiempo de cooldown desde la última alerta
         if alerta['estado'] == 'alert':
-            current_time = time.time()
-            time_since_last_alert = current_time - last_alert_time
+            allowed, remaining_time = claim_alert_slot()
             
-            if time_since_last_alert >= ALERT_COOLDOWN_SECONDS:
+            if allowed:
                 print(f"[THROTTLE] Procesando alerta. Capturando evidencia...")
                 
                 # Capturar multimedia y analizar automáticamente
-                process_alert_with_capture()
+                try:
+                    with admission.enter(client_id(request.headers, request.remote_addr)):
+                        process_alert_with_capture(alerta['id'], alerta['zona'], alerta['dispositivo'])
+                except Rejected as rejection:
+                    release_alert_slot()
+                    return pipeline_rejected(rejection, alerta_id=alerta['id'])
                 
-                last_alert_time = current_time
                 print(f"[THROTTLE] Próxima captura permitida en {ALERT_COOLDOWN_SECONDS}s")
             else:
-                remaining_time = int(ALERT_COOLDOWN_SECONDS - time_since_last_alert)
                 print(f"[THROTTLE] Captura bloqueada. Espera {remaining_time}s más para evitar spam")
         
         return jsonify({"status": "received", "alerta_id": alerta['id']}), 200
@@ -596,20 +1252,17 @@ def recibir_alerta():
 @app.route('/api/test-alert', methods=['POST'])
 def test_alert():
     """Endpoint para probar alertas - Captura y analiza automáticamente"""
-    alerta = {
-        "id": len(alertas) + 1,
-        "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        "temperatura": 45.5,
-        "luz": 850,
-        "estado": "alert",
-        "test": True
-    }
-    
-    alertas.append(alerta)
+    datos = request.get_json(silent=True) or {}  # Opcional: {"zone": ...} o {"device": ...}
+    alerta = register_alert({"temp": 45.5, "light": 850, "status": "alert",
+                             "device": datos.get('device'), "zone": datos.get('zone')}, test=True)
     
     # Capturar multimedia y analizar automáticamente
     print(f"[TEST ALERT] Procesando alerta de prueba...")
-    results = process_alert_with_capture()
+    try:
+        with admission.enter(client_id(request.headers, request.remote_addr)):
+            results = process_alert_with_capture(alerta['id'], alerta['zona'], alerta['dispositivo'])
+    except Rejected as rejection:
+        return pipeline_rejected(rejection, alerta=alerta)
     
     if results:
         return jsonify({
@@ -671,11 +1324,24 @@ def send_result():
         print(f"[SEND RESULT ERROR] {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/alerts/<int:alert_id>/media')
+def alert_media(alert_id):
+    """Objetos de Cloud Storage capturados para una alerta"""
+    media = media_index.alert_media(alert_id)
+    if media is None:
+        return jsonify({"error": "No media for alert"}), 404
+    return jsonify({"alerta_id": alert_id, "media": media})
+
+@app.route('/api/cameras', methods=['GET'])
+def camera_health():
+    """Cámaras registradas con su zona y estado de salud"""
+    return jsonify({"cameras": cameras.health(), "devices": cameras.devices})
+
 @app.route('/alertas', methods=['GET'])
 def ver_alertas():
     return jsonify({
-        "total": len(alertas),
-        "alertas": alertas[-20:]
+        "total": state.count('alerts'),
+        "alertas": state.recent('alerts', 20)
     })
 
 # ============================================
@@ -706,8 +1372,7 @@ def upload_photo():
         print(f"[UPLOAD PHOTO] Read {len(file_bytes)} bytes")
         
         # Generar nombre
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        blob_name = f"photos/photo_{timestamp}.jpg"
+        blob_name = content_blob_name('photos', file_bytes, 'jpg')
         
         print(f"[UPLOAD PHOTO] Uploading to: {blob_name}")
         
@@ -757,8 +1422,7 @@ def upload_video():
         file_bytes = file.read()
         print(f"[UPLOAD VIDEO] Read {len(file_bytes)} bytes")
         
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        blob_name = f"videos/video_{timestamp}.webm"
+        blob_name = content_blob_name('videos', file_bytes, 'webm')
         
         print(f"[UPLOAD VIDEO] Uploading to: {blob_name}")
         
@@ -807,8 +1471,7 @@ def upload_audio():
         file_bytes = file.read()
         print(f"[UPLOAD AUDIO] Read {len(file_bytes)} bytes")
         
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        blob_name = f"audio/audio_{timestamp}.webm"
+        blob_name = content_blob_name('audio', file_bytes, 'webm')
         
         print(f"[UPLOAD AUDIO] Uploading to: {blob_name}")
         
@@ -846,84 +1509,8 @@ def analyze_files():
     try:
         data = request.get_json() or {}
         
-        photo_gcs = data.get('photo_gcs_uri')
-        video_gcs = data.get('video_gcs_uri')
-        audio_url = data.get('audio_url')
-        
-        results = {
-            "timestamp": datetime.now().isoformat(),
-            "photo_analysis": None,
-            "video_analysis": None,
-            "fire_detected": False,
-            "confidence": 0.0
-        }
-        
-        files_info = {}
-        
-        # Analizar foto
-        if photo_gcs:
-            print(f"[ANALYZE] Foto: {photo_gcs}")
-            photo_result = predict_image_from_gcs(photo_gcs)
-            results["photo_analysis"] = photo_result
-            files_info["photo"] = data.get('photo_url', photo_gcs)
-            
-            if photo_result.get('fire_detected'):
-                results["fire_detected"] = True
-                results["confidence"] = max(results["confidence"], photo_result.get('confidence', 0))
-        
-        # Analizar video
-        if video_gcs:
-            print(f"[ANALYZE] Video: {video_gcs}")
-            video_result = predict_video_from_gcs(video_gcs)
-            results["video_analysis"] = video_result
-            files_info["video"] = data.get('video_url', video_gcs)
-            
-            if video_result.get('fire_detected'):
-                results["fire_detected"] = True
-                results["confidence"] = max(results["confidence"], video_result.get('confidence', 0))
-        
-        if audio_url:
-            files_info["audio"] = audio_url
-        
-        # Guardar en historial
-        record = {
-            "id": len(analysis_history) + 1,
-            "timestamp": results["timestamp"],
-            "files": files_info,
-            "fire_detected": results["fire_detected"],
-            "confidence": results["confidence"],
-            "photo_analysis": results["photo_analysis"],
-            "video_analysis": results["video_analysis"]
-        }
-        analysis_history.append(record)
-        
-        # Enviar resultado de Vertex AI a n8n (send-result)
-        # Determinar status según resultado de Vertex AI
-        if results["fire_detected"]:
-            status_text = "INCENDIO CONFIRMADO"
-            status_bg_color = "#dc2626"  # Rojo
-            user_response = f"Vertex AI detectó fuego con {results['confidence']:.1%} de precisión"
-            print(f"[VERTEX AI RESULT] 🔥 FUEGO DETECTADO - Precisión: {results['confidence']:.1%}")
-        else:
-            status_text = "FALSA ALARMA"
-            status_bg_color = "#22c55e"  # Verde
-            user_response = f"Vertex AI no detectó fuego (precisión: {results['confidence']:.1%})"
-            print(f"[VERTEX AI RESULT] ✅ SIN FUEGO - Precisión: {results['confidence']:.1%}")
-        
-        # Enviar email de RESULTADO (con respuesta de Vertex AI)
-        result_data = {
-            "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            "user_confirmed": results["fire_detected"],
-            "is_false_alarm": not results["fire_detected"],
-            "status_text": status_text,
-            "status_bg_color": status_bg_color,
-            "user_response": user_response,
-            "photo_url": files_info.get("photo", ""),
-            "video_url": files_info.get("video", ""),
-            "audio_url": files_info.get("audio", ""),
-            "dashboard_url": f"{APP_URL}/dashboard"
-        }
-        send_n8n_result(result_data)
+        with admission.enter(client_id(request.headers, request.remote_addr)):
+            results = analyze_uploaded_files(data)
         
         return jsonify({
             "success": True,
@@ -932,12 +1519,46 @@ def analyze_files():
             "results": results
         }), 200
         
+    except Rejected as rejection:
+        return pipeline_rejected(rejection, success=False)
     except Exception as e:
         print(f"[ANALYZE ERROR] {e}")
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e), "success": False}), 500
 
+def analyze_uploaded_files(data):
+    """Analizar foto/video ya subidos, guardar en historial y enviar el email de resultado"""
+    photo_gcs = data.get('photo_gcs_uri')
+    video_gcs = data.get('video_gcs_uri')
+    audio_url = data.get('audio_url')
+    
+    results = new_analysis_results()
+    files_info = {}
+    
+    # Analizar foto
+    if photo_gcs:
+        print(f"[ANALYZE] Foto: {photo_gcs}")
+        merge_analysis(results, "photo_analysis", predict_image_from_gcs(photo_gcs))
+        files_info["photo"] = data.get('photo_url', photo_gcs)
+    
+    # Analizar video
+    if video_gcs:
+        print(f"[ANALYZE] Video: {video_gcs}")
+        merge_analysis(results, "video_analysis", predict_video(video_gcs))
+        files_info["video"] = data.get('video_url', video_gcs)
+    
+    if audio_url:
+        files_info["audio"] = audio_url
+    
+    # Guardar en historial
+    save_analysis_record(results, files_info)
+    
+    # Enviar email de RESULTADO (con respuesta de Vertex AI)
+    result_data = build_result_data(results, files_info, "[VERTEX AI RESULT]")
+    send_n8n_result(result_data)
+    return results
+
 # ============================================
 # API DASHBOARD
 # ============================================
@@ -945,18 +1566,94 @@ def analyze_files():
 @app.route('/api/dashboard-data')
 def dashboard_data():
     """Datos para el dashboard"""
+    alertas = state.recent('alerts', 20)
     pending = len([a for a in alertas[-10:] if a.get('estado') == 'alert'])
-    fires = sum(1 for a in analysis_history if a.get('fire_detected'))
     
     return jsonify({
-        "alertas": alertas[-20:],
-        "analysis_history": analysis_history[-20:],
-        "total_alertas": len(alertas),
-        "total_analysis": len(analysis_history),
-        "fires_detected": fires,
+        "alertas": alertas,
+        "analysis_history": with_previews([a.to_dict() for a in state.recent('analyses', 20)]),
+        "total_alertas": state.count('alerts'),
+        "total_analysis": state.count('analyses'),
+        "fires_detected": state.counter('fires_detected'),
         "pending_alerts": pending
     })
 
+@app.route('/api/video-analysis/progress')
+def video_analysis_progress():
+    """Resultados parciales de los últimos análisis progresivos de video"""
+    return jsonify({"runs": video_progress.recent()})
+
+@app.route('/api/analysis/<int:analysis_id>/raw')
+def analysis_raw(analysis_id):
+    """Respuesta cruda de Vertex AI de un análisis (se lee del almacén bajo demanda)"""
+    record = find_analysis(analysis_id)
+    if not record or not record.raw_key:
+        return jsonify({"error": "Analysis not found"}), 404
+    try:
+        raw = raw_store.get(record.raw_key)
+    except Exception as e:
+        print(f"[RAW STORE ERROR] {e}")
+        return jsonify({"error": str(e)}), 502
+    if raw is None:
+        return jsonify({"error": "Raw response not available"}), 404
+    return jsonify({"id": record.id, "timestamp": record.timestamp, **raw})
+
+# ============================================
+# EXPORTACION DE HISTORIAL (NDJSON / CSV)
+# ============================================
+
+def export_response(kind, items, timestamp_of, device_of, to_ndjson, to_csv_row, columns):
+    """
+    Respuesta en streaming del historial filtrado por ?from=&to=&device=
+    (fechas ISO, `to` excluido) en ?format=ndjson (defecto) o csv
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in export.FORMATS:
+        return jsonify({"error": f"Unsupported format: {fmt}", "formats": list(export.FORMATS)}), 400
+    try:
+        since = export.parse_time(request.args.get('from'))
+        until = export.parse_time(request.args.get('to'))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid date: {e}"}), 400
+    
+    selected = export.select(items, timestamp_of, device_of, since, until, request.args.get('device'))
+    if fmt == 'csv':
+        body = export.csv_stream(map(to_csv_row, selected), columns)
+    else:
+        body = export.ndjson_stream(map(to_ndjson, selected))
+    
+    filename = f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    return Response(body, mimetype=export.FORMATS[fmt], headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Cache-Control": "no-store"
+    })
+
+@app.route('/api/export/alerts')
+def export_alerts():
+    """Todas las lecturas del Arduino"""
+    return export_response(
+        'alerts', state.iterate('alerts'),
+        timestamp_of=lambda a: a['timestamp'],
+        device_of=lambda a: a.get('dispositivo'),
+        to_ndjson=lambda a: a,
+        to_csv_row=export.alert_row,
+        columns=export.ALERT_COLUMNS
+    )
+
+@app.route('/api/export/analyses')
+def export_analyses():
+    """Todos los veredictos de Vertex AI (sin respuestas crudas: ver raw_url)"""
+    return export_response(
+        'analyses', state.iterate('analyses'),
+        timestamp_of=lambda r: r.timestamp,
+        device_of=lambda r: r.device,
+        to_ndjson=AnalysisRecord.to_dict,
+        to_csv_row=export.analysis_row,
+        columns=export.ANALYSIS_COLUMNS
+    )
+
+startup_report["module_ready_ms"] = round((time.perf_counter() - _STARTUP_T0) * 1000, 1)
+
 # ============================================
 # MAIN
 # ============================================
@@ -0,0 +1,433 @@
+# state_store.py - Estado compartido: historial, contadores y cooldowns
+#
+# El historial de alertas y análisis, los ids y el cooldown de capturas vivían
+# en variables globales de server.py: con varios procesos (gunicorn.conf.py) o
+# varias instancias de App Engine cada uno tenía su propia copia, y el
+# dashboard y el throttling dependían de a qué proceso llegaba el request.
+# Ahora ese estado pasa por un StateStore con tres backends intercambiables
+# (STATE_BACKEND):
+#   memory -> listas en el proceso (un solo proceso; desarrollo y pruebas)
+#   sqlite -> archivo SQLite en WAL, compartido por los procesos de una instancia
+#   redis  -> Redis / Memorystore, compartido por todas las instancias
+# Todos exponen la misma interfaz. Los elementos se guardan por tipo ('alerts',
+# 'analyses') con su id; sqlite y redis los serializan en JSON con los codecs
+# que se les pasan (ver AnalysisRecord.to_state / from_state). Además hay mapas
+# clave -> valor JSON (state.map(nombre)) para datos que se consultan por clave:
+# previews, multimedia de cada alerta, progreso de los análisis de video.
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+
+PAGE_SIZE = 500  # Elementos por consulta al recorrer el historial (exportaciones)
+
+
+def _claim_disabled(seconds):
+    """Cooldown desactivado (0 s): siempre se permite, sin tocar el backend"""
+    return seconds <= 0
+
+
+class StateMap:
+    """Mapa clave (str) -> valor JSON dentro de un StateStore"""
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+
+    def set(self, key, value):
+        self.store.map_set(self.name, str(key), value)
+
+    def get(self, key):
+        return self.get_many([key]).get(str(key))
+
+    def get_many(self, keys):
+        """{clave: valor} de las claves que existen"""
+        keys = [str(key) for key in keys]
+        return self.store.map_get_many(self.name, keys) if keys else {}
+
+    def items(self):
+        """Todo el mapa como dict (para mapas chicos)"""
+        return self.store.map_items(self.name)
+
+    def delete(self, keys):
+        keys = [str(key) for key in keys]
+        if keys:
+            self.store.map_delete(self.name, keys)
+
+
+class _StateStore:
+
+    def map(self, name):
+        return StateMap(self, name)
+
+
+# ============================================
+# MEMORIA (UN PROCESO)
+# ============================================
+
+class MemoryStateStore(_StateStore):
+    """Estado en el proceso: el comportamiento de siempre, sin serializar"""
+
+    backend = 'memory'
+
+    def __init__(self, codecs=None):
+        self._maps = defaultdict(dict)
+        self._items = defaultdict(list)
+        self._by_id = defaultdict(dict)
+        self._ids = Counter()
+        self._counters = Counter()
+        self._cooldowns = {}
+        self._lock = threading.Lock()
+
+    def next_id(self, name):
+        with self._lock:
+            self._ids[name] += 1
+            return self._ids[name]
+
+    def append(self, kind, item_id, item):
+        with self._lock:
+            self._items[kind].append(item)
+            self._by_id[kind][item_id] = item
+
+    def recent(self, kind, count):
+        return self._items[kind][-count:]
+
+    def count(self, kind):
+        return len(self._items[kind])
+
+    def get(self, kind, item_id):
+        return self._by_id[kind].get(item_id)
+
+    def iterate(self, kind):
+        """
+        Todos los elementos en orden. Se recorre por índice hasta el largo
+        inicial: lo que llega durante el recorrido no entra y la lista no se copia.
+        """
+        items = self._items[kind]
+        for i in range(len(items)):
+            yield items[i]
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+            return self._counters[name]
+
+    def counter(self, name):
+        return self._counters[name]
+
+    def claim_cooldown(self, key, seconds):
+        """(permitido, segundos_restantes); si se permite, la ventana queda tomada"""
+        if _claim_disabled(seconds):
+            return True, 0
+        with self._lock:
+            now = time.time()
+            until = self._cooldowns.get(key, 0)
+            if now >= until:
+                self._cooldowns[key] = now + seconds
+                return True, 0
+            return False, int(until - now)
+
+    def release_cooldown(self, key):
+        with self._lock:
+            self._cooldowns.pop(key, None)
+
+    def map_set(self, name, key, value):
+        with self._lock:
+            self._maps[name][key] = value
+
+    def map_get_many(self, name, keys):
+        values = self._maps[name]
+        return {key: values[key] for key in keys if key in values}
+
+    def map_items(self, name):
+        with self._lock:
+            return dict(self._maps[name])
+
+    def map_delete(self, name, keys):
+        with self._lock:
+            for key in keys:
+                self._maps[name].pop(key, None)
+
+    def stats(self):
+        return {"backend": self.backend, "shared": False}
+
+
+# ============================================
+# BACKENDS SERIALIZADOS
+# ============================================
+
+class _SerializedStore(_StateStore):
+    """Base de sqlite y redis: codecs (dump, load) por tipo de elemento"""
+
+    def __init__(self, codecs=None):
+        self.codecs = dict(codecs or {})
+
+    def _dump(self, kind, item):
+        dump = self.codecs.get(kind, (None, None))[0]
+        return json.dumps(dump(item) if dump else item, ensure_ascii=False, separators=(',', ':'))
+
+    def _load(self, kind, data):
+        if data is None:
+            return None
+        load = self.codecs.get(kind, (None, None))[1]
+        value = json.loads(data)
+        return load(value) if load else value
+
+
+class SQLiteStateStore(_SerializedStore):
+    """
+    Archivo SQLite compartido por los procesos de una misma máquina/instancia.
+    WAL permite leer mientras otro proceso escribe; cada hilo usa su propia
+    conexión (y se abren de nuevo tras un fork).
+    """
+
+    backend = 'sqlite'
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS items (seq INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, "
+        "id INTEGER NOT NULL, data TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS items_kind_id ON items (kind, id)",
+        "CREATE INDEX IF NOT EXISTS items_kind_seq ON items (kind, seq)",
+        "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS cooldowns (key TEXT PRIMARY KEY, until REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS maps (name TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+        "PRIMARY KEY (name, key))",
+    )
+
+    def __init__(self, path, codecs=None, busy_timeout=30):
+        super().__init__(codecs)
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._transaction() as db:
+            for statement in self.SCHEMA:
+                db.execute(statement)
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            # isolation_level=None: las transacciones se abren explícitamente en _transaction
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                 check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _transaction(self):
+        return _Transaction(self._db())
+
+    def _incr(self, db, name, amount):
+        return db.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value RETURNING value",
+            (name, amount)
+        ).fetchone()[0]
+
+    def next_id(self, name):
+        with self._transaction() as db:
+            return self._incr(db, f"id:{name}", 1)
+
+    def append(self, kind, item_id, item):
+        data = self._dump(kind, item)
+        with self._transaction() as db:
+            db.execute("INSERT INTO items (kind, id, data) VALUES (?, ?, ?)", (kind, item_id, data))
+            self._incr(db, f"items:{kind}", 1)  # COUNT(*) recorrería el índice en cada poll
+
+    def recent(self, kind, count):
+        rows = self._db().execute(
+            "SELECT data FROM items WHERE kind = ? ORDER BY seq DESC LIMIT ?", (kind, count)
+        ).fetchall()
+        return [self._load(kind, data) for (data,) in reversed(rows)]
+
+    def count(self, kind):
+        return self.counter(f"items:{kind}")
+
+    def get(self, kind, item_id):
+        row = self._db().execute(
+            "SELECT data FROM items WHERE kind = ? AND id = ? ORDER BY seq DESC LIMIT 1", (kind, item_id)
+        ).fetchone()
+        return self._load(kind, row[0]) if row else None
+
+    def iterate(self, kind):
+        """Todos los elementos en orden, por páginas, hasta el último que existía al empezar"""
+        db = self._db()
+        (last,) = db.execute("SELECT COALESCE(MAX(seq), 0) FROM items WHERE kind = ?", (kind,)).fetchone()
+        after = 0
+        while after < last:
+            rows = db.execute(
+                "SELECT seq, data FROM items WHERE kind = ? AND seq > ? AND seq <= ? ORDER BY seq LIMIT ?",
+                (kind, after, last, PAGE_SIZE)
+            ).fetchall()
+            if not rows:
+                break
+            for seq, data in rows:
+                yield self._load(kind, data)
+            after = rows[-1][0]
+
+    def incr(self, name, amount=1):
+        with self._transaction() as db:
+            return self._incr(db, name, amount)
+
+    def counter(self, name):
+        row = self._db().execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def claim_cooldown(self, key, seconds):
+        if _claim_disabled(seconds):
+            return True, 0
+        with self._transaction() as db:
+            now = time.time()
+            row = db.execute("SELECT until FROM cooldowns WHERE key = ?", (key,)).fetchone()
+            if row and now < row[0]:
+                return False, int(row[0] - now)
+            db.execute("INSERT OR REPLACE INTO cooldowns (key, until) VALUES (?, ?)", (key, now + seconds))
+            return True, 0
+
+    def release_cooldown(self, key):
+        with self._transaction() as db:
+            db.execute("DELETE FROM cooldowns WHERE key = ?", (key,))
+
+    def map_set(self, name, key, value):
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO maps (name, key, value) VALUES (?, ?, ?)", (name, key, data))
+
+    def map_get_many(self, name, keys):
+        placeholders = ','.join('?' * len(keys))
+        rows = self._db().execute(
+            f"SELECT key, value FROM maps WHERE name = ? AND key IN ({placeholders})", (name, *keys)
+        ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def map_items(self, name):
+        rows = self._db().execute("SELECT key, value FROM maps WHERE name = ?", (name,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def map_delete(self, name, keys):
+        placeholders = ','.join('?' * len(keys))
+        with self._transaction() as db:
+            db.execute(f"DELETE FROM maps WHERE name = ? AND key IN ({placeholders})", (name, *keys))
+
+    def stats(self):
+        return {"backend": self.backend, "shared": True, "path": self.path}
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT: toma el lock de escritura al empezar (sin carreras entre procesos)"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class RedisStateStore(_SerializedStore):
+    """
+    Redis (Memorystore en GCP) compartido por todas las instancias.
+    Por tipo: una lista con los ids en orden y un hash id -> JSON.
+    """
+
+    backend = 'redis'
+
+    def __init__(self, url, codecs=None, prefix='iot:'):
+        super().__init__(codecs)
+        import redis  # Opcional: solo con STATE_BACKEND=redis
+        self.redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.host = self.redis.connection_pool.connection_kwargs.get('host')
+
+    def _key(self, *parts):
+        return self.prefix + ':'.join(parts)
+
+    def next_id(self, name):
+        return self.redis.incr(self._key('id', name))
+
+    def append(self, kind, item_id, item):
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(self._key('items', kind), item_id, self._dump(kind, item))
+        pipe.rpush(self._key('order', kind), item_id)
+        pipe.execute()
+
+    def _load_ids(self, kind, ids):
+        if not ids:
+            return []
+        return [self._load(kind, data) for data in self.redis.hmget(self._key('items', kind), ids) if data]
+
+    def recent(self, kind, count):
+        return self._load_ids(kind, self.redis.lrange(self._key('order', kind), -count, -1))
+
+    def count(self, kind):
+        return self.redis.llen(self._key('order', kind))
+
+    def get(self, kind, item_id):
+        return self._load(kind, self.redis.hget(self._key('items', kind), item_id))
+
+    def iterate(self, kind):
+        """Todos los elementos en orden, por páginas, hasta el último que existía al empezar"""
+        total = self.count(kind)
+        for start in range(0, total, PAGE_SIZE):
+            end = min(start + PAGE_SIZE, total) - 1
+            yield from self._load_ids(kind, self.redis.lrange(self._key('order', kind), start, end))
+
+    def incr(self, name, amount=1):
+        return self.redis.incrby(self._key('counter', name), amount)
+
+    def counter(self, name):
+        return int(self.redis.get(self._key('counter', name)) or 0)
+
+    def claim_cooldown(self, key, seconds):
+        if _claim_disabled(seconds):
+            return True, 0
+        # SET NX con expiración: una sola instancia gana la ventana
+        if self.redis.set(self._key('cooldown', key), 1, nx=True, px=int(seconds * 1000)):
+            return True, 0
+        remaining_ms = self.redis.pttl(self._key('cooldown', key))
+        return False, max(0, remaining_ms) // 1000
+
+    def release_cooldown(self, key):
+        self.redis.delete(self._key('cooldown', key))
+
+    def map_set(self, name, key, value):
+        self.redis.hset(self._key('map', name), key, json.dumps(value, ensure_ascii=False, separators=(',', ':')))
+
+    def map_get_many(self, name, keys):
+        values = self.redis.hmget(self._key('map', name), keys)
+        return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def map_items(self, name):
+        return {key.decode(): json.loads(value) for key, value in self.redis.hgetall(self._key('map', name)).items()}
+
+    def map_delete(self, name, keys):
+        self.redis.hdel(self._key('map', name), *keys)
+
+    def stats(self):
+        return {"backend": self.backend, "shared": True, "host": self.host}
+
+
+# ============================================
+# SELECCION DEL BACKEND
+# ============================================
+
+def create_state_store(backend='memory', codecs=None, sqlite_path=None, redis_url=None):
+    """StateStore para STATE_BACKEND ('memory', 'sqlite' o 'redis')"""
+    if backend == 'sqlite':
+        return SQLiteStateStore(sqlite_path, codecs)
+    if backend == 'redis':
+        if not redis_url:
+            raise ValueError("STATE_BACKEND=redis requiere REDIS_URL")
+        return RedisStateStore(redis_url, codecs)
+    if backend != 'memory':
+        raise ValueError(f"STATE_BACKEND desconocido: {backend}")
+    return MemoryStateStore(codecs)